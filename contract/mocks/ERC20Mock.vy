@@ -0,0 +1,62 @@
+# pragma version 0.4.3
+"""
+@title ERC20Mock
+@notice Minimal ERC20 with an open mint, for local pool deployments
+"""
+
+event Transfer:
+    sender: indexed(address)
+    receiver: indexed(address)
+    value: uint256
+
+event Approval:
+    owner: indexed(address)
+    spender: indexed(address)
+    value: uint256
+
+name: public(String[64])
+symbol: public(String[32])
+decimals: public(uint8)
+totalSupply: public(uint256)
+balanceOf: public(HashMap[address, uint256])
+allowance: public(HashMap[address, HashMap[address, uint256]])
+
+
+@deploy
+def __init__(_name: String[64], _symbol: String[32], _decimals: uint8):
+    self.name = _name
+    self.symbol = _symbol
+    self.decimals = _decimals
+
+
+@external
+def mint(_to: address, _value: uint256) -> bool:
+    self.balanceOf[_to] += _value
+    self.totalSupply += _value
+    log Transfer(sender=empty(address), receiver=_to, value=_value)
+    return True
+
+
+@external
+def transfer(_to: address, _value: uint256) -> bool:
+    self.balanceOf[msg.sender] -= _value
+    self.balanceOf[_to] += _value
+    log Transfer(sender=msg.sender, receiver=_to, value=_value)
+    return True
+
+
+@external
+def transferFrom(_from: address, _to: address, _value: uint256) -> bool:
+    if self.allowance[_from][msg.sender] != max_value(uint256):
+        self.allowance[_from][msg.sender] -= _value
+    self.balanceOf[_from] -= _value
+    self.balanceOf[_to] += _value
+    log Transfer(sender=_from, receiver=_to, value=_value)
+    return True
+
+
+@external
+def approve(_spender: address, _value: uint256) -> bool:
+    self.allowance[msg.sender][_spender] = _value
+    log Approval(owner=msg.sender, spender=_spender, value=_value)
+    return True
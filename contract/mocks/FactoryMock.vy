@@ -0,0 +1,14 @@
+# pragma version 0.4.3
+"""
+@title FactoryMock
+@notice The factory views a pool reads (admin, fee_receiver), for local pool deployments
+"""
+
+admin: public(address)
+fee_receiver: public(address)
+
+
+@deploy
+def __init__(_admin: address, _fee_receiver: address):
+    self.admin = _admin
+    self.fee_receiver = _fee_receiver
@@ -0,0 +1,106 @@
+# pragma version 0.4.3
+"""
+@title FxMath
+@notice Stand-in for the Math periphery of fxswap pools, for local deployments.
+        Stableswap invariant with A scaled by N_COINS (ANN = A_true * N_COINS * A_MULTIPLIER),
+        gamma is accepted but not used. wad_exp covers the non-positive powers the pool passes.
+"""
+
+N_COINS: constant(uint256) = 2
+A_MULTIPLIER: constant(uint256) = 10000
+PRECISION: constant(uint256) = 10**18
+# ln(2) * 10**18
+LN2: constant(uint256) = 693147180559945309
+
+
+@external
+@pure
+def newton_D(ANN: uint256, gamma: uint256, x_unsorted: uint256[N_COINS], K0_prev: uint256 = 0) -> uint256:
+    """
+    @notice Invariant D of the balances, Newton iterations from their sum
+    """
+    S: uint256 = x_unsorted[0] + x_unsorted[1]
+    if S == 0:
+        return 0
+
+    D: uint256 = S
+    for i: uint256 in range(255):
+        D_P: uint256 = D
+        for x: uint256 in x_unsorted:
+            D_P = D_P * D // (x * N_COINS)
+        D_prev: uint256 = D
+        D = (
+            (ANN * S // A_MULTIPLIER + D_P * N_COINS) * D //
+            ((ANN - A_MULTIPLIER) * D // A_MULTIPLIER + (N_COINS + 1) * D_P)
+        )
+        if D > D_prev:
+            if D - D_prev <= 1:
+                return D
+        elif D_prev - D <= 1:
+            return D
+
+    raise "D did not converge"
+
+
+@external
+@pure
+def get_y(ANN: uint256, gamma: uint256, x: uint256[N_COINS], D: uint256, i: uint256) -> uint256[2]:
+    """
+    @notice Balance i on the invariant D given the other balance, [y, 0] (no K0 for stableswap)
+    """
+    x_other: uint256 = x[1 - i]
+    c: uint256 = D * D // (x_other * N_COINS)
+    c = c * D * A_MULTIPLIER // (ANN * N_COINS)
+    b: uint256 = x_other + D * A_MULTIPLIER // ANN
+
+    y: uint256 = D
+    for _i: uint256 in range(255):
+        y_prev: uint256 = y
+        y = (y * y + c) // (2 * y + b - D)
+        if y > y_prev:
+            if y - y_prev <= 1:
+                return [y, 0]
+        elif y_prev - y <= 1:
+            return [y, 0]
+
+    raise "y did not converge"
+
+
+@external
+@pure
+def get_p(_xp: uint256[N_COINS], _D: uint256, _A_gamma: uint256[N_COINS]) -> uint256:
+    """
+    @notice Spot price dx0/dx1 of the balances _xp, 10**18 precision
+    """
+    D_r: uint256 = _D // N_COINS**N_COINS
+    for x: uint256 in _xp:
+        D_r = D_r * _D // x
+    xp0_A: uint256 = _A_gamma[0] * _xp[0] // A_MULTIPLIER
+    return PRECISION * (xp0_A + D_r * _xp[0] // _xp[1]) // (xp0_A + D_r)
+
+
+@external
+@pure
+def wad_exp(_power: int256) -> uint256:
+    """
+    @notice exp(_power / 10**18) * 10**18 for _power <= 0:
+            exp(-x) = 2**-k * exp(-r) with r < ln(2), exp(-r) by its Taylor series
+    """
+    assert _power <= 0, "wad_exp: positive power"
+    x: uint256 = convert(-_power, uint256)
+    k: uint256 = x // LN2
+    if k > 63:
+        return 0
+    r: uint256 = x - k * LN2
+
+    term: uint256 = PRECISION
+    result: uint256 = PRECISION
+    for n: uint256 in range(1, 40):
+        term = term * r // (n * PRECISION)
+        if term == 0:
+            break
+        if n % 2 == 1:
+            result -= term
+        else:
+            result += term
+    return result >> k
@@ -0,0 +1,83 @@
+# pragma version 0.4.3
+"""
+@title FxViews
+@notice Stand-in for the Views periphery of fxswap pools (get_dy, get_dx), for local deployments.
+        Mirrors the pool's _exchange without changing its state; A / gamma ramps are not handled.
+"""
+
+N_COINS: constant(uint256) = 2
+PRECISION: constant(uint256) = 10**18
+
+interface Math:
+    def get_y(ANN: uint256, gamma: uint256, x: uint256[N_COINS], D: uint256, i: uint256) -> uint256[2]: view
+
+interface Pool:
+    def MATH() -> Math: view
+    def A() -> uint256: view
+    def gamma() -> uint256: view
+    def D() -> uint256: view
+    def price_scale() -> uint256: view
+    def balances(i: uint256) -> uint256: view
+    def precisions() -> uint256[N_COINS]: view
+    def fee_calc(xp: uint256[N_COINS]) -> uint256: view
+
+
+@internal
+@view
+def _get_dy(i: uint256, j: uint256, dx: uint256, swap: Pool) -> uint256:
+    assert i != j and i < N_COINS and j < N_COINS, "coin index out of range"
+    assert dx > 0, "do not exchange 0 coins"
+
+    precisions: uint256[N_COINS] = staticcall swap.precisions()
+    price_scale: uint256 = staticcall swap.price_scale()
+    xp: uint256[N_COINS] = [staticcall swap.balances(0), staticcall swap.balances(1)]
+    xp[i] += dx
+    xp = [xp[0] * precisions[0], xp[1] * precisions[1] * price_scale // PRECISION]
+
+    y: uint256 = (staticcall (staticcall swap.MATH()).get_y(
+        staticcall swap.A(), staticcall swap.gamma(), xp, staticcall swap.D(), j))[0]
+    dy: uint256 = xp[j] - y - 1
+    xp[j] = y
+    if j > 0:
+        dy = dy * PRECISION // price_scale
+    dy //= precisions[j]
+
+    return dy - staticcall swap.fee_calc(xp) * dy // 10**10
+
+
+@external
+@view
+def get_dy(i: uint256, j: uint256, dx: uint256, swap: address) -> uint256:
+    return self._get_dy(i, j, dx, Pool(swap))
+
+
+@external
+@view
+def get_dx(i: uint256, j: uint256, dy: uint256, swap: address, n_iter: uint256) -> uint256:
+    """
+    @notice Approximate dx of coin i for dy of coin j: secant steps on get_dy, starting at the price_scale rate
+    """
+    pool: Pool = Pool(swap)
+    precisions: uint256[N_COINS] = staticcall pool.precisions()
+    price_scale: uint256 = staticcall pool.price_scale()
+    dx: uint256 = dy * precisions[j] // precisions[i]
+    if i == 0:
+        dx = dx * price_scale // PRECISION
+    else:
+        dx = dx * PRECISION // price_scale
+
+    for k: uint256 in range(32):
+        if k >= n_iter:
+            break
+        dy_k: uint256 = self._get_dy(i, j, dx, pool)
+        if dy_k == dy:
+            break
+        # dx scales with the output at the current average rate
+        dx = dx * dy // dy_k + 1
+    return dx
+
+
+@external
+@view
+def calc_token_amount(amounts: uint256[N_COINS], deposit: bool, swap: address) -> uint256:
+    raise "calc_token_amount: not supported by the local stand-in"
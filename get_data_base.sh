@@ -1,12 +1,9 @@
 # first source load environment variables
 source .env_base
 
-python scripts/get_historical_data.py --index 10
-python scripts/get_historical_data.py --index 11
-python scripts/get_historical_data.py --index 9
-python scripts/get_historical_data.py --index 5
-python scripts/get_historical_data.py --index 4
-python scripts/get_historical_data.py --index 3
-python scripts/get_historical_data.py --index 2
-python scripts/get_historical_data.py --index 1
-python scripts/get_historical_data.py --index 0
\ No newline at end of file
+# all base pools in one pass, one multicall per block for every pool
+# backfill from the head: pools without cached blocks are fetched back to their first supply, cached pools
+# stop after a run of fully cached blocks (--sync skips pools that have no cached blocks yet)
+python scripts/get_historical_data.py --chain base --mode batch --skip-refine
+# forward sync from the newest cached block to the head, plus the holes inside the cached range
+python scripts/get_historical_data.py --chain base --mode batch --sync
@@ -1,24 +1,5 @@
 # first source load environment variables
 source .env_base
 
-# then plot data
-python scripts/plot_refule.py --index=0
-python scripts/plot_refule.py --index=1
-python scripts/plot_refule.py --index=2
-python scripts/plot_refule.py --index=3
-python scripts/plot_refule.py --index=4
-python scripts/plot_refule.py --index=5
-python scripts/plot_refule.py --index=6
-python scripts/plot_refule.py --index=9
-python scripts/plot_refule.py --index=10
-python scripts/plot_refule.py --index=11
-python scripts/plot_supply_shares.py --index=0
-python scripts/plot_supply_shares.py --index=1
-python scripts/plot_supply_shares.py --index=2
-python scripts/plot_supply_shares.py --index=3
-python scripts/plot_supply_shares.py --index=4
-python scripts/plot_supply_shares.py --index=5
-python scripts/plot_supply_shares.py --index=6
-python scripts/plot_supply_shares.py --index=9
-python scripts/plot_supply_shares.py --index=10
-python scripts/plot_supply_shares.py --index=11
\ No newline at end of file
+# then plot data: every chart of every base pool, spread over a process pool (see scripts/plot_all.py)
+python scripts/plot_all.py --chain base
@@ -1,8 +1,5 @@
 # first source .env_ethereum
 source .env_ethereum
 
-# then plot data
-python scripts/plot_refule.py --index=8
-python scripts/plot_supply_shares.py --index=8
-python scripts/plot_refule.py --index=7
-python scripts/plot_supply_shares.py --index=7
\ No newline at end of file
+# then plot data: every chart of every ethereum pool, spread over a process pool (see scripts/plot_all.py)
+python scripts/plot_all.py --chain ethereum
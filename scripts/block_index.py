@@ -0,0 +1,149 @@
+"""
+Persistent block number -> timestamp index per chain, so samples do not need a header fetch
+just to read the block timestamp.
+
+The index stores sparse anchors (block, timestamp) taken from real headers in
+data/<chain_name>/block_index.json. On chains with a fixed block time (Base: one block every
+2 s) the timestamp of any block between two anchors is exact by interpolation, as long as the
+two anchors agree with the block time (t_hi - t_lo == (b_hi - b_lo) * block_time). If they do
+not, the segment is bisected with more header fetches until it does. Chains without a fixed
+block time (Ethereum has missed slots) fall back to fetching the header, which is then cached.
+
+    block_index = BlockIndex(chain_id, lambda block_number: w3.eth.get_block(block_number)['timestamp'])
+    block_index.ensure_range(oldest_block, newest_block)  # at most a few header fetches
+    timestamp = block_index.get_timestamp(block_number)   # interpolated, no RPC call
+    block_index.save()
+"""
+import os
+import json
+import bisect
+from pathlib import Path
+
+DATA_DIR = Path("data")
+
+CHAIN_NAMES = {
+    8453: "base",
+    1: "ethereum",
+}
+
+# Chains where every block is exactly this many seconds after the previous one
+FIXED_BLOCK_TIME = {
+    8453: 2,  # Base (OP stack)
+}
+
+# Distance of a new lower anchor below a block that no anchor brackets yet
+# (100_000 Base blocks ~ 2.3 days, so a backfill needs one header per ~2 days of history)
+ANCHOR_SPAN = 100_000
+
+
+class BlockIndex:
+    """Sparse block -> timestamp anchors of one chain, with exact interpolation on fixed block time chains"""
+
+    def __init__(self, chain_id, fetch_timestamp, data_dir=DATA_DIR):
+        """
+        chain_id: chain id (8453 Base, 1 Ethereum)
+        fetch_timestamp: callable(block_number) -> timestamp, reads a real header (only called for anchors)
+        """
+        self.chain_id = chain_id
+        self.block_time = FIXED_BLOCK_TIME.get(chain_id)
+        self.fetch_timestamp = fetch_timestamp
+        self.path = Path(data_dir) / CHAIN_NAMES.get(chain_id, str(chain_id)) / "block_index.json"
+        self.anchors = {}
+        self._sorted_blocks = []
+        self.header_fetches = 0
+        self._dirty = False
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    saved = json.load(f)
+                for block_str, timestamp in saved.get("anchors", {}).items():
+                    self.anchors[int(block_str)] = timestamp
+                self._sorted_blocks = sorted(self.anchors)
+            except (json.JSONDecodeError, IOError, ValueError) as e:
+                print(f"Error reading block index {self.path}: {e}")
+
+    def add(self, block_number, timestamp):
+        """Record a timestamp read from a real header"""
+        if block_number in self.anchors:
+            return
+        self.anchors[block_number] = timestamp
+        bisect.insort(self._sorted_blocks, block_number)
+        self._dirty = True
+
+    def _fetch_anchor(self, block_number):
+        """Fetch one header and keep it as an anchor"""
+        timestamp = self.fetch_timestamp(block_number)
+        self.header_fetches += 1
+        self.add(block_number, timestamp)
+        return timestamp
+
+    def _bracket(self, block_number):
+        """Nearest anchors (lower, upper) around a block, None where there is none"""
+        position = bisect.bisect_left(self._sorted_blocks, block_number)
+        lower = self._sorted_blocks[position - 1] if position > 0 else None
+        upper = self._sorted_blocks[position] if position < len(self._sorted_blocks) else None
+        return lower, upper
+
+    def _is_linear(self, lower, upper):
+        """True if the anchors agree with the fixed block time, so every block in between is exact"""
+        return self.anchors[upper] - self.anchors[lower] == (upper - lower) * self.block_time
+
+    def lookup(self, block_number):
+        """Timestamp of a block without any RPC call, or None if the index cannot answer it exactly"""
+        timestamp = self.anchors.get(block_number)
+        if timestamp is not None or self.block_time is None:
+            return timestamp
+        lower, upper = self._bracket(block_number)
+        if lower is None or upper is None or not self._is_linear(lower, upper):
+            return None
+        return self.anchors[lower] + (block_number - lower) * self.block_time
+
+    def get_timestamp(self, block_number):
+        """Timestamp of a block: interpolated when exact, otherwise anchors are fetched until it is"""
+        timestamp = self.lookup(block_number)
+        if timestamp is not None:
+            return timestamp
+        if self.block_time is None:
+            return self._fetch_anchor(block_number)
+
+        lower, upper = self._bracket(block_number)
+        if upper is None:
+            # Nothing newer is known: the block itself becomes the upper anchor
+            return self._fetch_anchor(block_number)
+        if lower is None:
+            self._fetch_anchor(max(0, block_number - ANCHOR_SPAN))
+        # Bisect the bracketing segment until it agrees with the block time
+        while True:
+            timestamp = self.lookup(block_number)
+            if timestamp is not None:
+                return timestamp
+            lower, upper = self._bracket(block_number)
+            if upper - lower <= 2:
+                return self._fetch_anchor(block_number)
+            self._fetch_anchor((lower + upper) // 2)
+
+    def ensure_range(self, first_block, last_block):
+        """Make sure every block in [first_block, last_block] can be answered by lookup (fixed block time chains)"""
+        if self.block_time is None:
+            return
+        for block_number in (last_block, first_block):
+            if self.lookup(block_number) is None and None in self._bracket(block_number):
+                self._fetch_anchor(block_number)
+        self.get_timestamp(last_block)
+        self.get_timestamp(first_block)
+
+    def save(self):
+        """Write the anchors to data/<chain_name>/block_index.json (temp file + rename), only when new ones were added"""
+        if not self._dirty:
+            return False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "chain_id": self.chain_id,
+                "block_time": self.block_time,
+                "anchors": {str(block_number): self.anchors[block_number] for block_number in self._sorted_blocks},
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        return True
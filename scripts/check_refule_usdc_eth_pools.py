@@ -7,6 +7,7 @@ import time
 import csv
 import sys
 from web3 import Web3
+from block_index import BlockIndex
 """
 This script is used to deploy a Curve pool using the stablepool factory contract.
 It unpacks the packed parameters from deployment data and calls the deploy_pool function.
@@ -17,6 +18,20 @@ XSCAN_API_URI = os.getenv('XSCAN_API_URI')
 XSCAN_API_KEY = os.getenv('XSCAN_API_KEY')
 RPC = os.getenv('RPC')
 
+# One Web3 connection and block index per RPC url, created on first use
+_block_indexes = {}
+
+def get_block_index(rpc_url):
+    """Persistent block -> timestamp index for the chain behind rpc_url (see block_index.py)"""
+    if rpc_url not in _block_indexes:
+        w3 = Web3(Web3.HTTPProvider(rpc_url))
+        _block_indexes[rpc_url] = BlockIndex(
+            w3.eth.chain_id,
+            lambda block_number: w3.eth.get_block(block_number)['timestamp'],
+            data_dir=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data'),
+        )
+    return _block_indexes[rpc_url]
+
 def get_block_timestamp_boa(block_number, rpc_url=None):
     """
     Get block timestamp using boa's internal chain access, with fallback to web3.
@@ -47,11 +62,12 @@ def get_block_timestamp_boa(block_number, rpc_url=None):
         except (AttributeError, KeyError):
             pass
     
-    # Fallback: use web3 to fetch block from RPC
+    # Fallback: block index (interpolated on Base, header fetch otherwise) over a shared web3 connection
     try:
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        block = w3.eth.get_block(block_number)
-        return block['timestamp']
+        block_index = get_block_index(rpc_url)
+        timestamp = block_index.get_timestamp(block_number)
+        block_index.save()
+        return timestamp
     except Exception as e:
         print(f"Warning: Could not fetch block {block_number} timestamp via web3: {e}")
         return None
@@ -0,0 +1,216 @@
+"""
+Persisted derived metrics of a pool (returns, rolling volatility, costs, moving averages),
+updated incrementally as the pool history grows.
+
+A DerivedMetrics set is computed in two stages:
+
+    rows(frame, state) -> (DataFrame, state)   per-row values (returns, deltas, rebalance flags,
+                                               costs); they only depend on the previous row,
+                                               carried over in a small JSON-able state
+    windows(rows)      -> DataFrame            rolling-window values over the row values (plus a
+                                               timestamp column), looking back at most `lookback`;
+                                               None for sets without a window stage
+
+Both are stored together, one row per block, in data/<chain_name>/<address>.derived/<name>.parquet
+(with .wal segments, see pool_store.py), and <name>.state.json records the last derived block
+and the row state. An update reads only the blocks after the last derived one, runs rows() on
+them from the saved state and windows() on them plus the stored rows of the last `lookback`
+(the window context, read from the row groups that overlap it), then appends the new rows. An
+hourly refresh therefore costs O(new samples) instead of recomputing the whole history:
+
+    update_derived(VOLATILITY_METRICS, chain_name, address)
+    metrics = load_derived(VOLATILITY_METRICS, chain_name, address)
+
+Rows are keyed by block. A set can also key a row by the first block of a time bucket and give
+it the bucket start in an "epoch" column (see pool_pyramid.py); rows() then re-emits the
+partial last bucket of the previous update and the stored row is replaced (newest segment wins).
+
+The state also records the history store's generation (pool_store.store_changes()) and a
+checkpoint of the row state every CHECKPOINT_ROWS history rows. When blocks at or before the last
+derived block were written since (a backfill, or a re-fetch of an incomplete block), the stored
+rows after the newest checkpoint before the first of them are dropped and derived again from
+there; without such a checkpoint, or when the set's version changes, the set is rebuilt.
+"""
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from pool_store import (DATA_DIR, COMPACT_AFTER_SEGMENTS, get_store_path, get_json_path, get_wal_dir, store_exists,
+                        store_changes, read_table, write_table, append_segment, compact_store, list_segments)
+from pool_history import load_pool_frame, epochs_to_timestamps
+
+# Extra window context on top of `lookback`: timestamps are local time, a DST change shifts them by an hour
+CONTEXT_MARGIN = pd.Timedelta(days=1)
+# History rows between two saved row states a rewritten history can be derived again from
+CHECKPOINT_ROWS = 4096
+
+
+class DerivedMetrics:
+    """A named set of derived columns: the getters it needs, its two stages and its window length"""
+
+    def __init__(self, name, columns, rows, windows, lookback, version=1):
+        self.name = name
+        self.columns = list(columns)
+        self.rows = rows
+        self.windows = windows
+        self.lookback = pd.Timedelta(lookback)
+        self.version = version
+
+
+def get_derived_dir(chain_name, pool_address, data_dir=DATA_DIR):
+    """Directory of the derived metrics of a pool: data/<chain_name>/<address>.derived/"""
+    return Path(data_dir) / chain_name / f"{pool_address}.derived"
+
+def _paths(metrics, chain_name, pool_address, data_dir):
+    derived_dir = get_derived_dir(chain_name, pool_address, data_dir)
+    return derived_dir / f"{metrics.name}.parquet", derived_dir / f"{metrics.name}.state.json"
+
+def _read_state(state_path):
+    if not state_path.exists():
+        return None
+    try:
+        with open(state_path, "r") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return None
+
+def _write_state(state_path, state):
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    tmp_path.replace(state_path)
+
+def _history_changes(chain_name, pool_address, data_dir, since):
+    """
+    (generation, first changed block) of the pool history, see pool_store.store_changes(). The
+    legacy JSON cache has no change log: its modification time is the generation, any change rewrites all
+    """
+    history_path = get_store_path(chain_name, pool_address, data_dir)
+    if store_exists(history_path):
+        return store_changes(history_path, since)
+    json_path = get_json_path(chain_name, pool_address, data_dir)
+    generation = json_path.stat().st_mtime_ns if json_path.exists() else 0
+    return generation, None if generation == since else 0
+
+def _truncate(store_path, last_block):
+    """Drop the stored rows after last_block: main file rewritten without them, segments merged into it"""
+    table = read_table(store_path, _stored_columns(store_path), end_block=last_block + 1)
+    write_table(store_path, table)
+    shutil.rmtree(get_wal_dir(store_path), ignore_errors=True)
+
+def _to_table(derived, epochs):
+    """Derived frame (block index) to an Arrow table: block, epoch, metric columns"""
+    data = derived.reset_index(drop=True)
+    data.insert(0, "epoch", epochs)
+    data.insert(0, "block", derived.index.to_numpy())
+    return pa.Table.from_pandas(data, preserve_index=False)
+
+def _from_table(table):
+    """Stored table back to the derived frame: block index, epoch, timestamp, metric columns"""
+    data = table.to_pandas()
+    data.insert(1, "timestamp", epochs_to_timestamps(data["epoch"].to_numpy()))
+    return data.set_index("block")
+
+def _derive(metrics, frame, state, context=None):
+    """Run both stages over new history rows; `context` holds the stored rows of the window look-back"""
+    rows, state = metrics.rows(frame, state)
+    # Bucketed sets give every row its bucket start, the others take the block's epoch
+    if "epoch" in rows.columns:
+        epochs = rows.pop("epoch").to_numpy()
+        timestamps = epochs_to_timestamps(epochs)
+    else:
+        epochs = frame["epoch"].reindex(rows.index).to_numpy()
+        timestamps = frame["timestamp"].reindex(rows.index)
+    if metrics.windows is None:
+        return rows, epochs, state
+    window_input = rows.copy()
+    window_input.insert(0, "timestamp", timestamps)
+    if context is not None and not context.empty:
+        window_input = pd.concat([context[window_input.columns], window_input])
+    windows = metrics.windows(window_input).loc[rows.index]
+    derived = pd.concat([rows, windows], axis=1)
+    return derived, epochs, state
+
+def update_derived(metrics, chain_name, pool_address, data_dir=DATA_DIR, rebuild=False):
+    """
+    Bring the stored metrics of a pool up to date with its history.
+    Returns the number of derived rows written (all of them on a rebuild).
+    """
+    store_path, state_path = _paths(metrics, chain_name, pool_address, data_dir)
+    saved = None if rebuild else _read_state(state_path)
+    if saved is not None and (saved.get("version") != metrics.version or "generation" not in saved
+                              or not store_exists(store_path)):
+        saved = None
+    generation, first_changed = _history_changes(chain_name, pool_address, data_dir,
+                                                 None if saved is None else saved["generation"])
+    if saved is not None and first_changed is not None and first_changed <= saved["last_block"]:
+        # Already derived blocks were written again: resume from the newest row state before the first of them
+        checkpoints = [checkpoint for checkpoint in saved["checkpoints"] if checkpoint["last_block"] < first_changed]
+        saved = {**checkpoints[-1], "rows": 0, "checkpoints": checkpoints} if checkpoints else None
+        if saved is not None:
+            _truncate(store_path, saved["last_block"])
+
+    rebuilding = saved is None
+    if rebuilding:
+        saved = {"last_block": -1, "state": None, "rows": 0, "checkpoints": []}
+    frame = load_pool_frame(chain_name, pool_address, columns=metrics.columns, data_dir=data_dir,
+                            start_block=None if rebuilding else saved["last_block"] + 1)
+    if frame.empty and not rebuilding:
+        return 0
+    # Stored rows the windows of the new rows can reach back to
+    context = None
+    if metrics.windows is not None and not rebuilding:
+        start_time = frame["epoch"].iloc[0] - int((metrics.lookback + CONTEXT_MARGIN).total_seconds())
+        context = _from_table(read_table(store_path, _stored_columns(store_path), start_time=start_time))
+
+    # Derive in chunks that end at the checkpoints, later chunks see the earlier ones as window context
+    state, rows, checkpoints = saved["state"], saved["rows"], list(saved["checkpoints"])
+    chunks = []
+    start = 0
+    while start < len(frame) or not chunks:
+        end = min(len(frame), start + CHECKPOINT_ROWS - rows)
+        derived, epochs, state = _derive(metrics, frame.iloc[start:end], state, context)
+        chunks.append(_to_table(derived, epochs))
+        rows += end - start
+        if rows >= CHECKPOINT_ROWS:
+            checkpoints.append({"last_block": int(frame.index[end - 1]), "state": state})
+            rows = 0
+        if metrics.windows is not None and end < len(frame):
+            context = pd.concat([context, _from_table(chunks[-1])]) if context is not None else _from_table(chunks[-1])
+            start_time = frame["epoch"].iloc[end] - int((metrics.lookback + CONTEXT_MARGIN).total_seconds())
+            context = context[context["epoch"] >= start_time]
+        start = end
+    table = pa.concat_tables(chunks)
+    # A bucketed set re-emits the partial bucket a chunk ended in as the next chunk's first row, the later row wins
+    blocks = table.column("block").to_numpy()
+    table = table.filter(pa.array(np.append(blocks[1:] != blocks[:-1], True)))
+
+    if rebuilding:
+        shutil.rmtree(get_wal_dir(store_path), ignore_errors=True)
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        write_table(store_path, table)
+    elif append_segment(store_path, table) >= COMPACT_AFTER_SEGMENTS:
+        compact_store(store_path, columns=_stored_columns(store_path))
+
+    last_block = int(frame.index[-1]) if not frame.empty else saved["last_block"]
+    _write_state(state_path, {"version": metrics.version, "generation": generation, "last_block": last_block,
+                              "state": state, "rows": rows, "checkpoints": checkpoints})
+    return table.num_rows
+
+def _stored_columns(store_path):
+    """Metric columns of a derived store (from the main file or any segment)"""
+    files = ([store_path] if store_path.exists() else []) + list_segments(store_path)
+    return [name for name in pq.read_schema(files[0]).names if name not in ("block", "epoch")]
+
+def load_derived(metrics, chain_name, pool_address, data_dir=DATA_DIR, start_time=None, end_time=None):
+    """
+    Stored metrics of a pool as a block-indexed frame (epoch, timestamp, metric columns),
+    optionally only the [start_time, end_time) window. Run update_derived() first.
+    """
+    store_path, _ = _paths(metrics, chain_name, pool_address, data_dir)
+    if not store_exists(store_path):
+        raise FileNotFoundError(f"No derived metrics '{metrics.name}' for {pool_address} on {chain_name}")
+    return _from_table(read_table(store_path, _stored_columns(store_path), start_time=start_time, end_time=end_time))
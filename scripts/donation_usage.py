@@ -0,0 +1,154 @@
+"""
+Donation share usage of a pool, vectorized over its whole history.
+
+The pool burns donation shares to rebalance. Fees inflate totalSupply but not donation_shares,
+so between two samples donation_shares should grow at the totalSupply growth rate; whatever it
+lags behind was used:
+
+    expected = prev_donation_shares * (1 + (totalSupply - prev_totalSupply) / prev_totalSupply)
+    used     = max(0, expected - donation_shares)        (0 if both growth rates agree within 1e-8)
+
+The normalized curve starts at 1.0 (all donated shares available) and is multiplied by
+(1 - used / prev_donation_shares) at every sample, never going below 0. A change of
+last_donation_release_ts (a new donation) starts a new segment: the curve restarts at 1.0 and
+the growth comparison restarts from the reset block.
+
+Every step is a NumPy array operation and the curve is a cumulative product per segment, so
+a year of 2-second blocks takes milliseconds instead of a Python loop with prev_* state:
+
+    usage = donation_usage(frame)          # frame from pool_history.load_pool_frame()
+    usage["donation_shares_normalized"], usage["donation_shares_used_delta"], usage["donation_shares_used_usd"]
+"""
+import numpy as np
+import pandas as pd
+
+# Growth rates of donation_shares and totalSupply closer than this count as equal (float noise)
+GROWTH_RATE_TOLERANCE = 1e-8
+# last_donation_release_ts values at or below this are not a release time (unset / placeholder)
+MIN_RELEASE_TS = 1000000000
+
+
+def _forward_fill(values):
+    """Last non-NaN value up to and including every position (NaN before the first)"""
+    positions = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(positions, out=positions)
+    return values[positions]  # positions before the first value point at values[0], itself NaN
+
+def _shifted(values):
+    """values moved one row down, NaN in the first row"""
+    shifted = np.empty_like(values)
+    shifted[:1] = np.nan
+    shifted[1:] = values[:-1]
+    return shifted
+
+def release_resets(release_ts):
+    """
+    (is_release, is_reset) masks for a last_donation_release_ts array (NaN where not fetched).
+    A reset is a valid release time that differs from the previous one, or a release time that
+    becomes invalid after a valid one.
+    """
+    release_ts = np.asarray(release_ts, dtype=np.float64)
+    fetched = ~np.isnan(release_ts)
+    is_release = fetched & (release_ts > MIN_RELEASE_TS)
+    # Release time in effect after every fetched row: -1 once it is invalid, NaN before the first fetch
+    state = np.where(is_release, release_ts, -1.0)
+    if not fetched.all():
+        state[~fetched] = np.nan
+        state = _forward_fill(state)
+    previous = _shifted(state)
+    is_reset = (previous > 0) & (release_ts != previous)  # also true for an invalid (or -1) release time
+    is_reset &= fetched
+    return is_release, is_reset
+
+def _previous_values(values, is_reset, complete):
+    """
+    Value each complete row compares against: the value of the previous row that updated it (a
+    complete row, or a reset row where it was fetched), or its own value if the row is a reset
+    """
+    if complete.all():
+        previous = _shifted(values)
+    else:
+        updated = complete | (is_reset & ~np.isnan(values))
+        previous = _shifted(_forward_fill(np.where(updated, values, np.nan)))[complete]
+        values = values[complete]
+        is_reset = is_reset[complete]
+    return np.where(is_reset, values, previous)
+
+def _segment_cumprod(factors, starts):
+    """Cumulative product of `factors` restarted at every index in `starts` (sorted, starting with 0)"""
+    if len(starts) > len(factors) // 64:
+        # Many short segments: one grouped pass instead of a Python loop over them
+        return pd.Series(factors).groupby(np.cumsum(np.isin(np.arange(len(factors)), starts))).cumprod().to_numpy()
+    result = np.empty_like(factors)
+    for start, end in zip(starts, np.append(starts[1:], len(factors))):
+        np.multiply.accumulate(factors[start:end], out=result[start:end])
+    return result
+
+def normalize_donation_shares(donation_shares, total_supply, is_reset, complete):
+    """
+    Normalized curve and used shares (arrays over the complete rows) of the donation shares.
+    `complete` marks the rows where the comparison is made, `is_reset` the segment starts.
+    """
+    prev_shares = _previous_values(donation_shares, is_reset, complete)
+    prev_supply = _previous_values(total_supply, is_reset, complete)
+    if complete.all():
+        shares, supply = donation_shares, total_supply
+        # A reset (or the first row) restarts the curve
+        new_segment = is_reset.copy()
+    else:
+        shares, supply = donation_shares[complete], total_supply[complete]
+        # A reset since the previous complete row restarts the curve
+        resets_so_far = np.cumsum(is_reset)[complete]
+        new_segment = resets_so_far != _shifted(resets_so_far.astype(np.float64))
+    new_segment[:1] = True
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        comparable = (prev_supply > 0) & (supply > 0) & ~np.isnan(prev_shares)
+        supply_growth = (supply - prev_supply) / prev_supply
+        expected = prev_shares * (1 + supply_growth)
+        shares_growth = np.where(prev_shares > 0, (shares - prev_shares) / prev_shares, 0)
+        used_shares = comparable & ~(np.abs(shares_growth - supply_growth) < GROWTH_RATE_TOLERANCE)
+        used = np.where(used_shares, np.maximum(0, expected - shares), 0.0)
+        step = np.maximum(1 - used / prev_shares, 0)
+
+    # Rows that continue the curve multiply it by their step (1 without usage), the others start it
+    # again at 1.0, or at their step if shares were used right at the start
+    positive_prev = prev_shares > 0
+    continues = comparable & ~new_segment & (positive_prev | ~used_shares)
+    starts_used = ~continues & used_shares & (used > 0) & positive_prev
+    factors = np.where(used_shares & (continues | starts_used), step, 1.0)
+    return _segment_cumprod(factors, np.flatnonzero(~continues)), used
+
+def donation_usage(frame):
+    """
+    Donation share usage of a pool_history frame (needs the donation_shares, totalSupply,
+    balances(0), balances(1), last_prices and last_donation_release_ts columns), one row per
+    block where all but the release time were fetched:
+    timestamp, donation_shares_normalized, donation_shares_usd, donation_shares_used_delta,
+    donation_shares_used_usd (NaN where nothing was used)
+    """
+    donation_shares = frame["donation_shares"].to_numpy()
+    total_supply = frame["totalSupply"].to_numpy()
+    balance_0 = frame["balances(0)"].to_numpy()
+    balance_1 = frame["balances(1)"].to_numpy()
+    last_price = frame["last_prices"].to_numpy()
+    _, is_reset = release_resets(frame["last_donation_release_ts"].to_numpy())
+    complete = ~(np.isnan(donation_shares) | np.isnan(total_supply) | np.isnan(balance_0)
+                 | np.isnan(balance_1) | np.isnan(last_price))
+
+    normalized, used = normalize_donation_shares(donation_shares, total_supply, is_reset, complete)
+    timestamps = frame["timestamp"].to_numpy()
+    if not complete.all():
+        timestamps, donation_shares, total_supply, balance_0, balance_1, last_price = (
+            values[complete] for values in (timestamps, donation_shares, total_supply, balance_0, balance_1, last_price))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # USD value of a share amount: its part of both balances, token1 at last_prices
+        share_ratio = donation_shares / total_supply
+        used_ratio = np.where(total_supply > 0, used / total_supply, 0)
+    return pd.DataFrame({
+        "timestamp": timestamps,
+        "donation_shares_normalized": normalized,
+        "donation_shares_usd": share_ratio * balance_0 + share_ratio * balance_1 * last_price,
+        "donation_shares_used_delta": used,
+        "donation_shares_used_usd": np.where(used > 0, used_ratio * balance_0 + used_ratio * balance_1 * last_price, np.nan),
+    })
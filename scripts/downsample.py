@@ -0,0 +1,96 @@
+"""
+Visual-fidelity downsampling of chart series before they are handed to matplotlib.
+
+The refuel charts are PIXELS_PER_DAY wide per day of history, so drawing every sample costs
+time and PNG size in proportion to the history while a pixel column can only show a few of
+them. Each series is reduced to what its pixel columns can show:
+
+    minmax  split the x range into one bucket per pixel column and keep the first, lowest,
+            highest and last sample of every bucket (at most 4 points per column). The
+            envelope and the gaps of a scatter series are unchanged.
+    lttb    Largest-Triangle-Three-Buckets: one sample per pixel column, picked so the line
+            keeps its visual shape (for line series).
+
+    rows = downsample(last_prices_df, 'timestamp', 'last_price', plot_width_pixels)
+    ax.plot(rows['timestamp'], rows['last_price'], ...)
+
+Series with no more samples than the target are returned unchanged, rows with a NaN value are
+left out (matplotlib does not draw them either). The x column must be sorted.
+"""
+import numpy as np
+
+# Buckets per pixel column of the plot area
+BUCKETS_PER_PIXEL = 1
+
+
+def _x_values(values):
+    """x values as float64 (datetimes as int64 nanoseconds)"""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype("datetime64[ns]").astype(np.int64)
+    return values.astype(np.float64)
+
+def minmax_indices(x, y, buckets):
+    """Indices of the first, min, max and last sample of each of `buckets` equal-width x buckets, sorted"""
+    n = len(x)
+    if n <= 4 * buckets:
+        return np.arange(n)
+    span = x[-1] - x[0]
+    if span <= 0:
+        bucket = np.zeros(n, dtype=np.int64)
+    else:
+        bucket = np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1)
+    # x is sorted, so a bucket is a run of consecutive samples
+    first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    last = np.r_[first[1:], n] - 1
+    # Within a run: min at the first, max at the last position of the run sorted by y
+    order = np.lexsort((y, bucket))
+    lowest = order[first]
+    highest = order[last]
+    return np.unique(np.concatenate([first, lowest, highest, last]))
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: `threshold` sample indices that keep the shape of the line"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # First and last are always kept, the n - 2 samples between are split into threshold - 2 buckets
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Third triangle point: average of the next bucket (the last sample for the final bucket)
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs((x[selected] - next_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+def downsample(frame, x_column, y_column, width_pixels, method="minmax", buckets_per_pixel=BUCKETS_PER_PIXEL):
+    """
+    Rows of frame needed to draw y_column over x_column on width_pixels pixel columns.
+    method is "minmax" (scatter series) or "lttb" (line series).
+    """
+    if frame.empty:
+        return frame
+    y = frame[y_column].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(y)
+    rows = np.flatnonzero(valid)
+    x = _x_values(frame[x_column].to_numpy())[valid]
+    buckets = max(int(width_pixels * buckets_per_pixel), 1)
+    if method == "minmax":
+        keep = minmax_indices(x, y[valid], buckets)
+    elif method == "lttb":
+        keep = lttb_indices(x, y[valid], buckets)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    if len(keep) == len(frame):
+        return frame
+    return frame.iloc[rows[keep]]
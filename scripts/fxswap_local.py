@@ -0,0 +1,292 @@
+"""
+Local titanoboa deployment of contract/fxswap.vy: no fork, no RPC, no keys.
+
+The pool's periphery is replaced by stand-ins in contract/mocks/: FxMath.vy (newton_D, get_y,
+get_p of the stableswap invariant and wad_exp, the same math as fxswap_sim.py), FxViews.vy
+(get_dy, get_dx), FactoryMock.vy (admin, fee_receiver) and ERC20Mock.vy for the coins. The
+pool is deployed from the mock factory's address, so its admin functions work as usual. By
+default (python_math=True) the Math calls are answered by the same integer math in Python, a
+precompile at the FxMath address, which halves the time of a swap under py-evm.
+
+    pool = LocalPool({'A': 40 * 10000, 'out_fee': 2 * 10**7}, initial_price=3400, decimals=(6, 18))
+    pool.add_liquidity([1_000_000, 1_000_000 / 3400])
+    pool.add_liquidity([10_000, 10_000 / 3400], donation=True)
+    with pool.scenario():                           # EVM snapshot, reverted on exit
+        pool.advance(600)
+        dy = pool.exchange(0, 50_000)
+        print(pool.state())
+
+Amounts are token units (1.0 = one USDC), parameters are contract units (see
+fxswap_sim.DEFAULT_PARAMS). The trader account holds a practically unlimited balance of
+both coins, so a trade is a single call. Scenarios nest, each `with pool.scenario()` starts
+from the state at its entry.
+
+    python scripts/fxswap_local.py --trades 500       # random trades and refuels, compared with fxswap_sim
+"""
+import random
+import argparse
+import contextlib
+import time
+import boa
+from pathlib import Path
+from functools import lru_cache
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector
+from eth.exceptions import Revert
+from boa.vm.py_evm import register_raw_precompile
+from fxswap_sim import DEFAULT_PARAMS
+
+CONTRACT_DIR = Path(__file__).parent.parent / "contract"
+MOCKS_DIR = CONTRACT_DIR / "mocks"
+# Seconds per block when advancing the chain
+BLOCK_TIME = 2
+TRADER_BALANCE = 2**200
+
+# Pool getters of state(), as floats (10**18 precision unless listed in STATE_UNITS)
+STATE_GETTERS = ['price_scale', 'price_oracle', 'last_prices', 'D', 'virtual_price', 'xcp_profit', 'totalSupply',
+                 'donation_shares', 'last_donation_release_ts', 'donation_protection_expiry_ts']
+STATE_UNITS = {'last_donation_release_ts': 1, 'donation_protection_expiry_ts': 1}
+
+
+# FxMath.vy in Python, integer for integer: runs as a precompile at the Math address (python_math=True)
+A_MULTIPLIER = 10000
+LN2 = 693147180559945309
+
+def math_newton_D(ANN, gamma, x, K0_prev=0):
+    S = x[0] + x[1]
+    if S == 0:
+        return 0
+    D = S
+    for _ in range(255):
+        D_P = D * D // (x[0] * 2) * D // (x[1] * 2)
+        D_prev = D
+        D = (ANN * S // A_MULTIPLIER + D_P * 2) * D // ((ANN - A_MULTIPLIER) * D // A_MULTIPLIER + 3 * D_P)
+        if abs(D - D_prev) <= 1:
+            return D
+    raise Revert(b"D did not converge")
+
+def math_get_y(ANN, gamma, x, D, i):
+    x_other = x[1 - i]
+    c = D * D // (x_other * 2)
+    c = c * D * A_MULTIPLIER // (ANN * 2)
+    b = x_other + D * A_MULTIPLIER // ANN
+    y = D
+    for _ in range(255):
+        y_prev = y
+        y = (y * y + c) // (2 * y + b - D)
+        if abs(y - y_prev) <= 1:
+            return [y, 0]
+    raise Revert(b"y did not converge")
+
+def math_get_p(xp, D, A_gamma):
+    D_r = D // 4 * D // xp[0] * D // xp[1]
+    xp0_A = A_gamma[0] * xp[0] // A_MULTIPLIER
+    return 10**18 * (xp0_A + D_r * xp[0] // xp[1]) // (xp0_A + D_r)
+
+def math_wad_exp(power):
+    if power > 0:
+        raise Revert(b"wad_exp: positive power")
+    x = -power
+    k = x // LN2
+    if k > 63:
+        return 0
+    r = x - k * LN2
+    term = result = 10**18
+    for n in range(1, 40):
+        term = term * r // (n * 10**18)
+        if term == 0:
+            break
+        result += -term if n % 2 else term
+    return result >> k
+
+# selector: (argument types, function, return type)
+_MATH_FUNCTIONS = {
+    function_signature_to_4byte_selector(signature): (types, function, returns)
+    for signature, types, function, returns in [
+        ("newton_D(uint256,uint256,uint256[2],uint256)", ["uint256", "uint256", "uint256[2]", "uint256"],
+         math_newton_D, "uint256"),
+        ("newton_D(uint256,uint256,uint256[2])", ["uint256", "uint256", "uint256[2]"], math_newton_D, "uint256"),
+        ("get_y(uint256,uint256,uint256[2],uint256,uint256)",
+         ["uint256", "uint256", "uint256[2]", "uint256", "uint256"], math_get_y, "uint256[2]"),
+        ("get_p(uint256[2],uint256,uint256[2])", ["uint256[2]", "uint256", "uint256[2]"], math_get_p, "uint256"),
+        ("wad_exp(int256)", ["int256"], math_wad_exp, "uint256"),
+    ]
+}
+
+def _math_precompile(computation):
+    """Math calls answered in Python instead of interpreting FxMath.vy"""
+    data = computation.msg.data_as_bytes
+    if data[:4] not in _MATH_FUNCTIONS:
+        raise Revert(b"unknown Math function")
+    types, function, returns = _MATH_FUNCTIONS[data[:4]]
+    computation.output = encode([returns], [function(*decode(types, data[4:]))])
+    return computation
+
+
+@lru_cache(maxsize=None)
+def _deployer(path):
+    """Compiled contract, once per process"""
+    return boa.load_partial(str(path))
+
+def pack_2(p1, p2):
+    """fxswap.vy _pack_2: p1 in the low, p2 in the high 128 bits"""
+    return p1 | (p2 << 128)
+
+def pack_3(x):
+    """fxswap.vy _pack_3: three 64-bit values"""
+    return (x[0] << 128) | (x[1] << 64) | x[2]
+
+
+class LocalPool:
+    """One fxswap pool with its mock periphery in the local boa environment"""
+
+    def __init__(self, params=None, initial_price=1.0, decimals=(18, 18), symbols=("USDC", "WETH"), python_math=True):
+        params = {**DEFAULT_PARAMS, **(params or {})}
+        self.params = {name: int(value) for name, value in params.items()}
+        self.decimals = decimals
+        self.admin = boa.env.generate_address("admin")
+        self.trader = boa.env.generate_address("trader")
+
+        self.math = _deployer(MOCKS_DIR / "FxMath.vy").deploy()
+        if python_math:
+            register_raw_precompile(self.math.address, _math_precompile, force=True)
+        self.views = _deployer(MOCKS_DIR / "FxViews.vy").deploy()
+        self.factory = _deployer(MOCKS_DIR / "FactoryMock.vy").deploy(self.admin, boa.env.generate_address("fees"))
+        self.coins = [_deployer(MOCKS_DIR / "ERC20Mock.vy").deploy(symbol, symbol, decimal)
+                      for symbol, decimal in zip(symbols, decimals)]
+
+        p = self.params
+        with boa.env.prank(self.factory.address):
+            self.pool = _deployer(CONTRACT_DIR / "fxswap.vy").deploy(
+                f"{symbols[0]}/{symbols[1]} local",
+                f"{symbols[0]}{symbols[1]}",
+                [coin.address for coin in self.coins],
+                self.math.address,
+                bytes(32),
+                pack_2(10**(18 - decimals[0]), 10**(18 - decimals[1])),
+                pack_2(p['gamma'], p['A']),
+                pack_3([p['mid_fee'], p['out_fee'], p['fee_gamma']]),
+                pack_3([p['allowed_extra_profit'], p['adjustment_step'], p['ma_time']]),
+                int(initial_price * 10**18),
+            )
+        with boa.env.prank(self.admin):
+            self.pool.set_periphery(self.views.address, self.math.address)
+            self.pool.set_donation_duration(p['donation_duration'])
+            self.pool.set_donation_protection_params(p['donation_protection_period'],
+                                                     p['donation_protection_lp_threshold'],
+                                                     p['donation_shares_max_ratio'])
+        for coin in self.coins:
+            coin.mint(self.trader, TRADER_BALANCE)
+            coin.approve(self.pool.address, 2**256 - 1, sender=self.trader)
+
+    def raw(self, i, amount):
+        """Token units to the coin's integer amount"""
+        return int(round(amount * 10**self.decimals[i]))
+
+    def units(self, i, raw):
+        return raw / 10**self.decimals[i]
+
+    @contextlib.contextmanager
+    def scenario(self):
+        """EVM snapshot: everything done inside the block (trades, time) is reverted on exit"""
+        with boa.env.anchor():
+            yield self
+
+    @property
+    def timestamp(self):
+        return boa.env.timestamp
+
+    def advance(self, seconds, blocks=None):
+        """Move the chain `seconds` forward (one block per BLOCK_TIME unless blocks is given)"""
+        seconds = int(seconds)
+        if seconds > 0:
+            boa.env.evm.patch.timestamp += seconds
+            boa.env.evm.patch.block_number += blocks if blocks is not None else max(seconds // BLOCK_TIME, 1)
+
+    def advance_to(self, timestamp, block=None):
+        """Move the chain to `timestamp` (and `block`, if given and ahead of the current block)"""
+        self.advance(int(timestamp) - self.timestamp)
+        if block is not None and block > boa.env.evm.patch.block_number:
+            boa.env.evm.patch.block_number = int(block)
+
+    def exchange(self, i, dx):
+        """Swap dx (token units) of coin i for the other coin, returns dy in token units"""
+        return self.units(1 - i, self.pool.exchange(i, 1 - i, self.raw(i, dx), 0, sender=self.trader))
+
+    def exchange_raw(self, i, dx):
+        """Swap an integer amount of coin i, returns the integer dy"""
+        return self.pool.exchange(i, 1 - i, dx, 0, sender=self.trader)
+
+    def add_liquidity(self, amounts, donation=False):
+        """Deposit or donate amounts (token units), returns the LP shares minted or donated (10**18)"""
+        return self.add_liquidity_raw([self.raw(0, amounts[0]), self.raw(1, amounts[1])], donation) / 10**18
+
+    def add_liquidity_raw(self, amounts, donation=False):
+        """Deposit or donate integer amounts, returns the integer LP shares"""
+        if donation:
+            return self.pool.add_liquidity(amounts, 0, "0x" + "00" * 20, True, sender=self.trader)
+        return self.pool.add_liquidity(amounts, 0, sender=self.trader)
+
+    def remove_liquidity_raw(self, lp_amount, coin=None):
+        """Burn integer LP shares of the trader, balanced or (coin given) in one coin. Returns the integer amounts"""
+        if coin is None:
+            return list(self.pool.remove_liquidity(lp_amount, [0, 0], sender=self.trader))
+        amounts = [0, 0]
+        amounts[coin] = self.pool.remove_liquidity_one_coin(lp_amount, coin, 0, sender=self.trader)
+        return amounts
+
+    def get_dy(self, i, dx):
+        return self.units(1 - i, self.pool.get_dy(i, 1 - i, self.raw(i, dx)))
+
+    def balances(self):
+        return [self.units(i, self.pool.balances(i)) for i in range(2)]
+
+    def state(self):
+        """Pool getters as floats (prices, D, supplies in natural units), plus both balances"""
+        state = {getter: getattr(self.pool, getter)() / STATE_UNITS.get(getter, 10**18) for getter in STATE_GETTERS}
+        state['balance_0'], state['balance_1'] = self.balances()
+        return state
+
+
+if __name__ == "__main__":
+    from fxswap_sim import FxswapSim
+
+    parser = argparse.ArgumentParser(description='Random trades and refuels on a local fxswap pool, compared with fxswap_sim')
+    parser.add_argument('--trades', type=int, default=200, help='Number of trades (default: 200)')
+    parser.add_argument('--price', type=float, default=3400, help='Initial price of coin1 in coin0 (default: 3400)')
+    parser.add_argument('--tvl', type=float, default=1_000_000, help='Initial pool value in coin0 (default: 1e6)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    boa.env.enable_fast_mode()
+    rng = random.Random(args.seed)
+    pool = LocalPool(initial_price=args.price, decimals=(6, 18))
+    amounts = [args.tvl / 2, args.tvl / 2 / args.price]
+    pool.add_liquidity(amounts)
+    sim = FxswapSim({}, amounts=amounts, initial_price=args.price, timestamp=pool.timestamp)
+
+    started = time.time()
+    with pool.scenario():
+        for trade in range(args.trades):
+            pool.advance(rng.randint(2, 600))
+            if trade % 50 == 0:
+                donation = [pool.balances()[0] * 0.005, pool.balances()[1] * 0.005]
+                pool.add_liquidity(donation, donation=True)
+                sim.add_liquidity(*donation, pool.timestamp, donation=True)
+            i = rng.randint(0, 1)
+            dx = rng.uniform(0.001, 0.02) * args.tvl / 2 / (args.price if i == 1 else 1)
+            pool.exchange(i, dx)
+            sim.exchange(i, dx, pool.timestamp)
+        seconds = time.time() - started
+        state = pool.state()
+    print(f"{args.trades} trades in {seconds:.2f}s ({args.trades / seconds:.0f} trades/s)")
+    print("Reverted, price_scale back at", pool.pool.price_scale() / 10**18)
+
+    print(f"{'getter':<32}{'local pool':>22}{'fxswap_sim':>22}{'rel. diff':>12}")
+    for getter, column in [('price_scale', 'price_scale'), ('price_oracle', 'price_oracle'), ('D', 'D'),
+                           ('virtual_price', 'virtual_price'), ('xcp_profit', 'xcp_profit'),
+                           ('totalSupply', 'total_supply'), ('donation_shares', 'donation_shares'),
+                           ('balance_0', 'balance_0'), ('balance_1', 'balance_1')]:
+        simulated = float(getattr(sim, column)[0])
+        diff = abs(state[getter] - simulated) / max(abs(state[getter]), 1e-18)
+        print(f"{getter:<32}{state[getter]:>22.10f}{simulated:>22.10f}{diff:>12.2e}")
@@ -0,0 +1,505 @@
+"""
+Vectorized float model of the fxswap pool (contract/fxswap.vy) for offline replay, no RPC.
+
+Every state variable is a NumPy array with one entry per pool configuration, so one replay
+of a price path runs thousands of parameter sets at once:
+
+    params = {'A': [20*10000, 40*10000, 80*10000], 'mid_fee': 5 * 10**6, 'out_fee': 2 * 10**7}
+    sim = FxswapSim(params, amounts=(1_000_000, 300), initial_price=3400, timestamp=start)
+    history = sim.replay(timestamps, prices, refuel_interval=86400, refuel_fraction=0.001)
+    history['price_scale'][-1]                                  # one column per configuration
+
+Parameters use the units of the pool getters and of create_pool.py (A with A_MULTIPLIER, fees
+in 1e10, fee_gamma / allowed_extra_profit / adjustment_step / lp threshold / max ratio in 1e18,
+ma_time / donation_duration / donation_protection_period in seconds), missing ones default to
+DEFAULT_PARAMS. Amounts are token units (1.0 = one USDC), prices are coin0 per coin1.
+
+Mirrored from the contract: newton_D / get_y / get_p (stableswap invariant of the fx Math
+periphery, A scaled by N_COINS, gamma accepted but not used by fx pools), _fee, _xcp, the
+price_oracle EMA (wad_exp), tweak_price with the donation-share burn on rebalance,
+_donation_shares with time release and protection damping, add_liquidity (donations, spam
+penalty, protection extension), _exchange and the get_dy / get_dx quotes of the views contract.
+Not modelled: uint256 rounding (float64 instead), A / gamma ramps, admin fee claims
+(remove_liquidity only) and reverts: a donation above donation_shares_max_ratio is skipped for
+its configuration instead.
+"""
+import numpy as np
+
+A_MULTIPLIER = 10000
+FEE_PRECISION = 10**10
+PRECISION = 10**18
+NOISE_FEE = 10**5 / FEE_PRECISION
+# Newton iterations of newton_D, stops earlier once every configuration converged
+MAX_ITERATIONS = 255
+CONVERGENCE = 1e-15
+# Root search of the arbitrage target in log(xp[1]): at most ARBITRAGE_STEPS steps within
+# +-ARBITRAGE_BRACKET of the current balance, until the log spot price is ARBITRAGE_TOLERANCE off
+ARBITRAGE_STEPS = 64
+ARBITRAGE_BRACKET = 8.0
+ARBITRAGE_TOLERANCE = 1e-12
+# get_dx stops once get_dy(dx) is this close to dy (relative), small trades lose digits in x - y
+DX_TOLERANCE = 1e-9
+
+# Pool parameters in contract units, defaults as deployed (create_pool.py, fxswap.vy __init__)
+DEFAULT_PARAMS = {
+    'A': 20 * A_MULTIPLIER,
+    'gamma': 10**15,
+    'mid_fee': 5 * 10**6,
+    'out_fee': 10**7,
+    'fee_gamma': 10**15,
+    'allowed_extra_profit': 10**6,
+    'adjustment_step': 10**11,
+    'ma_time': 3600,
+    'donation_duration': 7 * 86400,
+    'donation_protection_period': 60,
+    'donation_protection_lp_threshold': 50 * PRECISION // 100,
+    'donation_shares_max_ratio': 10 * PRECISION // 100,
+}
+# State columns replay() can record
+STATE_COLUMNS = ['balance_0', 'balance_1', 'D', 'price_scale', 'price_oracle', 'last_prices', 'virtual_price',
+                 'xcp_profit', 'total_supply', 'donation_shares', 'donation_protection_expiry_ts']
+
+
+def newton_D(A, gamma, x0, x1, D0=None):
+    """Invariant D of xp = (x0, x1), Newton from D0 (default x0 + x1)"""
+    ann = np.asarray(A, dtype=np.float64) / A_MULTIPLIER
+    S = x0 + x1
+    D = S if D0 is None else np.where(D0 > 0, D0, S)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(MAX_ITERATIONS):
+            D_P = D * (D / (2 * x0)) * (D / (2 * x1))
+            D_new = (ann * S + 2 * D_P) * D / ((ann - 1) * D + 3 * D_P)
+            converged = np.all(~(np.abs(D_new - D) > D * CONVERGENCE))
+            D = D_new
+            if converged:
+                break
+    return np.where(S > 0, D, 0.0)
+
+def get_y(A, gamma, x0, x1, D, i):
+    """xp[i] on the invariant D given the other balance (closed form of the quadratic)"""
+    ann = np.asarray(A, dtype=np.float64) / A_MULTIPLIER
+    x_other = np.where(i == 0, x1, x0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # y**2 + (x_other + D / ann - D) * y - D**3 / (4 * ann * x_other) = 0
+        b = x_other + D / ann - D
+        c = D * (D / (2 * x_other)) * (D / (2 * ann))
+        root = np.sqrt(b * b + 4 * c)
+        return np.where(b >= 0, 2 * c / (b + root), (root - b) / 2)
+
+def get_p(x0, x1, D, A):
+    """Spot price dx0/dx1 in xp units (multiply by price_scale for last_prices)"""
+    ann = np.asarray(A, dtype=np.float64) / A_MULTIPLIER
+    with np.errstate(divide='ignore', invalid='ignore'):
+        D_P = D * (D / (2 * x0)) * (D / (2 * x1))
+        return (ann * x0 + D_P * x0 / x1) / (ann * x0 + D_P)
+
+def fee(mid_fee, out_fee, fee_gamma, x0, x1):
+    """_fee: mid_fee for a balanced pool, out_fee when very imbalanced (fractions)"""
+    S = x0 + x1
+    B = 4 * (x0 / S) * (x1 / S)
+    B = fee_gamma * B / (fee_gamma * B + 1 - B)
+    return mid_fee * B + out_fee * (1 - B)
+
+def xcp(D, price_scale):
+    """_xcp: D / N_COINS / sqrt(price_scale)"""
+    return D / 2 / np.sqrt(price_scale)
+
+
+class FxswapSim:
+    """Pool state of many configurations, updated by the contract's operations"""
+
+    def __init__(self, params, amounts=None, initial_price=1.0, timestamp=0):
+        params = {**DEFAULT_PARAMS, **params}
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown pool parameters: {sorted(unknown)}")
+        values = np.broadcast_arrays(*[np.asarray(params[name], dtype=np.float64) for name in DEFAULT_PARAMS],
+                                     np.asarray(initial_price, dtype=np.float64))
+        self.size = max(values[0].size, 1)
+        values = [np.resize(value, self.size).astype(np.float64) for value in values]
+        self.params = dict(zip(DEFAULT_PARAMS, values[:-1]))
+
+        self.A = self.params['A']
+        self.gamma = self.params['gamma']
+        self.mid_fee = self.params['mid_fee'] / FEE_PRECISION
+        self.out_fee = self.params['out_fee'] / FEE_PRECISION
+        self.fee_gamma = self.params['fee_gamma'] / PRECISION
+        self.allowed_extra_profit = self.params['allowed_extra_profit'] / PRECISION
+        self.adjustment_step = self.params['adjustment_step'] / PRECISION
+        self.ma_time = self.params['ma_time']
+        self.donation_duration = self.params['donation_duration']
+        self.donation_protection_period = self.params['donation_protection_period']
+        self.donation_protection_lp_threshold = self.params['donation_protection_lp_threshold'] / PRECISION
+        self.donation_shares_max_ratio = self.params['donation_shares_max_ratio'] / PRECISION
+
+        zeros = np.zeros(self.size)
+        self.balance_0 = zeros.copy()
+        self.balance_1 = zeros.copy()
+        self.price_scale = values[-1].copy()
+        self.price_oracle = values[-1].copy()
+        self.last_prices = values[-1].copy()
+        self.last_timestamp = np.full(self.size, float(timestamp))
+        self.D = zeros.copy()
+        self.virtual_price = zeros.copy()
+        self.xcp_profit = zeros.copy()
+        self.xcp_profit_a = np.ones(self.size)
+        self.total_supply = zeros.copy()
+        self.donation_shares = zeros.copy()
+        self.last_donation_release_ts = zeros.copy()
+        self.donation_protection_expiry_ts = zeros.copy()
+        # Totals of this simulation
+        self.rebalances = np.zeros(self.size, dtype=np.int64)
+        self.burned_shares = zeros.copy()
+
+        if amounts is not None:
+            self.add_liquidity(amounts[0], amounts[1], timestamp)
+
+    def _vector(self, value):
+        return np.broadcast_to(np.asarray(value, dtype=np.float64), (self.size,))
+
+    def xp(self, balance_0=None, balance_1=None, price_scale=None):
+        """_xp: balances in coin0 units at price_scale"""
+        balance_0 = self.balance_0 if balance_0 is None else balance_0
+        balance_1 = self.balance_1 if balance_1 is None else balance_1
+        price_scale = self.price_scale if price_scale is None else price_scale
+        return balance_0, balance_1 * price_scale
+
+    def spot_price(self):
+        """Current spot price of coin1 in coin0 (last_prices if a trade happened now)"""
+        x0, x1 = self.xp()
+        return get_p(x0, x1, self.D, self.A) * self.price_scale
+
+    def fee(self):
+        """Current swap fee as a fraction"""
+        return fee(self.mid_fee, self.out_fee, self.fee_gamma, *self.xp())
+
+    def get_virtual_price(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return xcp(self.D, self.price_scale) / self.total_supply
+
+    def internal_price_oracle(self, timestamp):
+        """price_oracle() at timestamp: the EMA including the last trade's price"""
+        alpha = np.exp(-(timestamp - self.last_timestamp) / self.ma_time)
+        updated = (np.minimum(self.last_prices, 2 * self.price_scale) * (1 - alpha) + self.price_oracle * alpha)
+        return np.where(self.last_timestamp < timestamp, updated, self.price_oracle)
+
+    def donation_shares_available(self, timestamp, protection=True):
+        """_donation_shares: time-released donation shares, damped while the protection runs"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            elapsed = timestamp - self.last_donation_release_ts
+            unlocked = np.minimum(self.donation_shares, self.donation_shares * elapsed / self.donation_duration)
+            unlocked = np.where(self.donation_shares > 0, unlocked, 0.0)
+            if not protection:
+                return unlocked
+            protection_factor = np.where(
+                self.donation_protection_expiry_ts > timestamp,
+                np.minimum((self.donation_protection_expiry_ts - timestamp) / self.donation_protection_period, 1.0),
+                0.0)
+        return unlocked * (1 - protection_factor)
+
+    def _exchange_amounts(self, i, dx):
+        """dy, fee and the new xp of swapping dx of coin i, without changing the state"""
+        x0, x1 = self.xp(self.balance_0 + np.where(i == 0, dx, 0), self.balance_1 + np.where(i == 1, dx, 0))
+        j = 1 - i
+        y = get_y(self.A, self.gamma, x0, x1, self.D, j)
+        dy = np.where(j == 0, x0, x1) - y
+        x0 = np.where(j == 0, y, x0)
+        x1 = np.where(j == 1, y, x1)
+        dy = np.where(j == 1, dy / self.price_scale, dy)
+        swap_fee = fee(self.mid_fee, self.out_fee, self.fee_gamma, x0, x1) * dy
+        return dy - swap_fee, swap_fee
+
+    def get_dy(self, i, j, dx):
+        """Amount of coin j out for dx of coin i in, after fee"""
+        if np.any(np.asarray(i) == np.asarray(j)):
+            raise ValueError("same coin")
+        dy, _ = self._exchange_amounts(np.broadcast_to(i, (self.size,)), self._vector(dx))
+        return np.where(self._vector(dx) > 0, dy, 0.0)
+
+    def get_dx(self, i, j, dy, n_iter=64):
+        """
+        Amount of coin i in for dy of coin j out, after fee. Like the views contract: start at the
+        price_scale rate, then scale dx by dy / get_dy(dx). NaN where dy is out of reach
+        """
+        dy = self._vector(dy)
+        dx = np.where(np.broadcast_to(i, (self.size,)) == 0, dy * self.price_scale, dy / self.price_scale)
+        converged = dy <= 0
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for _ in range(n_iter):
+                ratio = dy / self.get_dy(i, j, dx)
+                converged = converged | (np.abs(ratio - 1) < DX_TOLERANCE)
+                if converged.all():
+                    break
+                dx = np.where(converged, dx, dx * ratio)
+        return np.where(dy > 0, np.where(converged, dx, np.nan), 0.0)
+
+    def exchange(self, i, dx, timestamp, active=None):
+        """
+        _exchange of dx of coin i (0 or 1, per configuration) for the other coin at timestamp.
+        Configurations with dx == 0 (or not active) are untouched. Returns (dy, fee) in coin j units.
+        """
+        i = np.broadcast_to(np.asarray(i), (self.size,))
+        dx = self._vector(dx)
+        active = dx > 0 if active is None else active & (dx > 0)
+        dx = np.where(active, dx, 0.0)
+        dy, swap_fee = self._exchange_amounts(i, dx)
+        dy = np.where(active, dy, 0.0)
+        swap_fee = np.where(active, swap_fee, 0.0)
+
+        self.balance_0 = self.balance_0 + np.where(i == 0, dx, -dy)
+        self.balance_1 = self.balance_1 + np.where(i == 1, dx, -dy)
+        x0, x1 = self.xp()
+        D = newton_D(self.A, self.gamma, x0, x1, self.D)
+        self.tweak_price(active, x0, x1, D, timestamp)
+        return dy, swap_fee
+
+    def tweak_price(self, active, x0, x1, D, timestamp):
+        """tweak_price for the active configurations: EMA, last_prices, profits, rebalance and donation burn"""
+        first = active & (self.last_timestamp < timestamp)
+        self.price_oracle = np.where(first, self.internal_price_oracle(timestamp), self.price_oracle)
+        self.last_timestamp = np.where(first, timestamp, self.last_timestamp)
+        self.last_prices = np.where(active, get_p(x0, x1, D, self.A) * self.price_scale, self.last_prices)
+
+        total_supply = self.total_supply
+        donation_shares = self.donation_shares_available(timestamp)
+        locked_supply = total_supply - donation_shares
+        current_xcp = xcp(D, self.price_scale)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            virtual_price = current_xcp / total_supply
+            vp_boosted = current_xcp / locked_supply
+        self.xcp_profit = np.where(active, self.xcp_profit + virtual_price - self.virtual_price, self.xcp_profit)
+        threshold_vp = np.maximum(1.0, (self.xcp_profit + 1) / 2)
+
+        # Rebalance once per block when the boosted vp leaves enough profit
+        price_scale = self.price_scale
+        price_oracle = self.price_oracle
+        norm = np.abs(price_oracle / price_scale - 1)
+        adjustment_step = np.maximum(self.adjustment_step, norm / 5)
+        rebalance = first & (vp_boosted > threshold_vp + self.allowed_extra_profit) & (norm > adjustment_step)
+        committed = np.zeros(self.size, dtype=bool)
+        index = np.flatnonzero(rebalance)
+        if len(index):
+            ps = price_scale[index]
+            p_new = (ps * (norm[index] - adjustment_step[index]) + adjustment_step[index] * price_oracle[index]) / norm[index]
+            new_D = newton_D(self.A[index], self.gamma[index], x0[index], x1[index] * p_new / ps)
+            new_xcp = xcp(new_D, p_new)
+            supply = total_supply[index]
+            new_vp = new_xcp / supply
+
+            # Burn donation shares to get back to the old vp, but not below threshold_vp
+            goal_vp = np.maximum(threshold_vp[index], virtual_price[index])
+            burn = np.where(new_vp < goal_vp,
+                            np.minimum(supply - new_xcp / goal_vp, donation_shares[index]), 0.0)
+            burn = np.maximum(burn, 0.0)
+            new_vp = new_xcp / (supply - burn)
+
+            commit = (new_vp > 1) & (new_vp >= threshold_vp[index])
+            index, p_new, new_D, new_vp, burn = (index[commit], p_new[commit], new_D[commit], new_vp[commit],
+                                                 burn[commit])
+            committed[index] = True
+            if len(index):
+                # Carry last_donation_release_ts forward so the available shares drop by exactly the burn,
+                # in whole seconds like the contract's uint256 timestamp
+                unlocked = self.donation_shares_available(timestamp, protection=False)[index]
+                available = donation_shares[index]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    unlocked_new = np.where(burn > 0, unlocked - burn * unlocked / available, unlocked)
+                    new_total = self.donation_shares[index] - burn
+                    new_elapsed = np.where((new_total > 0) & (unlocked_new > 0),
+                                           np.floor(unlocked_new * self.donation_duration[index] / new_total), 0.0)
+                burned = burn > 0
+                self.donation_shares[index] = new_total
+                self.total_supply = total_supply.copy()
+                self.total_supply[index] -= burn
+                self.last_donation_release_ts[index[burned]] = timestamp - new_elapsed[burned]
+                self.burned_shares[index] += burn
+                self.rebalances[index] += 1
+
+                self.D = self.D.copy()
+                self.virtual_price = self.virtual_price.copy()
+                self.price_scale = price_scale.copy()
+                self.D[index] = new_D
+                self.virtual_price[index] = new_vp
+                self.price_scale[index] = p_new
+
+        # price_scale not adjusted: keep the D and virtual price computed before the rebalance attempt
+        keep = active & ~committed
+        self.D = np.where(keep, D, self.D)
+        self.virtual_price = np.where(keep, virtual_price, self.virtual_price)
+
+    def calc_token_fee(self, amount_0, amount_1, x0, x1, timestamp):
+        """_calc_token_fee of a deposit: imbalance fee, NOISE_FEE and the spam penalty during protection"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Balance ratio before the deposit, not price_scale (the contract subtracts the amounts from
+            # balances it has already credited, here the balances are only updated after the fee)
+            balances_ratio = self.balance_0 / self.balance_1
+            a0, a1 = amount_0, amount_1 * balances_ratio
+            deposit_fee = fee(self.mid_fee, self.out_fee, self.fee_gamma, x0, x1) / 2
+            S = a0 + a1
+            Sdiff = np.abs(a0 - S / 2) + np.abs(a1 - S / 2)
+            protection_factor = np.minimum(
+                (self.donation_protection_expiry_ts - timestamp) / self.donation_protection_period, 1.0)
+            penalty = np.where(
+                self.donation_protection_expiry_ts > timestamp,
+                np.minimum(deposit_fee, protection_factor * deposit_fee * self.donation_shares / self.total_supply
+                           / self.donation_shares_max_ratio),
+                0.0)
+        return deposit_fee * Sdiff / S + NOISE_FEE + penalty
+
+    def add_liquidity(self, amount_0, amount_1, timestamp, donation=False, active=None):
+        """
+        add_liquidity (donation=True: donate to the pool, released over donation_duration).
+        Returns the LP shares minted or donated per configuration (0 where skipped).
+        """
+        amount_0, amount_1 = self._vector(amount_0), self._vector(amount_1)
+        active = (amount_0 + amount_1 > 0) & (True if active is None else active)
+        amount_0, amount_1 = np.where(active, amount_0, 0.0), np.where(active, amount_1, 0.0)
+        x0, x1 = self.xp(self.balance_0 + amount_0, self.balance_1 + amount_1)
+        old_D = self.D
+        D = newton_D(self.A, self.gamma, x0, x1, np.where(old_D > 0, old_D, 0.0))
+        supply = self.total_supply
+        initial = old_D == 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d_token = np.where(initial, xcp(D, self.price_scale), supply * D / old_D - supply)
+        if donation:
+            d_token = np.where(initial, d_token, d_token * (1 - NOISE_FEE))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                new_donation_shares = self.donation_shares + d_token
+                # The contract reverts above the cap, skip those configurations
+                active &= initial | (new_donation_shares / (supply + d_token) <= self.donation_shares_max_ratio)
+        else:
+            token_fee = self.calc_token_fee(amount_0, amount_1, x0, x1, timestamp)
+            d_token = np.where(initial, d_token, d_token * (1 - token_fee))
+        active &= d_token > 0
+        d_token = np.where(active, d_token, 0.0)
+        initial &= active
+        update = active & ~initial
+
+        self.balance_0 = np.where(active, self.balance_0 + amount_0, self.balance_0)
+        self.balance_1 = np.where(active, self.balance_1 + amount_1, self.balance_1)
+        if donation:
+            # One virtual donation of the new total, released up to the shares already unlocked
+            with np.errstate(divide='ignore', invalid='ignore'):
+                new_elapsed = np.floor(self.donation_shares_available(timestamp, protection=False)
+                                       * self.donation_duration / new_donation_shares)
+            self.last_donation_release_ts = np.where(update, timestamp - new_elapsed, self.last_donation_release_ts)
+            self.donation_shares = np.where(update, new_donation_shares, self.donation_shares)
+        else:
+            # Extend the donation protection in proportion to the deposit
+            with np.errstate(divide='ignore', invalid='ignore'):
+                relative_lp_add = d_token / (supply + d_token)
+            extend = update & (relative_lp_add > 0) & (self.donation_shares > 0)
+            period = self.donation_protection_period
+            extension = np.minimum(relative_lp_add * period / self.donation_protection_lp_threshold, period)
+            current_expiry = np.maximum(self.donation_protection_expiry_ts, timestamp)
+            self.donation_protection_expiry_ts = np.where(
+                extend, np.minimum(current_expiry + extension, timestamp + period), self.donation_protection_expiry_ts)
+        self.total_supply = supply + d_token
+
+        # (Re)instantiating an empty pool
+        self.D = np.where(initial, D, self.D)
+        self.virtual_price = np.where(initial, 1.0, self.virtual_price)
+        self.xcp_profit = np.where(initial, 1.0, self.xcp_profit)
+        self.xcp_profit_a = np.where(initial, 1.0, self.xcp_profit_a)
+        if update.any():
+            self.tweak_price(update, x0, x1, D, timestamp)
+        return d_token
+
+    def value(self, price):
+        """Pool balances in coin0 at an external price of coin1"""
+        return self.balance_0 + self.balance_1 * price
+
+    def arbitrage_amounts(self, price):
+        """
+        (i, dx) of the trade that moves the spot price to the external price, less the fee:
+        sell coin1 (i = 1) while spot > price / (1 - fee), buy coin1 (i = 0) while spot < price * (1 - fee).
+        dx is 0 where the price is inside the fee band.
+        """
+        price = self._vector(price)
+        x0, x1 = self.xp()
+        spot = get_p(x0, x1, self.D, self.A) * self.price_scale
+        swap_fee = fee(self.mid_fee, self.out_fee, self.fee_gamma, x0, x1)
+        sell = spot > price / (1 - swap_fee)
+        buy = spot < price * (1 - swap_fee)
+        i = np.where(sell, 1, 0)
+        dx = np.zeros(self.size)
+        index = np.flatnonzero(sell | buy)
+        if not len(index):
+            return i, dx
+
+        # Target spot price in xp units, then xp[1] on the current invariant: secant steps in log space,
+        # bisection of the bracket whenever a step leaves it. The spot price falls as xp[1] grows.
+        log_target = np.log(np.where(sell, price / (1 - swap_fee), price * (1 - swap_fee))[index]
+                            / self.price_scale[index])
+        A, gamma, D = self.A[index], self.gamma[index], self.D[index]
+        sold = sell[index]
+        u_previous = np.log(x1[index])
+        f_previous = np.log(spot[index] / self.price_scale[index]) - log_target
+        low = np.where(sold, u_previous, u_previous - ARBITRAGE_BRACKET)
+        high = np.where(sold, u_previous + ARBITRAGE_BRACKET, u_previous)
+        u = u_previous + np.where(sold, 1e-4, -1e-4)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for _ in range(ARBITRAGE_STEPS):
+                y1 = np.exp(u)
+                f = np.log(get_p(get_y(A, gamma, 0, y1, D, 0), y1, D, A)) - log_target
+                above = f > 0
+                low = np.where(above, np.maximum(low, u), low)
+                high = np.where(above, high, np.minimum(high, u))
+                if np.all(np.abs(f) < ARBITRAGE_TOLERANCE):
+                    break
+                u_next = u - f * (u - u_previous) / (f - f_previous)
+                outside = ~np.isfinite(u_next) | (u_next <= low) | (u_next >= high)
+                u_previous, f_previous = u, f
+                u = np.where(outside, (low + high) / 2, u_next)
+        new_x1 = np.exp(u)
+        new_x0 = get_y(A, gamma, 0, new_x1, D, 0)
+        dx[index] = np.where(sell[index], (new_x1 - x1[index]) / self.price_scale[index], new_x0 - x0[index])
+        return i, np.maximum(dx, 0.0)
+
+    def arbitrage(self, price, timestamp):
+        """Trade every configuration to the external price (within the fee). Returns (volume, fees) in coin0"""
+        price = self._vector(price)
+        i, dx = self.arbitrage_amounts(price)
+        _, swap_fee = self.exchange(i, dx, timestamp)
+        return np.where(i == 0, dx, dx * price), np.where(i == 0, swap_fee * price, swap_fee)
+
+    def refuel(self, fraction, price, timestamp):
+        """Donate `fraction` of each pool's balances. Returns the donated value in coin0 (0 where skipped)"""
+        amount_0, amount_1 = self.balance_0 * fraction, self.balance_1 * fraction
+        donated = self.add_liquidity(amount_0, amount_1, timestamp, donation=True) > 0
+        return np.where(donated, amount_0 + amount_1 * self._vector(price), 0.0)
+
+    def replay(self, timestamps, prices, record=('price_scale', 'price_oracle', 'virtual_price', 'donation_shares'),
+               refuel_interval=None, refuel_fraction=0.0):
+        """
+        Replay an external price path: at every step an arbitrageur trades the pool to the price
+        (within the fee). Every refuel_interval seconds refuel_fraction of each pool's value is donated
+        in the pool's balance ratio. Returns {column: array(steps, configurations)} of the recorded
+        state after each step, plus 'volume' and 'fees' (coin0, at the step's price) and 'refuel_cost'
+        (cumulative donated value in coin0).
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        prices = np.asarray(prices, dtype=np.float64)
+        unknown = set(record) - set(STATE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown state columns: {sorted(unknown)}")
+        steps = len(timestamps)
+        history = {column: np.empty((steps, self.size)) for column in record}
+        for column in ('volume', 'fees', 'refuel_cost'):
+            history[column] = np.empty((steps, self.size))
+        refuel_cost = np.zeros(self.size)
+        next_refuel = timestamps[0] + refuel_interval if refuel_interval else np.inf
+
+        for step in range(steps):
+            timestamp, price = timestamps[step], prices[step]
+            history['volume'][step], history['fees'][step] = self.arbitrage(price, timestamp)
+            if timestamp >= next_refuel:
+                refuel_cost += self.refuel(refuel_fraction, price, timestamp)
+                while next_refuel <= timestamp:
+                    next_refuel += refuel_interval
+            history['refuel_cost'][step] = refuel_cost
+
+            for column in record:
+                history[column][step] = getattr(self, column)
+        return history
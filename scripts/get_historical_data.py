@@ -1,18 +1,28 @@
-from web3 import Web3
-import os
+from web3 import Web3, AsyncWeb3
+import sys
 import json
 import time
+import asyncio
 from eth_utils import keccak
 from pathlib import Path
 from datetime import datetime, timezone
 import re
 import argparse
+from functools import lru_cache
+from pool_store import (FUNCTION_NAMES, COMPACT_AFTER_SEGMENTS, cache_to_table, table_to_cache, read_table,
+                        store_exists, append_segment, compact_store, compact_in_background, wait_for_compactions)
+from block_index import BlockIndex
+from rpc_pool import RpcPool, RpcError, PooledHTTPProvider, AsyncPooledHTTPProvider
+from multicall import MULTICALL3_ADDRESS, encode_aggregate3, decode_aggregate3
+from pool_pyramid import update_pyramid
 
 # Setup
-RPC = os.getenv('RPC')
-w3 = Web3(Web3.HTTPProvider(RPC))
+# Endpoints from RPC_URLS (several providers, see rpc_pool.py) or RPC
+rpc_pool = RpcPool.from_env()
+w3 = Web3(PooledHTTPProvider(rpc_pool))
 
-print(f"RPC: {RPC}")
+for endpoint in rpc_pool.endpoints:
+    print(f"RPC: {endpoint.name()} ({endpoint.bucket.rate:g} requests/s)")
 print(f"w3: {w3}")
 
 # Load fxswap_addresses from fxswaps.json if file exists, else use default.
@@ -37,9 +47,32 @@ else:
 # Parse command line arguments
 parser = argparse.ArgumentParser(description='Collect historical data for fxswap pools')
 parser.add_argument('--index', type=int, default=0, help='Index of the pool to query (default: 0)')
+parser.add_argument('--chain', type=str, default=None,
+                    help='Fetch every pool in fxswaps.json on this chain_name in one pass (one aggregate3 per block for all pools)')
+parser.add_argument('--mode', choices=['sequential', 'async', 'batch'], default='sequential',
+                    help='Fetch mode: sequential walks one block at a time, async keeps several blocks in flight, '
+                         'batch packs many blocks into one JSON-RPC batch request (default: sequential)')
+parser.add_argument('--sync', action='store_true',
+                    help='Forward sync: fetch only sample points after the newest cached block up to the head, '
+                         'plus holes in the cached range, instead of walking back from the head')
+parser.add_argument('--concurrency', type=int, default=8, help='Number of blocks in flight in async mode (default: 8)')
+parser.add_argument('--skip-refine', action='store_true',
+                    help='Skip the refinement pass that bisects each change of a REFINE_FUNCTIONS value to its exact block')
+parser.add_argument('--batch-size', type=int, default=50,
+                    help='Maximum number of blocks per JSON-RPC batch in batch mode, each block costs 2 requests (default: 50)')
 args = parser.parse_args()
 
 index = args.index
+if args.chain is not None:
+    chain_indices = [i for i, pool in sorted(fxswap_addresses.items()) if pool["chain_name"] == args.chain]
+    if not chain_indices:
+        print(f"Error: No pools found for chain_name {args.chain}")
+        print(f"Available chains: {sorted(set(pool['chain_name'] for pool in fxswap_addresses.values()))}")
+        exit(1)
+    # The first pool of the chain drives the chain setup below (chain_id, block step, thresholds)
+    index = chain_indices[0]
+else:
+    chain_indices = [index]
 if index not in fxswap_addresses:
     print(f"Error: Index {index} not found in fxswap_addresses")
     print(f"Available indices: {list(fxswap_addresses.keys())}")
@@ -65,10 +98,12 @@ print(f"Latest block {latest_block} timestamp: {timestamp} ({human_readable_time
 
 match chain_id:
     case 8453:
-        block_number = latest_block - (latest_block % 100)
+        block_step = 100
+        block_number = latest_block - (latest_block % block_step)
         min_block_threshold = 37524600  # Base chain minimum block
     case 1:
-        block_number = latest_block - (latest_block % 20)
+        block_step = 20
+        block_number = latest_block - (latest_block % block_step)
         # force to pull data at a specific block
         # block_number = 23736660
         # Ethereum: set to 0 or a reasonable minimum (e.g., deployment block)
@@ -79,6 +114,10 @@ match chain_id:
         print(f"Available chain IDs: {8453, 1}")
         sys.exit(1)
 
+# Block timestamps come from the persistent block index (interpolated on Base), see block_index.py
+block_index = BlockIndex(chain_id, lambda block_number: w3.eth.get_block(block_number)['timestamp'])
+block_index.add(latest_block, timestamp)
+
 # Configuration
 PRINT_CACHED_VALUES = False  # Set to True to print cached values
 SILENT_MODE = True
@@ -90,11 +129,10 @@ DATA_DIR.mkdir(exist_ok=True)
 fxswap_data_dir = Path("data") / chain_name
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-data_file = fxswap_data_dir / f"{fxswap_address}.json"
-
-# Global in-memory cache (loaded once at startup)
-_in_memory_cache = None
-_cache_dirty = False
+# Global in-memory caches keyed by pool address (each loaded once at startup)
+_in_memory_caches = {}
+# Blocks written since the last save, per pool address (only these go into the next segment)
+_dirty_blocks = {}
 
 # default decimals
 token0_decimals = 18
@@ -122,40 +160,85 @@ def has_EURC(name):
     return False
 
 
-def load_cache():
-    """Load cache from file (only called once at startup)"""
-    global _in_memory_cache
-    if _in_memory_cache is None:
-        if data_file.exists():
+def get_pool_decimals(pool_name):
+    """(token0_decimals, token1_decimals) derived from the pool name"""
+    decimals_0, decimals_1 = 18, 18
+    if has_USDC(pool_name):
+        decimals_0, decimals_1 = 6, 18
+    if has_EURC(pool_name):
+        decimals_1 = 6
+    return decimals_0, decimals_1
+
+def get_data_file(pool_address):
+    """Cache file of a pool: data/<chain_name>/<address>.parquet (see pool_store.py)"""
+    return fxswap_data_dir / f"{pool_address}.parquet"
+
+def load_cache(pool_address=None):
+    """
+    Load cache of a pool from file (only called once per pool at startup).
+    Falls back to the legacy JSON cache, which is then written out as Parquet on the next save.
+    """
+    if pool_address is None:
+        pool_address = fxswap_address
+    if pool_address not in _in_memory_caches:
+        pool_data_file = get_data_file(pool_address)
+        legacy_json_file = pool_data_file.with_suffix('.json')
+        _in_memory_caches[pool_address] = {}
+        if store_exists(pool_data_file):
+            try:
+                _in_memory_caches[pool_address] = table_to_cache(read_table(pool_data_file), human_readable=True)
+            except (OSError, ValueError) as e:
+                print(f"Error reading {pool_data_file}: {e}")
+        elif legacy_json_file.exists():
             try:
-                with open(data_file, 'r') as f:
-                    _in_memory_cache = json.load(f)
+                with open(legacy_json_file, 'r') as f:
+                    _in_memory_caches[pool_address] = json.load(f)
+                _dirty_blocks[pool_address] = set(_in_memory_caches[pool_address])
+                print(f"Converting legacy cache {legacy_json_file} to {pool_data_file.name} on the next save")
             except (json.JSONDecodeError, IOError):
-                _in_memory_cache = {}
-        else:
-            _in_memory_cache = {}
-    return _in_memory_cache
+                pass
+    return _in_memory_caches[pool_address]
 
-def save_cache(cache=None, force=False):
-    """Save cache to file (only when dirty or forced)"""
-    global _in_memory_cache, _cache_dirty
+def save_cache(cache=None, force=False, pool_address=None):
+    """
+    Append the blocks written since the last save as one segment (see pool_store.py).
+    The cost is O(new blocks), the history already on disk is not rewritten. Once
+    COMPACT_AFTER_SEGMENTS segments have piled up they are merged in a background thread.
+    force is kept for the existing callers: without new blocks there is nothing to append.
+    """
+    if pool_address is None:
+        pool_address = fxswap_address
     if cache is None:
-        cache = _in_memory_cache
+        cache = _in_memory_caches.get(pool_address)
     if cache is None:
         return False  # Nothing to save
     
-    # Only save if dirty or forced - this prevents saving when nothing changed
-    if force or _cache_dirty:
-        with open(data_file, 'w') as f:
-            json.dump(cache, f, indent=2)
-        _cache_dirty = False
-        return True  # Return True if we actually saved
-    return False  # Return False if nothing changed, so we didn't save
+    # Only save if dirty - this prevents saving when nothing changed
+    dirty_blocks = _dirty_blocks.pop(pool_address, None)
+    if not dirty_blocks:
+        return False  # Return False if nothing changed, so we didn't save
+    new_rows = cache_to_table({block_str: cache[block_str] for block_str in dirty_blocks if block_str in cache})
+    pool_data_file = get_data_file(pool_address)
+    if append_segment(pool_data_file, new_rows) >= COMPACT_AFTER_SEGMENTS:
+        compact_in_background(pool_data_file)
+    return True  # Return True if we actually saved
+
+def save_all_caches(force=False):
+    """Save every loaded pool cache, returns the number of segments written"""
+    return sum(save_cache(force=force, pool_address=pool_address) for pool_address in list(_in_memory_caches))
+
+def compact_all_caches():
+    """Merge the pending segments of every loaded pool into its main Parquet file"""
+    wait_for_compactions()
+    for pool_address in list(_in_memory_caches):
+        merged = compact_store(get_data_file(pool_address))
+        if merged:
+            print(f"Compacted {merged} segments into {get_data_file(pool_address)}")
 
 def get_cached_value(fxswap_address, block_number, function_name, cache=None):
     """Get value from cache if exists (uses in-memory cache)"""
     if cache is None:
-        cache = load_cache()
+        cache = load_cache(fxswap_address)
     block_str = str(block_number)
     
     if block_str in cache and isinstance(cache[block_str], dict):
@@ -169,7 +252,7 @@ def get_cached_value(fxswap_address, block_number, function_name, cache=None):
 def get_cached_entry(fxswap_address, block_number, function_name, cache=None):
     """Get full cached entry (including metadata) (uses in-memory cache)"""
     if cache is None:
-        cache = load_cache()
+        cache = load_cache(fxswap_address)
     block_str = str(block_number)
     
     if block_str in cache and isinstance(cache[block_str], dict):
@@ -180,9 +263,8 @@ def get_cached_entry(fxswap_address, block_number, function_name, cache=None):
 
 def set_cached_value(fxswap_address, block_number, function_name, value, epoch=None, human_readable=None, cache=None, save_now=False):
     """Store value in cache with epoch and human-readable date (nested by block number)"""
-    global _cache_dirty
     if cache is None:
-        cache = load_cache()
+        cache = load_cache(fxswap_address)
     block_str = str(block_number)
     
     # Initialize block_number key if it doesn't exist
@@ -195,11 +277,11 @@ def set_cached_value(fxswap_address, block_number, function_name, value, epoch=N
         'epoch': epoch,
         'human_readable': human_readable
     }
-    _cache_dirty = True
+    _dirty_blocks.setdefault(fxswap_address, set()).add(block_str)
     
     # Only save immediately if requested (for periodic saves)
     if save_now:
-        save_cache(cache, force=True)
+        save_cache(cache, force=True, pool_address=fxswap_address)
 
 def get_function_selector_any(func):
     """
@@ -226,6 +308,7 @@ def get_function_selector_any(func):
         selector = keccak(bytes(f"{func}()", 'utf-8'))[:4].hex()
         return selector, None
 
+@lru_cache(maxsize=None)
 def get_call_data(function_name):
     """
     Get the full call data (selector + encoded params) for a function
@@ -237,22 +320,28 @@ def get_call_data(function_name):
     else:
         return '0x' + selector
 
-# List of functions to query
-function_names = [
-    "last_prices",
-    "price_scale",
-    "price_oracle",
-    "donation_shares",
-    "fee",
-    "last_donation_release_ts",
-    "totalSupply",
-    "user_supply",
-    "xcp_profit",
-    "xcp_profit_a",
-    "virtual_price",
-    "balances(0)",
-    "balances(1)",
-]
+def decode_result(function_name, result_bytes, decimals=None):
+    """
+    Convert the raw uint256 return data of a pool getter to the value stored in the cache.
+    last_donation_release_ts stays an integer timestamp, balances(0) uses token0 decimals,
+    everything else uses token1 decimals. decimals defaults to the --index pool's decimals.
+    """
+    decimals_0, decimals_1 = decimals if decimals is not None else (token0_decimals, token1_decimals)
+    result_int = int.from_bytes(result_bytes, 'big')
+    if function_name == 'last_donation_release_ts':
+        return result_int
+    elif function_name == 'balances(0)':
+        return result_int / 10 ** decimals_0
+    else:
+        return result_int / 10 ** decimals_1
+
+def format_block_time(timestamp):
+    """Human-readable UTC string stored next to every cached value"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+
+# List of functions to query (one Parquet column each, see pool_store.py)
+function_names = FUNCTION_NAMES
 
 # Print selectors for all functions
 for func_name in function_names:
@@ -269,189 +358,203 @@ print(f"Loaded cache with {len(cache)} blocks")
 # Save interval: save every N blocks (constant interval)
 SAVE_INTERVAL = 100  # Save every 20 blocks processed
 
-# Counter for consecutive blocks with all functions cached
-consecutive_cached_blocks = 0
+# Maximum number of sampled blocks per run
+MAX_ITERATIONS = 3000
+
+# Number of blocks scheduled per chunk in async mode, as a multiple of --concurrency
+ASYNC_CHUNK_FACTOR = 4
+
+# Batch mode: grow the batch by this many blocks after BATCH_GROW_AFTER accepted batches in a row
+BATCH_GROW_STEP = 5
+BATCH_GROW_AFTER = 5
+# JSON-RPC error codes / message fragments that mean "batch too big or too fast", not "bad call"
+BATCH_LIMIT_ERROR_CODES = {-32005, -32600, 429}
+BATCH_LIMIT_ERROR_HINTS = ("batch", "limit", "too many", "too large", "exceeded", "capacity")
+
+# Refinement pass: when one of these values differs between two neighbouring samples,
+# bisect the interval to the exact block where it changed and take a full sample there
+REFINE_FUNCTIONS = ['last_donation_release_ts']
+# Refinement repeats while new changes turn up (several refuels inside one interval)
+MAX_REFINE_PASSES = 3
+
 # Increase threshold to allow more blocks to be processed
 # For Ethereum: 400 iterations * 20 blocks = 8000 blocks ≈ 3 days at 14s block time
 MAX_CONSECUTIVE_CACHED = 50  # Increased from 10 to allow more cached blocks before stopping
 
-# override decimals if USDC is in the name
-if has_USDC(name):
-    token0_decimals = 6
-    token1_decimals = 18
-if has_EURC(name):
-    token1_decimals = 6
+# override decimals if USDC/EURC is in the name
+token0_decimals, token1_decimals = get_pool_decimals(name)
 
 print(f"token0_decimals: {token0_decimals}")
 print(f"token1_decimals: {token1_decimals}")   
 
 
-# Loop over blocks and functions
-for i in range(3000):
-    if i == 0:
-        # On the first iteration, do not subtract, so we start at the latest block
-        pass
-    else:
-        if chain_id == 8453:
-            block_number = block_number - 100
-        else:
-            block_number = block_number - 20
-
-    if block_number < min_block_threshold:
-        print(f"\n  STOPPING: Reached minimum block threshold")
-        print(f"  Block {block_number} < min_block_threshold {min_block_threshold}")
-        print(f"  Iteration: {i+1} of {400}")
-        # Save before exiting
-        save_cache(cache, force=True)
-        break
-    if PRINT_CACHED_VALUES:
-        print(f"\nBlock {block_number}")
-
-    # Separate cached and uncached functions (using in-memory cache)
-    cached_functions = {}
-    uncached_functions = []
-    
-    for function_name in function_names:
-        cached_value = get_cached_value(fxswap_address, block_number, function_name, cache=cache)
-        if cached_value is not None:
-            cached_functions[function_name] = cached_value
+def run_sequential_backfill(block_number):
+    """Walk backwards from block_number one block at a time (original fetch mode)"""
+    # Counter for consecutive blocks with all functions cached
+    consecutive_cached_blocks = 0
+
+    # Loop over blocks and functions
+    for i in range(MAX_ITERATIONS):
+        if i == 0:
+            # On the first iteration, do not subtract, so we start at the latest block
+            pass
         else:
-            uncached_functions.append(function_name)
-    
-    # Check if all functions are cached
-    if len(uncached_functions) == 0:
-        consecutive_cached_blocks += 1
-        if consecutive_cached_blocks >= MAX_CONSECUTIVE_CACHED:
-            print("\n" + "="*80)
-            print(" " * 20 + "⚠️  STOPPING: All Functions Cached ⚠️")
-            print("="*80)
-            print(f"\n  Encountered {MAX_CONSECUTIVE_CACHED} consecutive blocks")
-            print(f"  where ALL functions were already cached!")
-            print(f"\n  Last block checked: {block_number}")
-            print(f"  Iteration: {i+1} of {400}")
-            print(f"  Blocks processed: {i+1} blocks")
-            print(f"  This indicates we've reached the end of uncached data.")
-            print(f"  All data for blocks >= {block_number} is already in cache.")
-            print("\n" + "="*80)
+            block_number = block_number - block_step
+
+        if block_number < min_block_threshold:
+            print(f"\n  STOPPING: Reached minimum block threshold")
+            print(f"  Block {block_number} < min_block_threshold {min_block_threshold}")
+            print(f"  Iteration: {i+1} of {MAX_ITERATIONS}")
+            # Save before exiting
             save_cache(cache, force=True)
             break
-        elif not SILENT_MODE or (i + 1) % 50 == 0:
-            print(f"  Block {block_number}: All functions cached ({consecutive_cached_blocks}/{MAX_CONSECUTIVE_CACHED} consecutive)")
-    else:
-        # Reset counter when we find uncached functions
-        if consecutive_cached_blocks > 0:
-            print(f"  Block {block_number}: Found {len(uncached_functions)} uncached functions, resetting cached counter")
-        consecutive_cached_blocks = 0
-    
-    # Process cached functions first (no network calls needed)
-    # Extract epoch and human_readable once per block (from first cached function)
-    cached_epoch = None
-    cached_human_readable = None
-    if cached_functions:
-        # Get epoch/time from first cached function (all should have same values for same block)
-        first_function = list(cached_functions.keys())[0]
-        cached_entry = get_cached_entry(fxswap_address, block_number, first_function, cache=cache)
-        if isinstance(cached_entry, dict):
-            cached_epoch = cached_entry.get('epoch')
-            cached_human_readable = cached_entry.get('human_readable')
-            if cached_epoch and cached_human_readable:
-                print(f"  Block {block_number}: Cached epoch: {cached_epoch}, time: {cached_human_readable}")
-    
-    for function_name, result in cached_functions.items():
         if PRINT_CACHED_VALUES:
-            print(f"\n  Function: {function_name}")
-            print(f"    Using cached value for {function_name}")
-        if PRINT_CACHED_VALUES:
-            print(f"    {function_name}: {result}")
-    
-    # Check if totalSupply is 0 (from cache)
-    total_supply = cached_functions.get('totalSupply')
-    if total_supply is not None and total_supply == 0:
-        print(f"\n  totalSupply is 0 at block {block_number}. Stopping data collection.")
-        save_cache(cache, force=True)
-        break
-    
-    # Only fetch block info if we have uncached functions
-    if uncached_functions:
-        block = w3.eth.get_block(block_number)
-        timestamp = block['timestamp']
-        dt = datetime.fromtimestamp(timestamp, timezone.utc)
-        human_readable = dt.strftime("%Y-%m-%d %H:%M:%S UTC")
-        print(f"\n  Block timestamp: {timestamp} ({human_readable})")
-        
-        # Flag to break out of outer loop if totalSupply is 0
-        should_stop = False
-        
-        # Prioritize totalSupply - fetch it first if it's not cached
-        # This allows us to stop early if totalSupply is 0
-        function_list = uncached_functions.copy()
-        if 'totalSupply' in function_list:
-            # Move totalSupply to the front
-            function_list.remove('totalSupply')
-            function_list.insert(0, 'totalSupply')
-        
-        # Use Multicall3 for batching all uncached function calls
-        # Multicall3 ABI and address
-        multicall3_abi = [{
-            "inputs": [
-                {
-                    "components": [
-                        {"internalType": "address", "name": "target", "type": "address"},
-                        {"internalType": "bool", "name": "allowFailure", "type": "bool"},
-                        {"internalType": "bytes", "name": "callData", "type": "bytes"}
-                    ],
-                    "internalType": "struct Multicall3.Call[]",
-                    "name": "calls",
-                    "type": "tuple[]"
-                }
-            ],
-            "name": "aggregate3",
-            "outputs": [
-                {
-                    "components": [
-                        {"internalType": "bool", "name": "success", "type": "bool"},
-                        {"internalType": "bytes", "name": "returnData", "type": "bytes"}
-                    ],
-                    "internalType": "struct Multicall3.Result[]",
-                    "name": "returnData",
-                    "type": "tuple[]"
-                }
-            ],
-            "stateMutability": "view",
-            "type": "function"
-        }]
-
-        MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
-
-        multicall3_contract = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=multicall3_abi)
-        calls = []
-        fn_name_and_index = []
-        for function_name in function_list:
-            call_data = get_call_data(function_name)
-            # allowFailure: True for all calls
-            calls.append({
-                "target": fxswap_address,
-                "allowFailure": True,
-                "callData": call_data
-            })
-            fn_name_and_index.append(function_name)
+            print(f"\nBlock {block_number}")
 
-        try:
-            # Call aggregate3 with the call array
-            results = multicall3_contract.functions.aggregate3(calls).call(block_identifier=block_number)
-            # Each result is a tuple (success, returnData)
-            for idx, (success, result_bytes) in enumerate(results):
-                function_name = fn_name_and_index[idx]
-                if not success:
-                    print(f"    ERROR: Call to {function_name} failed")
-                    continue
-                
+        # Separate cached and uncached functions (using in-memory cache)
+        cached_functions = {}
+        uncached_functions = []
+
+        for function_name in function_names:
+            cached_value = get_cached_value(fxswap_address, block_number, function_name, cache=cache)
+            if cached_value is not None:
+                cached_functions[function_name] = cached_value
+            else:
+                uncached_functions.append(function_name)
+
+        # Check if all functions are cached
+        if len(uncached_functions) == 0:
+            consecutive_cached_blocks += 1
+            if consecutive_cached_blocks >= MAX_CONSECUTIVE_CACHED:
+                print("\n" + "="*80)
+                print(" " * 20 + "⚠️  STOPPING: All Functions Cached ⚠️")
+                print("="*80)
+                print(f"\n  Encountered {MAX_CONSECUTIVE_CACHED} consecutive blocks")
+                print(f"  where ALL functions were already cached!")
+                print(f"\n  Last block checked: {block_number}")
+                print(f"  Iteration: {i+1} of {MAX_ITERATIONS}")
+                print(f"  Blocks processed: {i+1} blocks")
+                print(f"  This indicates we've reached the end of uncached data.")
+                print(f"  All data for blocks >= {block_number} is already in cache.")
+                print("\n" + "="*80)
+                save_cache(cache, force=True)
+                break
+            elif not SILENT_MODE or (i + 1) % 50 == 0:
+                print(f"  Block {block_number}: All functions cached ({consecutive_cached_blocks}/{MAX_CONSECUTIVE_CACHED} consecutive)")
+        else:
+            # Reset counter when we find uncached functions
+            if consecutive_cached_blocks > 0:
+                print(f"  Block {block_number}: Found {len(uncached_functions)} uncached functions, resetting cached counter")
+            consecutive_cached_blocks = 0
+
+        # Process cached functions first (no network calls needed)
+        # Extract epoch and human_readable once per block (from first cached function)
+        cached_epoch = None
+        cached_human_readable = None
+        if cached_functions:
+            # Get epoch/time from first cached function (all should have same values for same block)
+            first_function = list(cached_functions.keys())[0]
+            cached_entry = get_cached_entry(fxswap_address, block_number, first_function, cache=cache)
+            if isinstance(cached_entry, dict):
+                cached_epoch = cached_entry.get('epoch')
+                cached_human_readable = cached_entry.get('human_readable')
+                if cached_epoch and cached_human_readable:
+                    print(f"  Block {block_number}: Cached epoch: {cached_epoch}, time: {cached_human_readable}")
+
+        for function_name, result in cached_functions.items():
+            if PRINT_CACHED_VALUES:
+                print(f"\n  Function: {function_name}")
+                print(f"    Using cached value for {function_name}")
+            if PRINT_CACHED_VALUES:
+                print(f"    {function_name}: {result}")
+
+        # Check if totalSupply is 0 (from cache)
+        total_supply = cached_functions.get('totalSupply')
+        if total_supply is not None and total_supply == 0:
+            print(f"\n  totalSupply is 0 at block {block_number}. Stopping data collection.")
+            save_cache(cache, force=True)
+            break
+
+        # Only fetch block info if we have uncached functions
+        if uncached_functions:
+            timestamp = block_index.get_timestamp(block_number)
+            human_readable = format_block_time(timestamp)
+            print(f"\n  Block timestamp: {timestamp} ({human_readable})")
+
+            # Flag to break out of outer loop if totalSupply is 0
+            should_stop = False
+
+            # Prioritize totalSupply - fetch it first if it's not cached
+            # This allows us to stop early if totalSupply is 0
+            function_list = uncached_functions.copy()
+            if 'totalSupply' in function_list:
+                # Move totalSupply to the front
+                function_list.remove('totalSupply')
+                function_list.insert(0, 'totalSupply')
+
+            # Use Multicall3 for batching all uncached function calls (allowFailure: True for all calls)
+            fn_name_and_index = function_list
+
+            try:
+                # Call aggregate3 with the call array (calldata is built once per call list, see multicall.py)
+                return_data = w3.eth.call(
+                    {'to': MULTICALL3_ADDRESS, 'data': build_aggregate3_calldata([(fxswap_address, fn) for fn in function_list])},
+                    block_identifier=block_number
+                )
+                results = decode_aggregate3(return_data)
+                # Each result is a tuple (success, returnData)
+                for idx, (success, result_bytes) in enumerate(results):
+                    function_name = fn_name_and_index[idx]
+                    if not success:
+                        print(f"    ERROR: Call to {function_name} failed")
+                        continue
+
+                    if not SILENT_MODE:
+                        print(f"\n  Function: {function_name}")
+                        print(f"    Fetching new data for {function_name} (multicall3)")
+
+                    # Parse the result bytes.
+                    # All our calls are reading uint values (single return), result is always 32 bytes.
+                    result = decode_result(function_name, result_bytes)
+                    set_cached_value(
+                        fxswap_address, block_number, function_name, result,
+                        epoch=timestamp, human_readable=human_readable, cache=cache, save_now=False
+                    )
+                    if not SILENT_MODE:
+                        print(f"    {function_name}: {result}")
+                    else:
+                        print(".", end="", flush=True)
+                    # Check if totalSupply is 0 and stop if so
+                    if function_name == 'totalSupply' and result == 0:
+                        print(f"\n  totalSupply is 0 at block {block_number}. Stopping data collection.")
+                        save_cache(cache, force=True)
+                        should_stop = True
+                        break
+                if should_stop:
+                    break
+                # Save after processing uncached functions if it's time for interval save
+                # Only save if something actually changed (the pool is marked dirty if new data was written)
+                if (i + 1) % SAVE_INTERVAL == 0:
+                    if save_cache(cache, force=False):
+                        print(f"  Saved cache after processing uncached functions (iteration {i + 1}, interval: {SAVE_INTERVAL})")
+                continue  # Skip the legacy per-function loop below
+            except Exception as e:
+                print(f"    ERROR in multicall3: {e}")
+                print(f"    Falling back to single-call loop.")
+            # Process uncached functions
+            for function_name in function_list:
                 if not SILENT_MODE:
                     print(f"\n  Function: {function_name}")
-                    print(f"    Fetching new data for {function_name} (multicall3)")
-                
-                # Parse the result bytes.
-                # All our calls are reading uint values (single return), result is always 32 bytes.
+                    print(f"    Fetching new data for {function_name}")
+
+                call_data = get_call_data(function_name)
+                result_bytes = w3.eth.call(
+                    {'to': fxswap_address, 'data': call_data},
+                    block_identifier=block_number
+                )
+                if not SILENT_MODE:
+                    print(f"    web3.eth.call params: {{'to': {fxswap_address}, 'data': {call_data}}}, block_identifier: {block_number}")
+                # Convert bytes to int
                 result_int = int.from_bytes(result_bytes, 'big')
                 # For last_donation_release_ts, store as integer (timestamp)
                 # For balances(0) (USDC), divide by 10**6 (USDC has 6 decimals)
@@ -459,98 +562,542 @@ for i in range(3000):
                 if function_name == 'last_donation_release_ts':
                     result = result_int
                 elif function_name == 'balances(0)':
-                    result = result_int / 10 ** token0_decimals
+                    result = result_int / 10**6
                 else:
-                    result = result_int / 10 ** token1_decimals
-                set_cached_value(
-                    fxswap_address, block_number, function_name, result,
-                    epoch=timestamp, human_readable=human_readable, cache=cache, save_now=False
-                )
+                    result = result_int / 10**18
+                # Cache the result with epoch and human-readable date (don't save immediately)
+                set_cached_value(fxswap_address, block_number, function_name, result, 
+                                epoch=timestamp, human_readable=human_readable, cache=cache, save_now=False)
                 if not SILENT_MODE:
                     print(f"    {function_name}: {result}")
                 else:
-                    print(".", end="", flush=True)
+                    print(".")
+
                 # Check if totalSupply is 0 and stop if so
                 if function_name == 'totalSupply' and result == 0:
                     print(f"\n  totalSupply is 0 at block {block_number}. Stopping data collection.")
+                    # Save cache before breaking
                     save_cache(cache, force=True)
                     should_stop = True
                     break
-                time.sleep(0.01)
-            if should_stop:
-                break
+
             # Save after processing uncached functions if it's time for interval save
-            # Only save if something actually changed (_cache_dirty will be True if new data was written)
+            # Only save if something actually changed (the pool is marked dirty if new data was written)
             if (i + 1) % SAVE_INTERVAL == 0:
                 if save_cache(cache, force=False):
                     print(f"  Saved cache after processing uncached functions (iteration {i + 1}, interval: {SAVE_INTERVAL})")
-            continue  # Skip the legacy per-function loop below
-        except Exception as e:
-            print(f"    ERROR in multicall3: {e}")
-            print(f"    Falling back to single-call loop.")
-        # Process uncached functions
-        for function_name in function_list:
-            if not SILENT_MODE:
-                print(f"\n  Function: {function_name}")
-                print(f"    Fetching new data for {function_name}")
-            
-            call_data = get_call_data(function_name)
-            result_bytes = w3.eth.call(
-                {'to': fxswap_address, 'data': call_data},
-                block_identifier=block_number
-            )
-            if not SILENT_MODE:
-                print(f"    web3.eth.call params: {{'to': {fxswap_address}, 'data': {call_data}}}, block_identifier: {block_number}")
-            # Convert bytes to int
-            result_int = int.from_bytes(result_bytes, 'big')
-            # For last_donation_release_ts, store as integer (timestamp)
-            # For balances(0) (USDC), divide by 10**6 (USDC has 6 decimals)
-            # For other functions, divide by 10**18 (decimal values)
-            if function_name == 'last_donation_release_ts':
-                result = result_int
-            elif function_name == 'balances(0)':
-                result = result_int / 10**6
-            else:
-                result = result_int / 10**18
-            # Cache the result with epoch and human-readable date (don't save immediately)
-            set_cached_value(fxswap_address, block_number, function_name, result, 
-                            epoch=timestamp, human_readable=human_readable, cache=cache, save_now=False)
-            if not SILENT_MODE:
-                print(f"    {function_name}: {result}")
-            else:
-                print(".")
-            
-            # Check if totalSupply is 0 and stop if so
-            if function_name == 'totalSupply' and result == 0:
-                print(f"\n  totalSupply is 0 at block {block_number}. Stopping data collection.")
-                # Save cache before breaking
-                save_cache(cache, force=True)
-                should_stop = True
+
+            # Break out of outer loop if totalSupply was 0
+            if should_stop:
                 break
-            
-            time.sleep(0.01)
-        
-        # Save after processing uncached functions if it's time for interval save
-        # Only save if something actually changed (_cache_dirty will be True if new data was written)
-        if (i + 1) % SAVE_INTERVAL == 0:
+
+        # Save cache periodically (every SAVE_INTERVAL blocks) - constant interval
+        # Only save if something actually changed (the pool is marked dirty if new data was written)
+        # Note: If uncached functions were processed above, save already happened there
+        if uncached_functions and (i + 1) % SAVE_INTERVAL == 0:
+            # Already saved above after processing uncached functions
+            pass
+        elif (i + 1) % SAVE_INTERVAL == 0:
+            # No uncached functions, but check if we should save (only if something changed)
             if save_cache(cache, force=False):
-                print(f"  Saved cache after processing uncached functions (iteration {i + 1}, interval: {SAVE_INTERVAL})")
-        
-        # Break out of outer loop if totalSupply was 0
-        if should_stop:
+                print(f"  Saved cache after {i + 1} blocks processed (interval: {SAVE_INTERVAL})")
+
+
+def missing_calls(pool_address, block_number, pool_cache):
+    """(pool_address, function_name) calls not cached yet for a block, totalSupply first like the sequential mode"""
+    uncached_functions = [
+        function_name for function_name in function_names
+        if get_cached_value(pool_address, block_number, function_name, cache=pool_cache) is None
+    ]
+    if 'totalSupply' in uncached_functions:
+        uncached_functions.remove('totalSupply')
+        uncached_functions.insert(0, 'totalSupply')
+    return [(pool_address, function_name) for function_name in uncached_functions]
+
+def plan_backfill_blocks(block_number, pool_addresses):
+    """
+    Walk the same block sequence as run_sequential_backfill without any network calls.
+    Returns a list of (block_number, calls) in descending block order, where calls is the
+    list of (pool_address, function_name) still missing for that block. Stops on the same
+    conditions: min_block_threshold, MAX_CONSECUTIVE_CACHED blocks in a row where every pool
+    is fully cached, or a cached totalSupply of 0 (which drops that pool for older blocks).
+    """
+    planned = []
+    consecutive_cached_blocks = 0
+    active_pools = list(pool_addresses)
+    for i in range(MAX_ITERATIONS):
+        if i > 0:
+            block_number = block_number - block_step
+        if block_number < min_block_threshold:
+            print(f"  Plan stops at min_block_threshold {min_block_threshold} (iteration {i+1})")
             break
-    
-    # Save cache periodically (every SAVE_INTERVAL blocks) - constant interval
-    # Only save if something actually changed (_cache_dirty will be True if new data was written)
-    # Note: If uncached functions were processed above, save already happened there
-    if uncached_functions and (i + 1) % SAVE_INTERVAL == 0:
-        # Already saved above after processing uncached functions
-        pass
-    elif (i + 1) % SAVE_INTERVAL == 0:
-        # No uncached functions, but check if we should save (only if something changed)
-        if save_cache(cache, force=False):
-            print(f"  Saved cache after {i + 1} blocks processed (interval: {SAVE_INTERVAL})")
-
-# Save cache at the end
+
+        calls = []
+        for pool_address in list(active_pools):
+            pool_cache = load_cache(pool_address)
+            if get_cached_value(pool_address, block_number, 'totalSupply', cache=pool_cache) == 0:
+                print(f"  Plan drops {pool_address} at block {block_number}: cached totalSupply is 0")
+                active_pools.remove(pool_address)
+                continue
+            calls.extend(missing_calls(pool_address, block_number, pool_cache))
+        if not active_pools:
+            break
+        if not calls:
+            consecutive_cached_blocks += 1
+            if consecutive_cached_blocks >= MAX_CONSECUTIVE_CACHED:
+                print(f"  Plan stops at block {block_number}: {MAX_CONSECUTIVE_CACHED} consecutive fully cached blocks")
+                break
+            continue
+        consecutive_cached_blocks = 0
+        planned.append((block_number, calls))
+    return planned
+
+def plan_sync_blocks(block_number, pool_addresses):
+    """
+    Plan a forward sync from the cache's block index instead of walking back from the head.
+    For every pool, each block_step sample point from its oldest cached block up to block_number
+    (the head) that is missing or incomplete is planned: everything after the newest cached block,
+    plus the holes inside the cached range. Blocks with a cached totalSupply of 0 count as complete.
+    Returns a list of (block_number, calls) in descending block order, like plan_backfill_blocks.
+    """
+    calls_by_block = {}
+    for pool_address in pool_addresses:
+        pool_cache = load_cache(pool_address)
+        cached_blocks = [int(block_str) for block_str in pool_cache if int(block_str) % block_step == 0]
+        if not cached_blocks:
+            print(f"  Sync skips {pool_address}: no cached blocks yet, run a backfill first")
+            continue
+        first_block = max(min(cached_blocks), min_block_threshold)
+        newest_cached = max(cached_blocks)
+        new_blocks = holes = 0
+        for sample_block in range(first_block, block_number + 1, block_step):
+            if get_cached_value(pool_address, sample_block, 'totalSupply', cache=pool_cache) == 0:
+                continue
+            calls = missing_calls(pool_address, sample_block, pool_cache)
+            if not calls:
+                continue
+            calls_by_block.setdefault(sample_block, []).extend(calls)
+            if sample_block > newest_cached:
+                new_blocks += 1
+            else:
+                holes += 1
+        print(f"  Sync {pool_address}: newest cached block {newest_cached}, "
+              f"{new_blocks} new sample points up to {block_number}, {holes} holes")
+    return sorted(calls_by_block.items(), reverse=True)
+
+def store_block_results(block_number, calls, timestamp, results, stopped_pools):
+    """
+    Decode one aggregate3 result (one entry per call) into the per-pool caches.
+    Pools whose totalSupply is 0 at this block are added to stopped_pools.
+    """
+    human_readable = format_block_time(timestamp)
+    for (pool_address, function_name), (success, result_bytes) in zip(calls, results):
+        if pool_address in stopped_pools:
+            continue
+        if not success:
+            print(f"\n    ERROR: Call to {function_name} on {pool_address} failed at block {block_number}")
+            continue
+        result = decode_result(function_name, result_bytes, decimals=pool_decimals[pool_address])
+        set_cached_value(
+            pool_address, block_number, function_name, result,
+            epoch=timestamp, human_readable=human_readable, cache=load_cache(pool_address), save_now=False
+        )
+        if function_name == 'totalSupply' and result == 0:
+            print(f"\n  totalSupply is 0 at block {block_number} for {pool_names[pool_address]}. Stopping this pool.")
+            stopped_pools.add(pool_address)
+
+def without_stopped_pools(chunk, stopped_pools):
+    """Drop calls of pools that already reached totalSupply 0 (and blocks left with no calls)"""
+    if not stopped_pools:
+        return chunk
+    filtered = []
+    for block_number, calls in chunk:
+        calls = [call for call in calls if call[0] not in stopped_pools]
+        if calls:
+            filtered.append((block_number, calls))
+    return filtered
+
+async def fetch_block_async(aw3, semaphore, block_number, calls):
+    """Fetch one aggregate3 call for a single block, plus the header if the block index cannot answer its timestamp"""
+    transaction = {'to': MULTICALL3_ADDRESS, 'data': build_aggregate3_calldata(calls)}
+    timestamp = block_index.lookup(block_number)
+    async with semaphore:
+        if timestamp is not None:
+            return_data = await aw3.eth.call(transaction, block_identifier=block_number)
+            return timestamp, decode_aggregate3(return_data)
+        block, return_data = await asyncio.gather(
+            aw3.eth.get_block(block_number),
+            aw3.eth.call(transaction, block_identifier=block_number),
+        )
+    block_index.add(block_number, block['timestamp'])
+    return block['timestamp'], decode_aggregate3(return_data)
+
+async def run_async_backfill(planned, concurrency, stop_at_zero_supply=True):
+    """
+    Fetch the planned blocks with at most `concurrency` blocks in flight.
+    Blocks are scheduled in chunks (newest first) so a totalSupply of 0 stops a pool
+    before its older blocks are requested, and caches are saved every SAVE_INTERVAL blocks.
+    With stop_at_zero_supply=False (sync mode) every planned block is fetched.
+    """
+    aw3 = AsyncWeb3(AsyncPooledHTTPProvider(rpc_pool))
+    semaphore = asyncio.Semaphore(concurrency)
+    chunk_size = concurrency * ASYNC_CHUNK_FACTOR
+
+    processed = 0
+    last_save = 0
+    stopped_pools = set()
+    try:
+        for start in range(0, len(planned), chunk_size):
+            chunk = without_stopped_pools(planned[start:start + chunk_size], stopped_pools)
+            if not chunk:
+                continue
+            responses = await asyncio.gather(
+                *(fetch_block_async(aw3, semaphore, block_number, calls)
+                  for block_number, calls in chunk),
+                return_exceptions=True,
+            )
+            for (block_number, calls), response in zip(chunk, responses):
+                if isinstance(response, Exception):
+                    print(f"\n    ERROR fetching block {block_number}: {response}")
+                    continue
+                timestamp, results = response
+                store_block_results(block_number, calls, timestamp, results,
+                                    stopped_pools if stop_at_zero_supply else set())
+                processed += 1
+            print(f"  Async: {processed}/{len(planned)} blocks fetched (blocks {chunk[0][0]} .. {chunk[-1][0]})")
+            if stopped_pools.issuperset(pool_decimals):
+                break
+            if processed - last_save >= SAVE_INTERVAL:
+                if save_all_caches(force=False):
+                    print(f"  Saved cache after {processed} blocks")
+                last_save = processed
+    finally:
+        await aw3.provider.disconnect()
+    return processed
+
+
+class BatchRejected(Exception):
+    """The provider refused a JSON-RPC batch (too large, rate limited, HTTP error)"""
+
+def is_limit_error(error):
+    """True if a JSON-RPC error object looks like a batch size / rate limit rejection"""
+    if not isinstance(error, dict):
+        return True
+    message = str(error.get('message', '')).lower()
+    return error.get('code') in BATCH_LIMIT_ERROR_CODES or any(hint in message for hint in BATCH_LIMIT_ERROR_HINTS)
+
+def build_aggregate3_calldata(calls):
+    """
+    aggregate3 calldata for a list of (pool_address, function_name), returns a 0x hex string.
+    The call list repeats from block to block, so encode_aggregate3 caches the encoding.
+    """
+    return encode_aggregate3(tuple((pool_address, get_call_data(function_name)) for pool_address, function_name in calls))
+
+def post_rpc_batch(payload):
+    """
+    POST a JSON-RPC batch through the RPC pool (rate limits and failover are handled there)
+    and return the responses keyed by id.
+    Raises BatchRejected if the provider refuses the batch as a whole.
+    """
+    try:
+        body = rpc_pool.post(payload)
+    except RpcError as e:
+        raise BatchRejected(str(e))
+    if not isinstance(body, list):
+        # Providers answer an oversized batch with a single error object
+        raise BatchRejected(f"batch rejected: {body.get('error') if isinstance(body, dict) else body}")
+    return {item.get('id'): item for item in body}
+
+def fetch_blocks_batch(chunk, stats):
+    """
+    Fetch N blocks with a single JSON-RPC batch: N aggregate3 eth_calls, plus an eth_getBlockByNumber
+    for each block whose timestamp the block index cannot answer.
+    A rejected batch is split in half and both halves are retried, recursively.
+    Returns {block_number: (timestamp, [(success, return_bytes), ...])} for the blocks that succeeded.
+    """
+    payload = []
+    known_timestamps = {}
+    for n, (block_number, calls) in enumerate(chunk):
+        block_tag = hex(block_number)
+        known_timestamps[block_number] = block_index.lookup(block_number)
+        if known_timestamps[block_number] is None:
+            payload.append({"jsonrpc": "2.0", "id": 2 * n, "method": "eth_getBlockByNumber",
+                            "params": [block_tag, False]})
+        payload.append({"jsonrpc": "2.0", "id": 2 * n + 1, "method": "eth_call",
+                        "params": [{"to": MULTICALL3_ADDRESS, "data": build_aggregate3_calldata(calls)}, block_tag]})
+
+    stats['http_requests'] += 1
+    try:
+        responses = post_rpc_batch(payload)
+        # Some providers accept the batch but fail every item once a limit is hit
+        limited = [item for item in responses.values() if 'error' in item and is_limit_error(item['error'])]
+        if limited and len(chunk) > 1:
+            raise BatchRejected(f"{len(limited)} items rate limited: {limited[0]['error']}")
+    except BatchRejected as e:
+        stats['rejections'] += 1
+        if len(chunk) == 1:
+            print(f"\n    ERROR: block {chunk[0][0]} rejected even as a single-block batch: {e}")
+            return {}
+        half = len(chunk) // 2
+        stats['smallest_rejected'] = min(stats['smallest_rejected'], len(chunk))
+        print(f"\n    Batch of {len(chunk)} blocks rejected ({e}), splitting into {half} + {len(chunk) - half}")
+        fetched = fetch_blocks_batch(chunk[:half], stats)
+        fetched.update(fetch_blocks_batch(chunk[half:], stats))
+        return fetched
+
+    fetched = {}
+    for n, (block_number, calls) in enumerate(chunk):
+        timestamp = known_timestamps[block_number]
+        header = responses.get(2 * n, {})
+        call = responses.get(2 * n + 1, {})
+        if timestamp is None and ('result' not in header or not header['result']):
+            print(f"\n    ERROR fetching block {block_number}: {header.get('error') or call.get('error')}")
+            continue
+        if 'result' not in call:
+            print(f"\n    ERROR fetching block {block_number}: {call.get('error')}")
+            continue
+        if timestamp is None:
+            timestamp = int(header['result']['timestamp'], 16)
+            block_index.add(block_number, timestamp)
+        results = decode_aggregate3(bytes.fromhex(call['result'][2:]))
+        fetched[block_number] = (timestamp, results)
+    return fetched
+
+def run_batch_backfill(planned, max_batch_size, stop_at_zero_supply=True):
+    """
+    Fetch the planned blocks with JSON-RPC batches of up to max_batch_size blocks.
+    The batch size adapts to the provider: a rejection halves it, and it grows again by
+    BATCH_GROW_STEP after BATCH_GROW_AFTER accepted batches in a row, staying below the
+    smallest batch size the provider has rejected so far.
+    With stop_at_zero_supply=False (sync mode) every planned block is fetched.
+    """
+    stats = {'http_requests': 0, 'rejections': 0, 'smallest_rejected': max_batch_size + 1}
+    batch_size = max_batch_size
+    accepted_in_a_row = 0
+    processed = 0
+    last_save = 0
+    stopped_pools = set()
+    position = 0
+    while position < len(planned) and not stopped_pools.issuperset(pool_decimals):
+        chunk = planned[position:position + batch_size]
+        position += len(chunk)
+        chunk = without_stopped_pools(chunk, stopped_pools)
+        if not chunk:
+            continue
+        rejections_before = stats['rejections']
+        fetched = fetch_blocks_batch(chunk, stats)
+
+        if stats['rejections'] > rejections_before:
+            batch_size = max(1, len(chunk) // 2)
+            accepted_in_a_row = 0
+        else:
+            accepted_in_a_row += 1
+            if accepted_in_a_row >= BATCH_GROW_AFTER and batch_size < stats['smallest_rejected'] - 1:
+                batch_size = min(stats['smallest_rejected'] - 1, batch_size + BATCH_GROW_STEP)
+                accepted_in_a_row = 0
+
+        # Store newest first so a totalSupply of 0 stops a pool before its older blocks are written
+        for block_number, calls in chunk:
+            if block_number not in fetched:
+                continue
+            timestamp, results = fetched[block_number]
+            store_block_results(block_number, calls, timestamp, results,
+                                stopped_pools if stop_at_zero_supply else set())
+            processed += 1
+        print(f"  Batch: {processed}/{len(planned)} blocks fetched, batch size {batch_size}, "
+              f"{stats['http_requests']} HTTP requests, {stats['rejections']} rejected")
+        if processed - last_save >= SAVE_INTERVAL:
+            if save_all_caches(force=False):
+                print(f"  Saved cache after {processed} blocks")
+            last_save = processed
+    return processed, stats
+
+
+def find_change_intervals(pool_addresses):
+    """
+    Neighbouring cached samples (at most block_step apart, more than 1 block apart) where a
+    REFINE_FUNCTIONS value differs. Returns [(pool_address, function_name, lo, hi, lo_value)].
+    A refined change leaves samples at E-1 and E behind, so it is not found again.
+    """
+    intervals = []
+    for pool_address in pool_addresses:
+        pool_cache = load_cache(pool_address)
+        for function_name in REFINE_FUNCTIONS:
+            samples = sorted(
+                (int(block_str), block_data[function_name]['value'])
+                for block_str, block_data in pool_cache.items()
+                if isinstance(block_data, dict) and isinstance(block_data.get(function_name), dict)
+                and block_data[function_name].get('value') is not None
+            )
+            for (lo, lo_value), (hi, hi_value) in zip(samples, samples[1:]):
+                if lo_value != hi_value and 1 < hi - lo <= block_step:
+                    intervals.append((pool_address, function_name, lo, hi, lo_value))
+    return intervals
+
+def probe_values(probes, max_batch_size, stats):
+    """
+    Read one getter at many blocks with JSON-RPC batches of plain eth_calls.
+    probes: [(pool_address, function_name, block_number)], returns {probe: value}.
+    """
+    values = {}
+    position = 0
+    batch_size = max_batch_size
+    while position < len(probes):
+        chunk = probes[position:position + batch_size]
+        payload = [
+            {"jsonrpc": "2.0", "id": n, "method": "eth_call",
+             "params": [{"to": pool_address, "data": get_call_data(function_name)}, hex(block_number)]}
+            for n, (pool_address, function_name, block_number) in enumerate(chunk)
+        ]
+        stats['http_requests'] += 1
+        try:
+            responses = post_rpc_batch(payload)
+        except BatchRejected as e:
+            stats['rejections'] += 1
+            if batch_size == 1:
+                print(f"\n    ERROR: refinement probe rejected: {e}")
+                position += 1
+                continue
+            batch_size = max(1, batch_size // 2)
+            continue
+        for n, probe in enumerate(chunk):
+            item = responses.get(n, {})
+            if 'result' not in item:
+                print(f"\n    ERROR probing {probe}: {item.get('error')}")
+                continue
+            pool_address, function_name, _ = probe
+            values[probe] = decode_result(function_name, bytes.fromhex(item['result'][2:]), decimals=pool_decimals[pool_address])
+        position += len(chunk)
+    return values
+
+def run_refinement(pool_addresses, max_batch_size):
+    """
+    Locate every change of a REFINE_FUNCTIONS value between neighbouring samples to its exact block.
+    All open intervals are bisected together, one batched round of eth_calls per step
+    (~log2(block_step) rounds). At the first block E with the new value a full sample is fetched,
+    and the old value is stored at E-1 so the interval is closed.
+    """
+    stats = {'http_requests': 0, 'rejections': 0, 'smallest_rejected': max_batch_size + 1}
+    refined = 0
+    for refine_pass in range(MAX_REFINE_PASSES):
+        intervals = find_change_intervals(pool_addresses)
+        if not intervals:
+            break
+        print(f"  Refine pass {refine_pass + 1}: {len(intervals)} changes to locate")
+        # Bisect until the change is between two adjacent blocks: lo keeps the old value, hi does not
+        open_intervals = [list(interval) for interval in intervals]
+        failed = set()
+        rounds = 0
+        while True:
+            pending = [interval for n, interval in enumerate(open_intervals)
+                       if interval[3] - interval[2] > 1 and n not in failed]
+            if not pending:
+                break
+            probes = [(pool_address, function_name, (lo + hi) // 2) for pool_address, function_name, lo, hi, _ in pending]
+            values = probe_values(probes, max_batch_size, stats)
+            rounds += 1
+            for interval, probe in zip(pending, probes):
+                if probe not in values:
+                    failed.add(open_intervals.index(interval))  # keep the coarse samples for this one
+                    continue
+                if values[probe] == interval[4]:
+                    interval[2] = probe[2]
+                else:
+                    interval[3] = probe[2]
+
+        # Full sample at each change block, old value at the block before it
+        samples = {}
+        for n, (pool_address, function_name, lo, hi, lo_value) in enumerate(open_intervals):
+            if n in failed:
+                continue
+            pool_cache = load_cache(pool_address)
+            set_cached_value(pool_address, lo, function_name, lo_value, epoch=block_index.get_timestamp(lo),
+                             human_readable=format_block_time(block_index.get_timestamp(lo)), cache=pool_cache)
+            block_calls = samples.setdefault(hi, [])
+            for call in missing_calls(pool_address, hi, pool_cache):
+                if call not in block_calls:
+                    block_calls.append(call)
+        planned = sorted(((block_number, calls) for block_number, calls in samples.items() if calls), reverse=True)
+        for start in range(0, len(planned), max_batch_size):
+            chunk = planned[start:start + max_batch_size]
+            fetched = fetch_blocks_batch(chunk, stats)
+            for block_number, calls in chunk:
+                if block_number in fetched:
+                    timestamp, results = fetched[block_number]
+                    store_block_results(block_number, calls, timestamp, results, set())
+                    refined += 1
+        print(f"  Refine pass {refine_pass + 1}: {len(planned)} exact blocks sampled after {rounds} bisection rounds")
+    save_all_caches(force=False)
+    return refined, stats
+
+
+# Pools fetched in this run: just --index, or every pool of --chain
+pool_addresses = [fxswap_addresses[i]["address"] for i in chain_indices]
+pool_names = {fxswap_addresses[i]["address"]: fxswap_addresses[i]["name"] for i in chain_indices}
+pool_decimals = {fxswap_addresses[i]["address"]: get_pool_decimals(fxswap_addresses[i]["name"]) for i in chain_indices}
+if args.chain is not None:
+    print(f"Multi-pool mode: {len(pool_addresses)} pools on {args.chain}")
+    for pool_address in pool_addresses:
+        print(f"  {pool_names[pool_address]}: {pool_address} decimals {pool_decimals[pool_address]}")
+if (args.chain is not None or args.sync) and args.mode == 'sequential':
+    # One block at a time, but still one header + one aggregate3 for all pools per block
+    print("Multi-pool and sync mode run the async fetcher with concurrency 1 for --mode sequential")
+    args.mode = 'async'
+    args.concurrency = 1
+
+def plan_blocks():
+    """
+    Blocks to fetch: forward sync from the cache's block index with --sync, else a backfill from the head.
+    The block index gets anchors around the planned range, so the runners need no header fetches on Base.
+    """
+    if args.sync:
+        planned = plan_sync_blocks(block_number, pool_addresses)
+        print(f"Sync: {len(planned)} sample points to fetch up to block {block_number}")
+    else:
+        planned = plan_backfill_blocks(block_number, pool_addresses)
+    if planned:
+        block_index.ensure_range(planned[-1][0], planned[0][0])
+    return planned
+
+match args.mode:
+    case 'async':
+        planned_blocks = plan_blocks()
+        print(f"Async mode: {len(planned_blocks)} blocks to fetch, concurrency {args.concurrency}")
+        started = time.time()
+        fetched = asyncio.run(run_async_backfill(planned_blocks, max(1, args.concurrency),
+                                                 stop_at_zero_supply=not args.sync))
+        print(f"\nAsync mode fetched {fetched} blocks in {time.time() - started:.1f}s")
+    case 'batch':
+        planned_blocks = plan_blocks()
+        print(f"Batch mode: {len(planned_blocks)} blocks to fetch, up to {args.batch_size} blocks per batch")
+        started = time.time()
+        fetched, batch_stats = run_batch_backfill(planned_blocks, max(1, args.batch_size),
+                                                  stop_at_zero_supply=not args.sync)
+        print(f"\nBatch mode fetched {fetched} blocks with {batch_stats['http_requests']} HTTP requests "
+              f"({batch_stats['rejections']} rejected) in {time.time() - started:.1f}s")
+    case _:
+        run_sequential_backfill(block_number)
+
+# Locate refuels / donation releases to their exact block
+if not args.skip_refine:
+    started = time.time()
+    refined, refine_stats = run_refinement(pool_addresses, max(1, args.batch_size))
+    print(f"\nRefinement sampled {refined} exact change blocks with {refine_stats['http_requests']} HTTP requests "
+          f"in {time.time() - started:.1f}s")
+
+# Save caches at the end
 save_cache(cache, force=True)
-print(f"\nFinal cache save complete. Cache contains {len(cache)} blocks")
+save_all_caches(force=False)
+compact_all_caches()
+block_index.save()
+# 5m / 1h / 1d pre-aggregates for the long-range charts, only the buckets of the new blocks (see pool_pyramid.py)
+for pool_address in pool_addresses:
+    if store_exists(get_data_file(pool_address)):
+        levels = update_pyramid(chain_name, pool_address)
+        print(f"Pyramid {pool_names[pool_address]}: " + ", ".join(f"{level} {rows} buckets" for level, rows in levels.items()))
+print("\nRPC endpoints:")
+for line in rpc_pool.summary():
+    print(f"  {line}")
+print(f"\nBlock index: {len(block_index.anchors)} anchors, {block_index.header_fetches} header fetches this run")
+for pool_address in pool_addresses:
+    print(f"\nFinal cache save complete. {pool_names[pool_address]} cache contains {len(load_cache(pool_address))} blocks")
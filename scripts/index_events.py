@@ -0,0 +1,523 @@
+"""
+Event-log indexer for fxswap pools.
+
+Streams eth_getLogs over a block range for every pool of a chain at once (one address list per
+request), decodes TokenExchange / AddLiquidity / Donation / RemoveLiquidity* / NewParameters /
+ClaimAdminFee in bulk with NumPy and appends them to a columnar per-pool event table:
+
+    data/<chain_name>/<address>.events/<from_block>-<to_block>.parquet
+
+One row per log: block, log_index, tx_hash, epoch, event, then the union of all event fields
+(token_amounts is split into token_amounts_0 / token_amounts_1). Amounts are raw contract
+integers (no decimals applied) as float64, plus the exact value in <field>_exact
+(decimal256(76, 0)) for replays; indices (sold_id, bought_id, coin_index) are int64.
+
+The block range per request adapts to the provider: a "range too large / too many results"
+error halves it, LOGS_GROW_AFTER successful requests in a row grow it again, at most halfway
+to the smallest range the provider has rejected so far.
+Progress is kept in data/<chain_name>/events_state.json, so a run continues where the last stopped.
+
+    python scripts/index_events.py --chain base
+    python scripts/index_events.py --index 9 --from-block 38000000 --to-block 38100000
+    python scripts/index_events.py --chain base --record logs.json   # also write the raw logs
+    python scripts/index_events.py --chain base --fixture logs.json  # replay recorded logs, no RPC
+
+RPC can point at a local stand-in node (anvil --fork-url ...) for tests.
+"""
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from eth_utils import keccak, to_checksum_address
+from pool_store import write_table
+from block_index import BlockIndex
+from rpc_pool import RpcPool, RpcError
+
+DATA_DIR = Path("data")
+
+# First block to index when neither events_state.json nor "first_block" in fxswaps.json says otherwise
+DEFAULT_FIRST_BLOCK = {
+    8453: 37524600,  # Base, same as min_block_threshold in get_historical_data.py
+    1: 23500000,     # Ethereum, about the same date
+}
+
+# Adaptive eth_getLogs block range
+LOGS_INITIAL_RANGE = 2000
+LOGS_MAX_RANGE = 100000
+LOGS_GROW_AFTER = 3
+# Buffer this many decoded logs before appending segments (and advancing events_state.json)
+FLUSH_LOGS = 5000
+# Merge the segments of a pool into one file once it has this many
+COMPACT_AFTER_SEGMENTS = 16
+
+# JSON-RPC error codes / message fragments that mean "ask for a smaller block range"
+RANGE_ERROR_CODES = {-32005, -32602, -32614}
+RANGE_ERROR_HINTS = ("range", "too many", "limit", "exceed", "response size", "10000", "timeout")
+
+# fxswap.vy events: (field, type, indexed). uint256[2] is N_COINS = 2
+EVENTS = {
+    "TokenExchange": [
+        ("buyer", "address", True),
+        ("sold_id", "uint256", False),
+        ("tokens_sold", "uint256", False),
+        ("bought_id", "uint256", False),
+        ("tokens_bought", "uint256", False),
+        ("fee", "uint256", False),
+        ("price_scale", "uint256", False),
+    ],
+    "AddLiquidity": [
+        ("provider", "address", True),
+        ("receiver", "address", True),
+        ("token_amounts", "uint256[2]", False),
+        ("fee", "uint256", False),
+        ("token_supply", "uint256", False),
+        ("price_scale", "uint256", False),
+    ],
+    "Donation": [
+        ("donor", "address", True),
+        ("token_amounts", "uint256[2]", False),
+    ],
+    "RemoveLiquidity": [
+        ("provider", "address", True),
+        ("token_amounts", "uint256[2]", False),
+        ("token_supply", "uint256", False),
+    ],
+    "RemoveLiquidityOne": [
+        ("provider", "address", True),
+        ("token_amount", "uint256", False),
+        ("coin_index", "uint256", False),
+        ("coin_amount", "uint256", False),
+        ("approx_fee", "uint256", False),
+        ("packed_price_scale", "uint256", False),
+    ],
+    "RemoveLiquidityImbalance": [
+        ("provider", "address", True),
+        ("lp_token_amount", "uint256", False),
+        ("token_amounts", "uint256[2]", False),
+        ("approx_fee", "uint256", False),
+        ("price_scale", "uint256", False),
+    ],
+    "NewParameters": [
+        ("mid_fee", "uint256", False),
+        ("out_fee", "uint256", False),
+        ("fee_gamma", "uint256", False),
+        ("allowed_extra_profit", "uint256", False),
+        ("adjustment_step", "uint256", False),
+        ("ma_time", "uint256", False),
+    ],
+    "ClaimAdminFee": [
+        ("admin", "address", True),
+        ("tokens", "uint256[2]", False),
+    ],
+}
+# Small integers stored as int64 instead of float64
+INDEX_FIELDS = {"sold_id", "bought_id", "coin_index"}
+# Exact uint256 values next to the float64 ones (decimal256 holds up to 76 digits, far above any amount)
+EXACT_TYPE = pa.decimal256(76, 0)
+EXACT_SUFFIX = "_exact"
+
+
+def event_topic(event_name):
+    """topic0 of an event: keccak of its canonical signature"""
+    types = ",".join(field_type for _, field_type, _ in EVENTS[event_name])
+    return "0x" + keccak(text=f"{event_name}({types})").hex()
+
+TOPICS = {event_topic(event_name): event_name for event_name in EVENTS}
+
+
+def _data_columns(event_name):
+    """Column names of the non-indexed fields, in data order (arrays split into _0, _1)"""
+    columns = []
+    for field, field_type, indexed in EVENTS[event_name]:
+        if indexed:
+            continue
+        if field_type.endswith("[2]"):
+            columns += [f"{field}_0", f"{field}_1"]
+        else:
+            columns.append(field)
+    return columns
+
+def _build_schema():
+    """block, log_index, tx_hash, epoch, event, then the union of all event fields"""
+    fields = [
+        pa.field("block", pa.int64(), nullable=False),
+        pa.field("log_index", pa.int64(), nullable=False),
+        pa.field("tx_hash", pa.string()),
+        pa.field("epoch", pa.int64()),
+        pa.field("event", pa.string()),
+    ]
+    seen = {field.name for field in fields}
+    for event_name, event_fields in EVENTS.items():
+        topic_columns = [field for field, _, indexed in event_fields if indexed]
+        for column in topic_columns + _data_columns(event_name):
+            if column in seen:
+                continue
+            seen.add(column)
+            if column in topic_columns:
+                fields.append(pa.field(column, pa.string()))
+            elif column in INDEX_FIELDS:
+                fields.append(pa.field(column, pa.int64()))
+            else:
+                fields.append(pa.field(column, pa.float64()))
+                fields.append(pa.field(column + EXACT_SUFFIX, EXACT_TYPE))
+    return pa.schema(fields)
+
+EVENT_SCHEMA = _build_schema()
+
+
+def decode_logs(logs, block_timestamps=None):
+    """
+    Decode raw eth_getLogs entries (all fxswap events, any pools) into one Arrow table.
+    Logs are grouped by topic0 and every group's data words are decoded at once:
+    a uint256 is read as four big-endian uint64 words and combined in float64, and exactly
+    into its <field>_exact column.
+    block_timestamps maps block -> epoch for logs without a blockTimestamp field.
+    """
+    by_event = {}
+    for log in logs:
+        if log.get("removed"):
+            continue
+        event_name = TOPICS.get(log["topics"][0].lower()) if log.get("topics") else None
+        if event_name is not None:
+            by_event.setdefault(event_name, []).append(log)
+
+    tables = []
+    for event_name, event_logs in by_event.items():
+        n = len(event_logs)
+        blocks = np.array([int(log["blockNumber"], 16) for log in event_logs], dtype=np.int64)
+        epochs = []
+        for log, block_number in zip(event_logs, blocks):
+            if "blockTimestamp" in log and log["blockTimestamp"] is not None:
+                epochs.append(int(log["blockTimestamp"], 16))
+            else:
+                epochs.append((block_timestamps or {}).get(int(block_number)))
+        columns = {
+            "block": blocks,
+            "log_index": np.array([int(log["logIndex"], 16) for log in event_logs], dtype=np.int64),
+            "tx_hash": [log.get("transactionHash") for log in event_logs],
+            "epoch": pa.array(epochs, type=pa.int64()),
+            "event": [event_name] * n,
+        }
+
+        # Indexed addresses: last 20 bytes of topics[1..]
+        topic_position = 1
+        for field, _, indexed in EVENTS[event_name]:
+            if indexed:
+                columns[field] = [to_checksum_address("0x" + log["topics"][topic_position][-40:]) for log in event_logs]
+                topic_position += 1
+
+        # Non-indexed fields: fixed layout of 32-byte words
+        data_columns = _data_columns(event_name)
+        raw = b"".join(bytes.fromhex(log["data"][2:]) for log in event_logs)
+        words = np.frombuffer(raw, dtype=">u8").reshape(n, len(data_columns), 4)
+        values = words[:, :, 0].astype(np.float64)
+        for limb in range(1, 4):
+            values = values * 2.0 ** 64 + words[:, :, limb].astype(np.float64)
+        for position, column in enumerate(data_columns):
+            if column in INDEX_FIELDS:
+                columns[column] = words[:, position, 3].astype(np.int64)
+            else:
+                columns[column] = values[:, position]
+                columns[column + EXACT_SUFFIX] = pa.array(
+                    [(a << 192) | (b << 128) | (c << 64) | d for a, b, c, d in words[:, position].tolist()], type=EXACT_TYPE)
+
+        tables.append(pa.table({
+            field.name: columns[field.name] if field.name in columns else pa.nulls(n, field.type)
+            for field in EVENT_SCHEMA
+        }, schema=EVENT_SCHEMA))
+
+    if not tables:
+        return EVENT_SCHEMA.empty_table()
+    return pa.concat_tables(tables)
+
+
+def get_events_dir(chain_name, pool_address, data_dir=DATA_DIR):
+    """Segment directory of a pool's event table: data/<chain_name>/<address>.events/"""
+    return Path(data_dir) / chain_name / f"{pool_address}.events"
+
+def load_events(chain_name, pool_address, events=None, columns=None, data_dir=DATA_DIR):
+    """
+    Event table of a pool sorted by (block, log_index), optionally only some event names
+    and columns (block, log_index, epoch and event are always included). Segments written
+    before a column existed read it as nulls.
+    """
+    # Oldest first: segments are never modified after the write, the newest copy of a log wins
+    segments = sorted(get_events_dir(chain_name, pool_address, data_dir).glob("*.parquet"),
+                      key=lambda segment: segment.stat().st_mtime_ns)
+    if columns is not None:
+        columns = ["block", "log_index", "epoch", "event"] + [c for c in columns if c not in ("block", "log_index", "epoch", "event")]
+    empty = EVENT_SCHEMA.empty_table() if columns is None else EVENT_SCHEMA.empty_table().select(columns)
+    if not segments:
+        return empty
+    filters = [("event", "in", list(events))] if events else None
+    tables = [empty]
+    for segment in segments:
+        available = set(pq.read_schema(segment).names)
+        segment_columns = None if columns is None else [column for column in columns if column in available]
+        tables.append(pq.read_table(segment, columns=segment_columns, filters=filters))
+    table = pa.concat_tables(tables, promote_options="default").select(empty.column_names)
+    # Overlapping segments (a re-indexed range) hold the same logs twice
+    table = table.sort_by([("block", "ascending"), ("log_index", "ascending")])
+    blocks = table.column("block").to_numpy()
+    log_indexes = table.column("log_index").to_numpy()
+    keep = np.ones(len(blocks), dtype=bool)
+    keep[:-1] = (blocks[:-1] != blocks[1:]) | (log_indexes[:-1] != log_indexes[1:])
+    return table.filter(pa.array(keep))
+
+def compact_events(chain_name, pool_address, data_dir=DATA_DIR):
+    """Merge all segments of a pool into one file named after the full block range"""
+    events_dir = get_events_dir(chain_name, pool_address, data_dir)
+    segments = sorted(events_dir.glob("*.parquet"))
+    if len(segments) < 2:
+        return 0
+    first_block = min(int(segment.stem.split("-")[0]) for segment in segments)
+    last_block = max(int(segment.stem.split("-")[1]) for segment in segments)
+    merged = events_dir / f"{first_block:012d}-{last_block:012d}.parquet"
+    write_table(merged, load_events(chain_name, pool_address, data_dir=data_dir))
+    for segment in segments:
+        if segment != merged:
+            segment.unlink()
+    return len(segments)
+
+
+class LogRangeTooLarge(Exception):
+    """The provider wants a smaller eth_getLogs block range"""
+
+class RpcLogSource:
+    """eth_getLogs / headers over JSON-RPC, through an RpcPool (rate limits and failover are handled there)"""
+
+    def __init__(self, rpc_pool):
+        self.rpc_pool = rpc_pool
+        self.requests = 0
+
+    def call(self, method, params):
+        self.requests += 1
+        try:
+            body = self.rpc_pool.post({"jsonrpc": "2.0", "id": self.rpc_pool.next_id(), "method": method, "params": params})
+        except RpcError as e:
+            # Every endpoint refused (HTTP 413, or still rate limited after the retries): ask for less
+            raise LogRangeTooLarge(str(e))
+        if "error" in body:
+            error = body["error"]
+            message = str(error.get("message", "")).lower()
+            if error.get("code") in RANGE_ERROR_CODES or any(hint in message for hint in RANGE_ERROR_HINTS):
+                raise LogRangeTooLarge(f"{error}")
+            raise RuntimeError(f"{method} failed: {error}")
+        return body["result"]
+
+    def chain_id(self):
+        return int(self.call("eth_chainId", []), 16)
+
+    def head(self):
+        return int(self.call("eth_blockNumber", []), 16)
+
+    def block_timestamp(self, block_number):
+        return int(self.call("eth_getBlockByNumber", [hex(block_number), False])["timestamp"], 16)
+
+    def get_logs(self, addresses, from_block, to_block):
+        return self.call("eth_getLogs", [{
+            "address": addresses,
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "topics": [list(TOPICS)],
+        }])
+
+class FixtureLogSource:
+    """Recorded eth_getLogs entries from a JSON file (a list of raw logs), no network"""
+
+    def __init__(self, fixture_path, chain_id):
+        with open(fixture_path, "r") as f:
+            self.logs = json.load(f)
+        self._chain_id = chain_id
+        self.requests = 0
+
+    def chain_id(self):
+        return self._chain_id
+
+    def head(self):
+        return max((int(log["blockNumber"], 16) for log in self.logs), default=0)
+
+    def block_timestamp(self, block_number):
+        return None  # fixtures carry blockTimestamp per log, or no epoch
+
+    def get_logs(self, addresses, from_block, to_block):
+        self.requests += 1
+        wanted = {address.lower() for address in addresses}
+        return [log for log in self.logs
+                if log["address"].lower() in wanted and from_block <= int(log["blockNumber"], 16) <= to_block]
+
+
+def load_state(chain_name, data_dir=DATA_DIR):
+    """Last indexed block per pool address"""
+    state_path = Path(data_dir) / chain_name / "events_state.json"
+    if not state_path.exists():
+        return {}
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+def save_state(chain_name, state, data_dir=DATA_DIR):
+    """Write events_state.json (temp file + rename)"""
+    state_path = Path(data_dir) / chain_name / "events_state.json"
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def index_events(source, chain_id, chain_name, pools, from_block, to_block, block_index=None, recorded=None, data_dir=DATA_DIR):
+    """
+    Index the events of `pools` (address -> first block) from from_block to to_block.
+    Pools starting later than from_block are only asked for once their first block is reached.
+    Returns the number of decoded logs.
+    """
+    state = load_state(chain_name, data_dir)
+    addresses = list(pools)
+    block_range = LOGS_INITIAL_RANGE
+    smallest_rejected = LOGS_MAX_RANGE + 1
+    successes_in_a_row = 0
+    buffered_logs = []
+    buffer_start = from_block
+    total_logs = 0
+
+    def flush(buffer_end):
+        """Decode the buffered logs, append one segment per pool and advance the state"""
+        timestamps = {}
+        if block_index is not None:
+            for block_number in sorted({int(log["blockNumber"], 16) for log in buffered_logs if "blockTimestamp" not in log}):
+                timestamps[block_number] = block_index.get_timestamp(block_number)
+        logs_by_pool = {}
+        for log in buffered_logs:
+            logs_by_pool.setdefault(log["address"].lower(), []).append(log)
+        for address in addresses:
+            if buffer_end < pools[address]:
+                continue
+            pool_rows = decode_logs(logs_by_pool.get(address.lower(), []), timestamps)
+            if pool_rows.num_rows:
+                events_dir = get_events_dir(chain_name, address, data_dir)
+                events_dir.mkdir(parents=True, exist_ok=True)
+                write_table(events_dir / f"{buffer_start:012d}-{buffer_end:012d}.parquet",
+                            pool_rows.sort_by([("block", "ascending"), ("log_index", "ascending")]))
+                if len(list(events_dir.glob("*.parquet"))) >= COMPACT_AFTER_SEGMENTS:
+                    compact_events(chain_name, address, data_dir)
+            state[address] = buffer_end
+        save_state(chain_name, state, data_dir)
+        if block_index is not None:
+            block_index.save()
+
+    start = from_block
+    while start <= to_block:
+        end = min(to_block, start + block_range - 1)
+        active = [address for address in addresses if pools[address] <= end]
+        if not active:
+            start = end + 1
+            continue
+        try:
+            logs = source.get_logs(active, start, end)
+        except LogRangeTooLarge as e:
+            if block_range == 1:
+                raise
+            smallest_rejected = min(smallest_rejected, end - start + 1)
+            block_range = max(1, (end - start + 1) // 2)
+            successes_in_a_row = 0
+            print(f"  eth_getLogs {start}..{end} too large ({e}), block range now {block_range}")
+            continue
+
+        buffered_logs.extend(logs)
+        if recorded is not None:
+            recorded.extend(logs)
+        total_logs += len(logs)
+        successes_in_a_row += 1
+        if successes_in_a_row >= LOGS_GROW_AFTER and block_range < smallest_rejected - 1:
+            block_range = min(LOGS_MAX_RANGE, block_range * 2, (block_range + smallest_rejected) // 2)
+            successes_in_a_row = 0
+        print(f"  Blocks {start}..{end}: {len(logs)} logs, {total_logs} total, block range {block_range}")
+
+        if len(buffered_logs) >= FLUSH_LOGS:
+            flush(end)
+            buffered_logs = []
+            buffer_start = end + 1
+        start = end + 1
+
+    if buffered_logs or to_block >= buffer_start:
+        flush(to_block)
+    return total_logs
+
+
+if __name__ == "__main__":
+    # Load fxswap_addresses from fxswaps.json
+    fxswaps_path = Path(__file__).parent.parent / "config" / "fxswaps.json"
+    with open(fxswaps_path, 'r') as f:
+        fxswap_addresses = {int(k): v for k, v in json.load(f).items()}
+
+    parser = argparse.ArgumentParser(description='Index fxswap pool events (eth_getLogs) into per-pool Parquet event tables')
+    parser.add_argument('--index', type=int, default=None, help='Index of a single pool in fxswaps.json')
+    parser.add_argument('--chain', type=str, default=None, help='Index every pool of this chain_name (default: base)')
+    parser.add_argument('--from-block', type=int, default=None,
+                        help='First block (default: one after the last indexed block of each pool)')
+    parser.add_argument('--to-block', type=int, default=None, help='Last block (default: chain head)')
+    parser.add_argument('--fixture', type=str, default=None, help='Replay recorded logs from this JSON file instead of RPC')
+    parser.add_argument('--record', type=str, default=None, help='Also write the raw logs to this JSON file (for --fixture)')
+    args = parser.parse_args()
+
+    if args.index is not None:
+        indices = [args.index]
+    else:
+        chain = args.chain or "base"
+        indices = [i for i, pool in sorted(fxswap_addresses.items()) if pool["chain_name"] == chain]
+    if not indices or any(i not in fxswap_addresses for i in indices):
+        print(f"Error: No pools for --index {args.index} / --chain {args.chain}")
+        print(f"Available indices: {list(fxswap_addresses.keys())}")
+        exit(1)
+    chain_name = fxswap_addresses[indices[0]]["chain_name"]
+    chain_id = fxswap_addresses[indices[0]]["chain_id"]
+
+    if args.fixture:
+        source = FixtureLogSource(args.fixture, chain_id)
+        block_index = None
+    else:
+        rpc_pool = RpcPool.from_env()
+        for endpoint in rpc_pool.endpoints:
+            print(f"RPC: {endpoint.name()}")
+        source = RpcLogSource(rpc_pool)
+        if source.chain_id() != chain_id:
+            print(f"Error: RPC is chain {source.chain_id()}, pools are on {chain_name} ({chain_id})")
+            exit(1)
+        block_index = BlockIndex(chain_id, source.block_timestamp)
+
+    state = load_state(chain_name)
+    pools = {}
+    for i in indices:
+        address = fxswap_addresses[i]["address"]
+        first_block = fxswap_addresses[i].get("first_block", DEFAULT_FIRST_BLOCK.get(chain_id, 0))
+        if args.from_block is not None:
+            first_block = args.from_block
+        elif address in state:
+            first_block = state[address] + 1
+        pools[address] = first_block
+        print(f"{fxswap_addresses[i]['name']} ({address}): from block {first_block}")
+
+    to_block = args.to_block if args.to_block is not None else source.head()
+    from_block = min(pools.values())
+    print(f"Indexing {len(pools)} pools on {chain_name}, blocks {from_block}..{to_block}")
+    started = time.time()
+    recorded = [] if args.record else None
+    total = index_events(source, chain_id, chain_name, pools, from_block, to_block,
+                         block_index=block_index, recorded=recorded)
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(recorded, f)
+        print(f"Recorded {len(recorded)} raw logs to {args.record}")
+
+    print(f"\nIndexed {total} logs with {source.requests} requests in {time.time() - started:.1f}s")
+    for address in pools:
+        compact_events(chain_name, address)
+        table = load_events(chain_name, address, columns=[])
+        counts = {}
+        for event_name in table.column("event").to_pylist():
+            counts[event_name] = counts.get(event_name, 0) + 1
+        print(f"  {address}: {table.num_rows} events {counts}")
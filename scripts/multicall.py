@@ -0,0 +1,86 @@
+"""
+Multicall3 aggregate3 calldata and result decoding without the generic ABI codec.
+
+The getters read per block are the same for every block of a pool (or of a chain in --chain
+mode), so the aggregate3 calldata is built once per distinct call list and then reused. The
+result, an ABI-encoded (bool success, bytes returnData)[], is decoded by reading the offsets
+directly from the response buffer. Every pool getter returns one 32-byte word, for which the
+layout is fixed:
+
+    0x20 | n | n element offsets | n x (success | 0x40 | 32 | value)
+
+    calldata = encode_aggregate3(((pool_address, "0x18160ddd"), ...))   # cached per call list
+    results = decode_aggregate3(bytes.fromhex(result_hex[2:]))          # [(success, return_bytes), ...]
+"""
+from functools import lru_cache
+from eth_utils import keccak
+
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+AGGREGATE3_SELECTOR = keccak(text="aggregate3((address,bool,bytes)[])")[:4]
+
+WORD = 32
+# success word, returnData offset word, length word, one value word
+_UINT_ELEMENT_SIZE = 4 * WORD
+# returnData offset (2 words into the element) and length (one word) of a single-word result
+_SINGLE_WORD_HEAD = (2 * WORD).to_bytes(WORD, "big") + WORD.to_bytes(WORD, "big")
+
+
+def _word(value):
+    return value.to_bytes(WORD, "big")
+
+def _padded(data):
+    return data + b"\x00" * (-len(data) % WORD)
+
+@lru_cache(maxsize=1024)
+def encode_aggregate3(calls, allow_failure=True):
+    """
+    aggregate3 calldata (0x hex string) for a tuple of (target_address, call_data_hex) pairs.
+    Cached, so a call list that repeats every block is encoded once.
+    """
+    heads = []
+    tails = []
+    offset = len(calls) * WORD
+    for target, call_data in calls:
+        data = bytes.fromhex(call_data[2:] if call_data.startswith("0x") else call_data)
+        # (address target, bool allowFailure, bytes callData): bytes is dynamic, its offset is 3 words in
+        element = (
+            _word(int(target, 16)) + _word(1 if allow_failure else 0) + _word(3 * WORD)
+            + _word(len(data)) + _padded(data)
+        )
+        heads.append(_word(offset))
+        tails.append(element)
+        offset += len(element)
+    encoded = AGGREGATE3_SELECTOR + _word(WORD) + _word(len(calls)) + b"".join(heads) + b"".join(tails)
+    return "0x" + encoded.hex()
+
+def decode_aggregate3(data):
+    """
+    Decode aggregate3 return data into [(success, return_bytes), ...].
+    Uses the fixed single-word layout when every call returned 32 bytes, otherwise follows the offsets.
+    """
+    data = bytes(data)
+    count = int.from_bytes(data[WORD:2 * WORD], "big")
+    base = 2 * WORD  # element offsets are relative to the start of the array content
+    if len(data) == base + count * (WORD + _UINT_ELEMENT_SIZE):
+        # Fast path: n uniform elements of (success, 0x40, 32, value) after the offset table
+        start = base + count * WORD
+        results = []
+        for n in range(count):
+            element = start + n * _UINT_ELEMENT_SIZE
+            if data[element + WORD:element + 3 * WORD] != _SINGLE_WORD_HEAD:
+                return _decode_with_offsets(data, count)
+            results.append((data[element + WORD - 1] == 1, data[element + 3 * WORD:element + 4 * WORD]))
+        return results
+    return _decode_with_offsets(data, count)
+
+def _decode_with_offsets(data, count):
+    """General (bool, bytes)[] decoding, for reverted calls or return data that is not one word"""
+    base = 2 * WORD
+    results = []
+    for n in range(count):
+        element = base + int.from_bytes(data[base + n * WORD:base + (n + 1) * WORD], "big")
+        success = int.from_bytes(data[element:element + WORD], "big") != 0
+        return_start = element + int.from_bytes(data[element + WORD:element + 2 * WORD], "big")
+        length = int.from_bytes(data[return_start:return_start + WORD], "big")
+        results.append((success, data[return_start + WORD:return_start + WORD + length]))
+    return results
@@ -0,0 +1,245 @@
+"""
+Render every chart of a chain's pools in one process pool of warm workers.
+
+The pool registry (config/fxswaps.json) is read once and every (pool, chart, window) becomes one
+render job. Each worker imports pandas, NumPy, matplotlib, seaborn and SciPy once when it starts
+and then runs the plot scripts in-process (runpy, with their usual command line), so a job pays
+for its data read and its drawing only. Regenerating every plot of a chain scales with the cores:
+
+    python scripts/plot_all.py --chain base
+    python scripts/plot_all.py --chain base --charts refuel refuel_window volatility --workers 8
+    python scripts/plot_all.py --index 1 3 --window-hours 48 168
+
+Charts (CHARTS):
+
+    refuel         plot_refule.py --full-only                 <name>_refuel_analysis_all.png
+    refuel_window  plot_refule.py --window-only per window    <name>_refuel_analysis_<days>d.png
+    secondary      plot_supply_shares.py                      <name>_secondary_refuel_analysis.png
+    volatility     plot_volatility.py                         volatility/<name>_volatility_*.png
+
+The derived metrics and pre-aggregates of the pools (derived_store.py, pool_pyramid.py) are
+brought up to date before the render jobs start, one job per pool, so two charts of the same
+pool never update the same store at once.
+Charts that are up to date in the render cache (render_cache.py: data range, chart parameters
+and code version) are skipped, --force renders them anyway. A job's output is printed in one
+piece when it finishes; failed jobs are listed at the end and make the exit status 1.
+"""
+import io
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import contextlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from render_cache import RenderCache
+
+SCRIPTS_DIR = Path(__file__).parent
+
+DEFAULT_CHARTS = ['refuel', 'refuel_window', 'secondary']
+DEFAULT_WINDOW_HOURS = [2*24]  # same as TIME_WINDOW_HOURS in plot_refule.py
+
+
+def _refuel_args(index, window_hours):
+    return ['--index', str(index), '--full-only']
+
+def _refuel_window_args(index, window_hours):
+    return ['--index', str(index), '--window-only', '--window-hours', str(window_hours)]
+
+def _secondary_args(index, window_hours):
+    return ['--index', str(index)]
+
+def _volatility_args(index, window_hours):
+    return ['--index', str(index)]
+
+# chart: (script, command line of a job, one job per window?)
+CHARTS = {
+    'refuel': ('plot_refule.py', _refuel_args, False),
+    'refuel_window': ('plot_refule.py', _refuel_window_args, True),
+    'secondary': ('plot_supply_shares.py', _secondary_args, False),
+    'volatility': ('plot_volatility.py', _volatility_args, False),
+}
+# Charts that downsample their series to the pixel width unless --full-resolution (see downsample.py)
+DOWNSAMPLED_CHARTS = {'refuel', 'refuel_window'}
+
+
+def load_pools(fxswaps_path=SCRIPTS_DIR.parent / "config" / "fxswaps.json"):
+    """Pool registry: {index: pool}"""
+    with open(fxswaps_path, 'r') as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+def render_jobs(indices, charts, window_hours):
+    """(index, chart, window_hours) for every pool and chart, window_hours is None for single-window charts"""
+    jobs = []
+    for index in indices:
+        for chart in charts:
+            if CHARTS[chart][2]:
+                jobs.extend((index, chart, hours) for hours in window_hours)
+            else:
+                jobs.append((index, chart, None))
+    return jobs
+
+def _warm_worker():
+    """Process pool initializer: import the heavy libraries once per worker, not once per chart"""
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    if str(SCRIPTS_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS_DIR))
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import matplotlib.pyplot  # noqa: F401
+    import matplotlib.dates  # noqa: F401
+    import seaborn  # noqa: F401
+    import scipy.stats  # noqa: F401
+    import pool_history  # noqa: F401
+    import derived_store  # noqa: F401
+
+def _run_captured(function):
+    """Run function() with its output captured: (ok, output)"""
+    output = io.StringIO()
+    ok = True
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            function()
+        except SystemExit as e:
+            ok = e.code in (None, 0)
+        except Exception as e:
+            print(f"Error: {type(e).__name__}: {e}")
+            ok = False
+    return ok, output.getvalue()
+
+def update_pool_metrics(pool, charts):
+    """Bring the derived metrics the charts of one pool read up to date. Returns (ok, output)"""
+    from derived_store import update_derived
+    from pool_metrics import REFUEL_DELTA_METRICS, VOLATILITY_PRICE_METRICS, VOLATILITY_DONATION_METRICS
+    from pool_pyramid import LEVEL_METRICS
+
+    metrics = []
+    if 'refuel' in charts or 'refuel_window' in charts:
+        metrics.append(REFUEL_DELTA_METRICS)
+    if 'volatility' in charts:
+        metrics.extend([VOLATILITY_PRICE_METRICS, VOLATILITY_DONATION_METRICS])
+    if 'refuel' in charts or 'volatility' in charts:
+        metrics.extend(LEVEL_METRICS.values())
+
+    def update():
+        for metric_set in metrics:
+            rows = update_derived(metric_set, pool["chain_name"], pool["address"])
+            print(f"{metric_set.name}: {rows} new rows")
+    return _run_captured(update)
+
+def job_argv(job, full_resolution=False):
+    """Command line of a render job: script path, then its arguments"""
+    index, chart, window_hours = job
+    script, job_args, _ = CHARTS[chart]
+    argv = [str(SCRIPTS_DIR / script)] + job_args(index, window_hours)
+    if full_resolution and chart in DOWNSAMPLED_CHARTS:
+        argv.append('--full-resolution')
+    return argv
+
+def render(job, full_resolution=False):
+    """
+    Run one plot script in this worker with the job's command line.
+    Returns (ok, output, seconds, paths of the files it saved)
+    """
+    import matplotlib.figure
+    import matplotlib.pyplot as plt
+    argv = sys.argv
+    sys.argv = job_argv(job, full_resolution)
+    # Every savefig of the job goes through Figure.savefig, record what it writes for the render cache
+    outputs = []
+    savefig = matplotlib.figure.Figure.savefig
+    def recording_savefig(figure, fname, *args, **kwargs):
+        outputs.append(str(fname))
+        return savefig(figure, fname, *args, **kwargs)
+    matplotlib.figure.Figure.savefig = recording_savefig
+    started = time.time()
+    try:
+        ok, output = _run_captured(lambda: runpy.run_path(sys.argv[0], run_name='__main__'))
+    finally:
+        sys.argv = argv
+        matplotlib.figure.Figure.savefig = savefig
+        plt.close('all')
+    return ok, output, time.time() - started, outputs
+
+def job_id(job):
+    index, chart, window_hours = job
+    return f"{index}:{chart}" + (f":{window_hours}h" if window_hours is not None else "")
+
+def job_name(pools, job):
+    index, chart, window_hours = job
+    window = f" {window_hours}h" if window_hours is not None else ""
+    return f"[{index}] {pools[index]['name']} {chart}{window}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render the charts of all pools of a chain in parallel')
+    parser.add_argument('--chain', type=str, default=None, help='Render every pool of this chain_name (default: base)')
+    parser.add_argument('--index', type=int, nargs='+', default=None, help='Only these pool indices')
+    parser.add_argument('--charts', nargs='+', choices=list(CHARTS), default=DEFAULT_CHARTS,
+                        help=f'Charts to render (default: {" ".join(DEFAULT_CHARTS)})')
+    parser.add_argument('--window-hours', type=int, nargs='+', default=DEFAULT_WINDOW_HOURS,
+                        help=f'Windows of the refuel_window chart in hours (default: {DEFAULT_WINDOW_HOURS[0]})')
+    parser.add_argument('--full-resolution', action='store_true',
+                        help='Draw every sample instead of downsampling the series to the chart width')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true',
+                        help='Render every chart, even those the render cache has as up to date')
+    args = parser.parse_args()
+
+    pools = load_pools()
+    if args.index is not None:
+        indices = args.index
+    else:
+        chain = args.chain or "base"
+        indices = [i for i, pool in sorted(pools.items()) if pool["chain_name"] == chain]
+    if not indices or any(i not in pools for i in indices):
+        print(f"Error: No pools for --index {args.index} / --chain {args.chain}")
+        print(f"Available indices: {list(pools.keys())}")
+        exit(1)
+
+    # Skip the charts whose data, parameters and code have not changed since they were drawn
+    cache = RenderCache()
+    keys = {}
+    jobs = []
+    for job in render_jobs(indices, args.charts, args.window_hours):
+        argv = job_argv(job, args.full_resolution)
+        keys[job] = cache.key(pools[job[0]], argv[0], argv[1:])
+        if args.force or not cache.lookup(job_id(job), keys[job]):
+            jobs.append(job)
+    print(cache.summary())
+
+    # Charts of every pool that has something to render
+    pool_charts = {}
+    for index, chart, _ in jobs:
+        pool_charts.setdefault(index, set()).add(chart)
+
+    print(f"Rendering {len(jobs)} charts of {len(pool_charts)} pools with {args.workers} workers")
+    started = time.time()
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_warm_worker) as executor:
+        # Derived metrics first, one job per pool
+        futures = {executor.submit(update_pool_metrics, pools[i], charts): i for i, charts in pool_charts.items()}
+        for future in as_completed(futures):
+            ok, output = future.result()
+            if not ok:
+                print(f"\n=== [{futures[future]}] {pools[futures[future]]['name']} metrics failed ===\n{output}")
+
+        futures = {executor.submit(render, job, args.full_resolution): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            ok, output, seconds, outputs = future.result()
+            print(f"\n=== {job_name(pools, job)} ({seconds:.1f}s{'' if ok else ', FAILED'}) ===")
+            print(output, end='')
+            if ok:
+                cache.record(job_id(job), keys[job], outputs)
+            else:
+                cache.forget(job_id(job))
+                failed.append(job)
+    cache.save()
+
+    print(f"\nRendered {len(jobs) - len(failed)}/{len(jobs)} charts in {time.time() - started:.1f}s")
+    for job in failed:
+        print(f"  failed: {job_name(pools, job)}")
+    exit(1 if failed else 0)
@@ -6,6 +6,12 @@ import numpy as np
 import json
 import argparse
 from pathlib import Path
+from pool_history import load_pool_frame, metric_frame, epochs_to_timestamps
+from donation_usage import donation_usage, release_resets
+from derived_store import update_derived, load_derived
+from pool_metrics import REFUEL_DELTA_METRICS
+from downsample import downsample
+from pool_pyramid import update_pyramid, load_level, pick_level, range_points, sample_spacing
 
 # Plotting constants
 PIXELS_PER_DAY = 288  # 1 day = 288 pixels width in the actual plot area
@@ -43,16 +49,40 @@ else:
 # Parse command line arguments
 parser = argparse.ArgumentParser(description='Collect historical data for fxswap pools')
 parser.add_argument('--index', type=int, default=0, help='Index of the pool to query (default: 0)')
+parser.add_argument('--window-hours', type=int, default=TIME_WINDOW_HOURS,
+                    help=f'Length of the time window chart in hours (default: {TIME_WINDOW_HOURS})')
+parser.add_argument('--window-only', action='store_true',
+                    help='Only create the time window chart; reads just that window from the store instead of the whole history')
+parser.add_argument('--full-only', action='store_true',
+                    help='Only create the full history chart, not the time window chart')
+parser.add_argument('--full-resolution', action='store_true',
+                    help='Draw every sample instead of downsampling each series to the pixel width of the chart')
+parser.add_argument('--rebuild-metrics', action='store_true',
+                    help='Recompute the stored derived metrics from the whole history instead of only the new blocks')
 args = parser.parse_args()
+TIME_WINDOW_HOURS = args.window_hours
 
 index = args.index
 fxswap_address = fxswap_addresses[index]["address"]
 name = fxswap_addresses[index]["name"]
 chain_name = fxswap_addresses[index]["chain_name"]
 
-json_file_path = f'data/{chain_name}/{fxswap_address}.json'
-with open(json_file_path, 'r') as f:
-    data = json.load(f)
+# Only the columns this plot uses are read from the Parquet store
+PLOT_COLUMNS = [
+    "last_prices",
+    "price_scale",
+    "price_oracle",
+    "donation_shares",
+    "last_donation_release_ts",
+    "totalSupply",
+    "virtual_price",
+    "xcp_profit",
+    "balances(0)",
+    "balances(1)",
+]
+# One block-indexed frame with a column per getter (see pool_history.py)
+frame = load_pool_frame(chain_name, fxswap_address, columns=PLOT_COLUMNS,
+                        last_hours=TIME_WINDOW_HOURS if args.window_only else None)
 
 def has_USDC(name):
     """
@@ -74,365 +104,87 @@ else:
 print(f"token0_decimals: {token0_decimals}")
 print(f"token1_decimals: {token1_decimals}")   
 
-# Parse the data from JSON
-last_prices_data = []
-price_scale_data = []
-price_oracle_data = []
-donation_shares_data = []
-donation_releases = []
-donation_reset_timestamps = []  # Track when last_donation_release_ts resets
+# Blocks are plotted if they have last_prices or price_scale (the JSON-era parser took the timestamp from these)
+frame = frame[frame['last_prices'].notna() | frame['price_scale'].notna()]
+
+# Per-metric frames: timestamp + value for the blocks where the getter was fetched
+last_prices_df = metric_frame(frame, 'last_prices', 'last_price')
+price_scale_df = metric_frame(frame, 'price_scale')
+price_oracle_df = metric_frame(frame, 'price_oracle')
+donation_shares_df = metric_frame(frame, 'donation_shares')
+total_supply_df = metric_frame(frame, 'totalSupply')
+# virtual_price and xcp_profit normalized: subtract 1 so they start at 0
+virtual_price_df = metric_frame(frame, 'virtual_price')
+virtual_price_df['virtual_price'] -= 1
+xcp_profit_df = metric_frame(frame, 'xcp_profit')
+xcp_profit_df['xcp_profit'] = (xcp_profit_df['xcp_profit'] - 1) / 2
+
+# Balances: blocks where at least one of the two was fetched
+has_balance = (frame['balances(0)'].notna() | frame['balances(1)'].notna()).to_numpy()
+balance_df = pd.DataFrame({
+    'timestamp': frame['timestamp'].to_numpy()[has_balance],
+    'balance_0': frame['balances(0)'].to_numpy()[has_balance],
+    'balance_1': frame['balances(1)'].to_numpy()[has_balance],
+})
+
+# Calculate delta_price_last_to_scale (in USD and %)
+has_both_prices = (frame['last_prices'].notna() & frame['price_scale'].notna()).to_numpy()
+delta_last_price = frame['last_prices'].to_numpy()[has_both_prices]
+delta_price_scale = frame['price_scale'].to_numpy()[has_both_prices]
+delta_usd = delta_last_price - delta_price_scale
+with np.errstate(divide='ignore', invalid='ignore'):
+    delta_percent = np.where(delta_price_scale != 0, delta_usd / delta_price_scale * 100, 0)
+delta_price_df = pd.DataFrame({
+    'timestamp': frame['timestamp'].to_numpy()[has_both_prices],
+    'delta_usd': delta_usd,
+    'delta_percent': delta_percent,
+})
+
+# Donation releases, resets (a new last_donation_release_ts) and the donation share usage (see donation_usage.py)
+is_release, is_reset = release_resets(frame['last_donation_release_ts'].to_numpy())
+donation_releases_df = pd.DataFrame({
+    'timestamp': frame['timestamp'].to_numpy()[is_release],
+    'release_time': epochs_to_timestamps(frame['last_donation_release_ts'].to_numpy()[is_release]),
+})
+donation_reset_timestamps = list(frame['timestamp'][is_reset])
 refuel_events = []  # Track refuel events with date, token amount, and USD value
-delta_price_data = []
-balance_data = []
-donation_shares_usd_data = []
-virtual_price_data = []
-total_supply_data = []  # Add totalSupply data extraction
-xcp_profit_data = []
-
-# Track previous last_donation_release_ts to detect resets
-# Reset detection: if last_donation_release_ts changes from previous value, it's a reset
-prev_release_ts = None
-# Track previous values for growth rate calculation
-prev_donation_shares = None
-prev_total_supply = None
-prev_donation_shares_normalized = None  # Track normalized value to maintain continuity
-
-# Process each block in the JSON
-for block_number, block_data in sorted(data.items(), key=lambda x: int(x[0])):
-    # Get timestamp from any field (they should all have the same epoch)
-    timestamp = None
-    if 'last_prices' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['last_prices']['epoch'])
-    elif 'price_scale' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['price_scale']['epoch'])
-    else:
-        continue  # Skip blocks without timestamp info
-    
-    # Extract last_prices
-    if 'last_prices' in block_data:
-        last_prices_data.append({
-            'timestamp': timestamp,
-            'last_price': block_data['last_prices']['value']
-        })
-    
-    # Extract price_scale
-    if 'price_scale' in block_data:
-        price_scale_data.append({
-            'timestamp': timestamp,
-            'price_scale': block_data['price_scale']['value']
-        })
-    
-    # Extract price_oracle
-    if 'price_oracle' in block_data:
-        price_oracle_data.append({
-            'timestamp': timestamp,
-            'price_oracle': block_data['price_oracle']['value']
-        })
-    
-    # Extract donation_shares (normalized value)
-    if 'donation_shares' in block_data:
-        donation_shares_data.append({
-            'timestamp': timestamp,
-            'donation_shares': block_data['donation_shares']['value']
-        })
-    
-    # Extract totalSupply
-    if 'totalSupply' in block_data:
-        total_supply_data.append({
-            'timestamp': timestamp,
-            'totalSupply': block_data['totalSupply']['value']
-        })
-    
-    # Extract virtual_price (normalized: subtract 1 so it starts at 0)
-    if 'virtual_price' in block_data:
-        virtual_price_data.append({
-            'timestamp': timestamp,
-            'virtual_price': block_data['virtual_price']['value'] - 1
-        })
-    
-    # Extract xcp_profit (normalized: subtract 1 so it starts at 0)
-    if 'xcp_profit' in block_data:
-        xcp_profit_data.append({
-            'timestamp': timestamp,
-            'xcp_profit': (block_data['xcp_profit']['value'] - 1) / 2
-        })
-    
-    # Extract balances
-    balance_0 = None
-    balance_1 = None
-    if 'balances(0)' in block_data:
-        balance_0 = block_data['balances(0)']['value']
-    if 'balances(1)' in block_data:
-        balance_1 = block_data['balances(1)']['value']
-    
-    if balance_0 is not None or balance_1 is not None:
-        balance_data.append({
-            'timestamp': timestamp,
-            'balance_0': balance_0,
-            'balance_1': balance_1
-        })
-    
-    # Extract last_donation_release_ts and track resets
-    if 'last_donation_release_ts' in block_data:
-        release_ts = block_data['last_donation_release_ts']['value']
-        # Check if it's a valid timestamp (not a very small number)
-        if release_ts > 1000000000:  # Valid unix timestamp (after 2001)
-            release_time = datetime.fromtimestamp(release_ts)
-            donation_releases.append({
-                'timestamp': timestamp,
-                'release_time': release_time
-            })
-            
-            # Detect reset: if last_donation_release_ts changes from previous value, it's a reset
-            # This works across all chains regardless of block time
-            is_reset = False
-            if prev_release_ts is not None and release_ts != prev_release_ts:
-                # Value changed from previous = reset detected
-                is_reset = True
-            
-            if is_reset:
-                donation_reset_timestamps.append(timestamp)
-                # Reset tracking for growth rate calculation when reset happens
-                if 'donation_shares' in block_data:
-                    prev_donation_shares = block_data['donation_shares']['value']
-                if 'totalSupply' in block_data:
-                    prev_total_supply = block_data['totalSupply']['value']
-                prev_donation_shares_normalized = None  # Reset normalized value
-            
-            # Update previous value
-            prev_release_ts = release_ts
-        elif prev_release_ts is not None and release_ts <= 1000000000:
-            # Value became invalid after being valid - this is also a reset
-            donation_reset_timestamps.append(timestamp)
-            prev_release_ts = None
-            # Reset tracking for growth rate calculation when reset happens
-            if 'donation_shares' in block_data:
-                prev_donation_shares = block_data['donation_shares']['value']
-            if 'totalSupply' in block_data:
-                prev_total_supply = block_data['totalSupply']['value']
-            prev_donation_shares_normalized = None  # Reset normalized value
-    
-    # Calculate delta_price_last_to_scale (in USD and %)
-    if 'last_prices' in block_data and 'price_scale' in block_data:
-        last_price = block_data['last_prices']['value']
-        price_scale = block_data['price_scale']['value']
-        delta_usd = last_price - price_scale
-        delta_percent = (delta_usd / price_scale) * 100 if price_scale != 0 else 0
-        
-        delta_price_data.append({
-            'timestamp': timestamp,
-            'delta_usd': delta_usd,
-            'delta_percent': delta_percent
-        })
-    
-    # Calculate donation shares normalized (0-1) and USD value
-    # Based on check_refuel_usdc_eth_pools.py lines 342-350
-    if ('donation_shares' in block_data and 
-        'totalSupply' in block_data and 
-        'balances(0)' in block_data and 
-        'balances(1)' in block_data and
-        'last_prices' in block_data):
-        
-        donation_shares = block_data['donation_shares']['value']
-        total_supply = block_data['totalSupply']['value']
-        balance_0 = block_data['balances(0)']['value']
-        balance_1 = block_data['balances(1)']['value']
-        last_price = block_data['last_prices']['value']
-        
-        # Normalize donation_shares based on growth rate comparison
-        # Key insight from contract: fees increase totalSupply but NOT donation_shares
-        # When shares are used (burned), both decrease proportionally
-        # So: if donation_shares grows at same rate as total_supply = no usage
-        #     if donation_shares grows slower = shares were used
-        donation_shares_normalized = None
-        donation_shares_used_delta = None  # Track how much was used (in shares)
-        
-        if prev_donation_shares is not None and prev_total_supply is not None and prev_total_supply > 0 and total_supply > 0:
-            # Calculate growth rate of total_supply
-            total_supply_growth_rate = (total_supply - prev_total_supply) / prev_total_supply
-            
-            # Calculate expected donation_shares if it grew at same rate as total_supply
-            # This accounts for fee inflation of totalSupply
-            expected_donation_shares = prev_donation_shares * (1 + total_supply_growth_rate)
-            
-            # Calculate actual growth rate of donation_shares
-            if prev_donation_shares > 0:
-                donation_shares_growth_rate = (donation_shares - prev_donation_shares) / prev_donation_shares
-            else:
-                donation_shares_growth_rate = 0
-            
-            # Tolerance for comparing growth rates (account for floating point precision)
-            growth_rate_tolerance = 1e-8
-            
-            # If donation_shares grew at same rate (or very close), no shares were used
-            if abs(donation_shares_growth_rate - total_supply_growth_rate) < growth_rate_tolerance:
-                # Same growth rate: normalized value stays constant (horizontal line)
-                if prev_donation_shares_normalized is not None:
-                    donation_shares_normalized = prev_donation_shares_normalized
-                else:
-                    # First data point: initialize to 1.0 (100% of shares available)
-                    donation_shares_normalized = 1.0
-                donation_shares_used_delta = 0
-            else:
-                # Different growth rates: calculate how much was used
-                # If expected > actual, the difference was used (burned)
-                donation_shares_used_delta = max(0, expected_donation_shares - donation_shares)
-                
-                # Update normalized value: decrease proportionally to usage
-                if prev_donation_shares_normalized is not None and prev_donation_shares > 0:
-                    # Calculate usage ratio relative to previous donation_shares
-                    usage_ratio = donation_shares_used_delta / prev_donation_shares if prev_donation_shares > 0 else 0
-                    # Decrease normalized value by usage ratio
-                    donation_shares_normalized = prev_donation_shares_normalized * (1 - usage_ratio)
-                    # Ensure it doesn't go negative
-                    donation_shares_normalized = max(0, donation_shares_normalized)
-                else:
-                    # First data point: start at 1.0, then adjust if there was usage
-                    if donation_shares_used_delta > 0 and prev_donation_shares > 0:
-                        usage_ratio = donation_shares_used_delta / prev_donation_shares
-                        donation_shares_normalized = 1.0 * (1 - usage_ratio)
-                    else:
-                        donation_shares_normalized = 1.0
-        else:
-            # First data point or missing previous values: initialize to 1.0
-            donation_shares_normalized = 1.0
-            donation_shares_used_delta = 0
-        
-        # Update previous values for next iteration
-        prev_donation_shares = donation_shares
-        prev_total_supply = total_supply
-        prev_donation_shares_normalized = donation_shares_normalized
-        
-        # Calculate USD value using current total_supply (original calculation)
-        # Values in JSON are already normalized (divided by decimals)
-
-        token0_amount_normalized = (donation_shares / total_supply) * balance_0
-        token1_amount_normalized = (donation_shares / total_supply) * balance_1
-
-        # Convert to USD
-        token0_usd = token0_amount_normalized
-        token1_usd = token1_amount_normalized * last_price
-
-        donation_shares_usd = token0_usd + token1_usd
-        
-        # Calculate USD value of used shares (delta)
-        donation_shares_used_usd = None
-        if donation_shares_used_delta is not None and donation_shares_used_delta > 0:
-            # Calculate USD value of the used shares
-            # Used shares as ratio of total supply
-            used_ratio = donation_shares_used_delta / total_supply if total_supply > 0 else 0
-            used_token0_amount = used_ratio * balance_0
-            used_token1_amount = used_ratio * balance_1
-            used_token0_usd = used_token0_amount
-            used_token1_usd = used_token1_amount * last_price
-            donation_shares_used_usd = used_token0_usd + used_token1_usd
-        
-        donation_shares_usd_data.append({
-            'timestamp': timestamp,
-            'donation_shares_normalized': donation_shares_normalized,
-            'donation_shares_usd': donation_shares_usd,
-            'donation_shares_used_delta': donation_shares_used_delta,
-            'donation_shares_used_usd': donation_shares_used_usd
-        })
-
-print(f"Found {len(last_prices_data)} last_prices entries")
-print(f"Found {len(price_scale_data)} price_scale entries")
-print(f"Found {len(price_oracle_data)} price_oracle entries")
-print(f"Found {len(donation_shares_data)} refuel_shares entries")
-print(f"Found {len(delta_price_data)} delta_price entries")
-print(f"Found {len(balance_data)} balance entries")
-print(f"Found {len(donation_releases)} refuel_release entries")
+donation_shares_usd_df = donation_usage(frame)
+
+print(f"Found {len(last_prices_df)} last_prices entries")
+print(f"Found {len(price_scale_df)} price_scale entries")
+print(f"Found {len(price_oracle_df)} price_oracle entries")
+print(f"Found {len(donation_shares_df)} refuel_shares entries")
+print(f"Found {len(delta_price_df)} delta_price entries")
+print(f"Found {len(balance_df)} balance entries")
+print(f"Found {len(donation_releases_df)} refuel_release entries")
 print(f"Found {len(donation_reset_timestamps)} refuel reset events")
-print(f"Found {len(donation_shares_usd_data)} refuel_shares_usd entries")
-print(f"Found {len(virtual_price_data)} virtual_price entries")
-print(f"Found {len(total_supply_data)} totalSupply entries")
-print(f"Found {len(xcp_profit_data)} xcp_profit entries")
-
-# Create DataFrames
-last_prices_df = pd.DataFrame(last_prices_data)
-price_scale_df = pd.DataFrame(price_scale_data)
-price_oracle_df = pd.DataFrame(price_oracle_data)
-donation_shares_df = pd.DataFrame(donation_shares_data)
-delta_price_df = pd.DataFrame(delta_price_data)
-balance_df = pd.DataFrame(balance_data)
-donation_releases_df = pd.DataFrame(donation_releases)
-donation_shares_usd_df = pd.DataFrame(donation_shares_usd_data)
-virtual_price_df = pd.DataFrame(virtual_price_data)
-total_supply_df = pd.DataFrame(total_supply_data)
-xcp_profit_df = pd.DataFrame(xcp_profit_data)
-
-# Remove duplicates and sort
-if not last_prices_df.empty:
-    last_prices_df = last_prices_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not price_scale_df.empty:
-    price_scale_df = price_scale_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not price_oracle_df.empty:
-    price_oracle_df = price_oracle_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not donation_shares_df.empty:
-    donation_shares_df = donation_shares_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not delta_price_df.empty:
-    delta_price_df = delta_price_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not balance_df.empty:
-    balance_df = balance_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
+print(f"Found {len(donation_shares_usd_df)} refuel_shares_usd entries")
+print(f"Found {len(virtual_price_df)} virtual_price entries")
+print(f"Found {len(total_supply_df)} totalSupply entries")
+print(f"Found {len(xcp_profit_df)} xcp_profit entries")
+
 if not donation_releases_df.empty:
     donation_releases_df = donation_releases_df.drop_duplicates(subset=['release_time']).sort_values('timestamp')
-if not donation_shares_usd_df.empty:
-    donation_shares_usd_df = donation_shares_usd_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not virtual_price_df.empty:
-    virtual_price_df = virtual_price_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not total_supply_df.empty:
-    total_supply_df = total_supply_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not xcp_profit_df.empty:
-    xcp_profit_df = xcp_profit_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
 
 # Calculate donation shares delta (change from previous value) - same as plot_supply_shares.py
 if not donation_shares_df.empty:
     donation_shares_df = donation_shares_df.copy()
-    donation_shares_df['delta'] = donation_shares_df['donation_shares'].diff()
-    donation_shares_df['delta'] = donation_shares_df['delta'].fillna(0)  # First value has no previous, set to 0
-    
-    # Filter: only show negative values (exclude zero and positive)
-    # Remove all positive values and zero to focus only on negative changes (share usage)
-    donation_shares_df['delta_filtered'] = donation_shares_df['delta'].copy()
-    donation_shares_df.loc[donation_shares_df['delta'] >= 0, 'delta_filtered'] = 0
-    
-    # Calculate USD value for deltas
-    # Merge with totalSupply, balances, and last_prices to calculate USD value
-    if not total_supply_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, total_supply_df, on='timestamp', how='left', suffixes=('', '_total'))
-    
-    # Split balance_df into balance_0_df and balance_1_df for merging
-    balance_0_df = balance_df[['timestamp', 'balance_0']].copy() if not balance_df.empty else pd.DataFrame()
-    balance_1_df = balance_df[['timestamp', 'balance_1']].copy() if not balance_df.empty else pd.DataFrame()
-    
-    if not balance_0_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, balance_0_df, on='timestamp', how='left', suffixes=('', '_b0'))
-    
-    if not balance_1_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, balance_1_df, on='timestamp', how='left', suffixes=('', '_b1'))
-    
-    if not last_prices_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, last_prices_df, on='timestamp', how='left', suffixes=('', '_price'))
-    
-    # Calculate USD value of delta
-    # USD value = (delta / totalSupply) * (balance_0 + balance_1 * last_price)
-    donation_shares_df['delta_usd'] = donation_shares_df.apply(
-        lambda row: (
-            (abs(row['delta_filtered']) / row['totalSupply'] * row['balance_0']) +
-            (abs(row['delta_filtered']) / row['totalSupply'] * row['balance_1'] * row['last_price'])
-        ) if (row['delta_filtered'] != 0 and pd.notna(row['totalSupply']) and row['totalSupply'] > 0 and 
-              pd.notna(row['balance_0']) and pd.notna(row['balance_1']) and pd.notna(row['last_price'])) else 0,
-        axis=1
-    )
-    
-    # Calculate moving average of USD spend
-    # Sort by timestamp and set as index for rolling window
-    donation_shares_df = donation_shares_df.sort_values('timestamp').copy()
-    donation_shares_df.set_index('timestamp', inplace=True)
-    # Calculate rolling mean
-    donation_shares_df['delta_usd_ma'] = donation_shares_df['delta_usd'].rolling(window='2h', min_periods=1).mean()
-    donation_shares_df.reset_index(inplace=True)
-    
+    # delta, delta_filtered, delta_usd and its 2h moving average are stored next to the pool history
+    # and only computed for the blocks added since the last run (see derived_store.py and pool_metrics.py)
+    update_derived(REFUEL_DELTA_METRICS, chain_name, fxswap_address, rebuild=args.rebuild_metrics)
+    refuel_delta = load_derived(REFUEL_DELTA_METRICS, chain_name, fxswap_address,
+                                start_time=int(frame['epoch'].iloc[0]))
+    donation_rows = frame['donation_shares'].notna().to_numpy()
+    refuel_delta = refuel_delta.reindex(frame.index[donation_rows])
+    for column in ('delta', 'delta_filtered', 'delta_usd', 'delta_usd_ma'):
+        donation_shares_df[column] = refuel_delta[column].to_numpy()
+
+    # totalSupply, balances and last_prices of the same blocks (no timestamp merges needed with the frame)
+    donation_shares_df['totalSupply'] = frame['totalSupply'].to_numpy()[donation_rows]
+    donation_shares_df['balance_0'] = frame['balances(0)'].to_numpy()[donation_rows]
+    donation_shares_df['balance_1'] = frame['balances(1)'].to_numpy()[donation_rows]
+    donation_shares_df['last_price'] = frame['last_prices'].to_numpy()[donation_rows]
+
     # Track refuel events: find all positive deltas (when donation_shares increases)
     # This catches all increases, even if they happen across multiple blocks
     positive_deltas = donation_shares_df[donation_shares_df['delta'] > 0].copy()
@@ -513,7 +265,7 @@ def calculate_figure_dimensions(dataframes_list):
 def create_refuel_chart(
     last_prices_df, price_scale_df, xcp_profit_df, virtual_price_df,
     donation_shares_df, delta_price_df, donation_reset_timestamps,
-    figure_width_cm, name, output_path, plot_description=""
+    figure_width_cm, name, output_path, plot_description="", full_resolution=False
 ):
     """
     Create a 5-subplot refuel analysis chart.
@@ -530,10 +282,19 @@ def create_refuel_chart(
         name: Pool name for titles
         output_path: Path to save the chart
         plot_description: Optional description for logging (e.g., "Full plot", "48-hour plot")
+        full_resolution: Draw every sample; by default each series is reduced to a few points per
+            pixel column (see downsample.py), refuel bars, labels and reset lines are always exact
 
     Returns:
         tuple: (figure, figure_width_pixels) - The matplotlib figure object and width in pixels
     """
+    # Rows of a series to draw: at most a few per pixel column of the plot area
+    plot_width_pixels = (figure_width_cm / 2.54) * _INTERNAL_DPI * PLOT_AREA_RATIO
+    def visible(df, column, method='minmax'):
+        if full_resolution:
+            return df
+        return downsample(df, 'timestamp', column, plot_width_pixels, method=method)
+
     # Chart height ratios
     refueling_chart_height_ratio = 2
     regular_chart_height_ratio = 18
@@ -551,10 +312,12 @@ def create_refuel_chart(
 
     # ===== Chart 0: Spot and Scale Prices =====
     if not last_prices_df.empty:
-        ax0.plot(last_prices_df['timestamp'], last_prices_df['last_price'],
+        last_prices_rows = visible(last_prices_df, 'last_price')
+        ax0.plot(last_prices_rows['timestamp'], last_prices_rows['last_price'],
                 color=BLUE, label='spot price', linestyle='None', marker=MAKER, markersize=MARKER_SIZE)
     if not price_scale_df.empty:
-        ax0.plot(price_scale_df['timestamp'], price_scale_df['price_scale'],
+        price_scale_rows = visible(price_scale_df, 'price_scale')
+        ax0.plot(price_scale_rows['timestamp'], price_scale_rows['price_scale'],
                 color=GREEN, label='price scale', linestyle='None', marker=MAKER, markersize=MARKER_SIZE)
 
     # Add Price % of Max to chart 0
@@ -587,7 +350,8 @@ def create_refuel_chart(
 
     # ===== Chart 1: xcp_profit and virtual_price =====
     if not xcp_profit_df.empty:
-        ax1.plot(xcp_profit_df['timestamp'], xcp_profit_df['xcp_profit'],
+        xcp_profit_rows = visible(xcp_profit_df, 'xcp_profit')
+        ax1.plot(xcp_profit_rows['timestamp'], xcp_profit_rows['xcp_profit'],
                 'green', linestyle='None', marker=MAKER, markersize=MARKER_SIZE,
                 alpha=0.7, label='xcp_profit')
 
@@ -596,7 +360,7 @@ def create_refuel_chart(
         value_changed = virtual_price_df_sorted['virtual_price'].diff().abs() > 1e-10
         value_changed.iloc[0] = True
 
-        changed_data = virtual_price_df_sorted[value_changed]
+        changed_data = visible(virtual_price_df_sorted[value_changed], 'virtual_price')
         if not changed_data.empty:
             ax1.plot(changed_data['timestamp'], changed_data['virtual_price'],
                     'red', marker=MAKER, markersize=MARKER_SIZE, linestyle='None',
@@ -654,8 +418,9 @@ def create_refuel_chart(
         if not donation_shares_df.empty and 'donation_shares' in donation_shares_df.columns:
             ax3_twin_normalized = ax3.twinx()
             ax3_twin_normalized.spines['right'].set_position(('outward', 60))
-            ax3_twin_normalized.plot(donation_shares_df['timestamp'],
-                                   donation_shares_df['donation_shares'],
+            donation_shares_rows = visible(donation_shares_df, 'donation_shares', method='lttb')
+            ax3_twin_normalized.plot(donation_shares_rows['timestamp'],
+                                   donation_shares_rows['donation_shares'],
                                    'black', label='refuel_shares', linestyle='-',
                                    linewidth=1.0, alpha=0.7)
             max_shares = donation_shares_df['donation_shares'].max()
@@ -670,8 +435,9 @@ def create_refuel_chart(
                 ax3_twin_delta.spines['right'].set_position(('outward', 0))
             else:
                 ax3_twin_delta = ax3.twinx()
-            ax3_twin_delta.plot(donation_shares_df['timestamp'],
-                              donation_shares_df['delta_usd_ma'],
+            delta_usd_ma_rows = visible(donation_shares_df, 'delta_usd_ma')
+            ax3_twin_delta.plot(delta_usd_ma_rows['timestamp'],
+                              delta_usd_ma_rows['delta_usd_ma'],
                               'orange', label='2h MA USD Spend', linestyle='None',
                               marker=MAKER, markersize=MARKER_SIZE, alpha=0.8)
             ax3_twin_delta.set_ylabel('2h Moving Average USD Spend', fontsize=12, color='orange')
@@ -701,8 +467,9 @@ def create_refuel_chart(
         ax3_twin_normalized = None
         if not donation_shares_df.empty and 'donation_shares' in donation_shares_df.columns:
             ax3_twin_normalized = ax3.twinx()
-            ax3_twin_normalized.plot(donation_shares_df['timestamp'],
-                                   donation_shares_df['donation_shares'],
+            donation_shares_rows = visible(donation_shares_df, 'donation_shares', method='lttb')
+            ax3_twin_normalized.plot(donation_shares_rows['timestamp'],
+                                   donation_shares_rows['donation_shares'],
                                    'black', label='refuel_shares', linestyle='-',
                                    linewidth=1.0, alpha=0.7)
             max_shares = donation_shares_df['donation_shares'].max()
@@ -726,12 +493,12 @@ def create_refuel_chart(
     # ===== Chart 4: Delta price =====
     ax4_twin = None
     if not delta_price_df.empty:
-        delta_usd_data = delta_price_df[delta_price_df['delta_usd'].notna()]
+        delta_usd_data = visible(delta_price_df[delta_price_df['delta_usd'].notna()], 'delta_usd')
         if not delta_usd_data.empty:
             ax4.plot(delta_usd_data['timestamp'], delta_usd_data['delta_usd'],
                     'c', label='Delta (USD)', linestyle='None', marker=MAKER, markersize=MARKER_SIZE)
 
-        delta_percent_data = delta_price_df[delta_price_df['delta_percent'].notna()]
+        delta_percent_data = visible(delta_price_df[delta_price_df['delta_percent'].notna()], 'delta_percent')
         if not delta_percent_data.empty:
             ax4_twin = ax4.twinx()
             ax4_twin.axhspan(-2, 2, color='blue', alpha=0.2, zorder=0)
@@ -803,19 +570,35 @@ dataframes_for_dimension_calc = [
     last_prices_df, price_scale_df, price_oracle_df, donation_shares_df,
     delta_price_df, balance_df, donation_shares_usd_df, virtual_price_df, total_supply_df
 ]
-figure_width_cm, figure_width_pixels, time_info = calculate_figure_dimensions(dataframes_for_dimension_calc)
-print(f"Full plot: {time_info}, width: {figure_width_pixels:.0f} px ({figure_width_cm:.1f} cm)")
-
-# ===== Create full version chart =====
 plot_dir = Path("plots") / chain_name
 plot_dir.mkdir(parents=True, exist_ok=True)
 
-output_path = plot_dir / f'{name.replace("/", "_").replace(" ", "")}_refuel_analysis_all.png'
-fig, _ = create_refuel_chart(
-    last_prices_df, price_scale_df, xcp_profit_df, virtual_price_df,
-    donation_shares_df, delta_price_df, donation_reset_timestamps,
-    figure_width_cm, name, output_path, plot_description="Full chart"
-)
+# ===== Create full version chart =====
+# (skipped with --window-only, only the window was loaded)
+if not args.window_only:
+    figure_width_cm, figure_width_pixels, time_info = calculate_figure_dimensions(dataframes_for_dimension_calc)
+    print(f"Full plot: {time_info}, width: {figure_width_pixels:.0f} px ({figure_width_cm:.1f} cm)")
+
+    # Prices from the coarsest pre-aggregated level that still has a bucket per pixel column (see pool_pyramid.py)
+    last_prices_all, price_scale_all = last_prices_df, price_scale_df
+    if not args.full_resolution and not frame.empty:
+        span_seconds = int(frame['epoch'].iloc[-1] - frame['epoch'].iloc[0])
+        level = pick_level(span_seconds, (figure_width_cm / 2.54) * _INTERNAL_DPI * PLOT_AREA_RATIO,
+                           sample_spacing(frame['epoch']))
+        if level is not None:
+            update_pyramid(chain_name, fxswap_address, rebuild=args.rebuild_metrics, levels=[level])
+            buckets = load_level(level, chain_name, fxswap_address)
+            last_prices_all = range_points(buckets, 'price_high', 'price_low', 'last_price', level)
+            price_scale_all = range_points(buckets, 'price_scale_high', 'price_scale_low', 'price_scale', level)
+            print(f"Full plot prices from the {level} pre-aggregates: {len(buckets)} buckets")
+
+    output_path = plot_dir / f'{name.replace("/", "_").replace(" ", "")}_refuel_analysis_all.png'
+    fig, _ = create_refuel_chart(
+        last_prices_all, price_scale_all, xcp_profit_df, virtual_price_df,
+        donation_shares_df, delta_price_df, donation_reset_timestamps,
+        figure_width_cm, name, output_path, plot_description="Full chart",
+        full_resolution=args.full_resolution
+    )
 
 # ===== Create TIME_WINDOW version chart =====
 # Calculate timestamps for filtering
@@ -824,7 +607,8 @@ for df in dataframes_for_dimension_calc:
     if not df.empty and 'timestamp' in df.columns:
         all_timestamps.extend(df['timestamp'].tolist())
 
-if all_timestamps:
+# (skipped with --full-only)
+if all_timestamps and not args.full_only:
     max_time_window = max(all_timestamps)
     min_time_window = max_time_window - timedelta(hours=TIME_WINDOW_HOURS)
 
@@ -854,7 +638,8 @@ if all_timestamps:
         last_prices_df_window, price_scale_df_window, xcp_profit_df_window, virtual_price_df_window,
         donation_shares_df_window, delta_price_df_window, donation_reset_timestamps_window,
         figure_width_cm_window, name, output_path_window,
-        plot_description=f"{TIME_WINDOW_HOURS}-hour window chart"
+        plot_description=f"{TIME_WINDOW_HOURS}-hour window chart",
+        full_resolution=args.full_resolution
     )
     plt.close(fig_window)
 
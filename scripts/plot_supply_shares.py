@@ -15,6 +15,7 @@ import numpy as np
 import json
 import argparse
 from pathlib import Path
+from pool_history import load_pool_frame, metric_frame
 import os
 
 DATA_DIR = Path(os.getenv('DATA_DIR', 'data'))
@@ -49,137 +50,62 @@ else:
 # Parse command line arguments
 parser = argparse.ArgumentParser(description='Plot supply and shares data')
 parser.add_argument('--index', type=int, default=0, help='Index of the pool to query (default: 0)')
+parser.add_argument('--last-hours', type=int, default=None,
+                    help='Only plot the last N hours; reads just that window from the store (default: whole history)')
 args = parser.parse_args()
 
 index = args.index
 fxswap_address = fxswap_addresses[index]["address"]
 name = fxswap_addresses[index]["name"]
 chain_name = fxswap_addresses[index]["chain_name"]
-json_file_path = f'data/{chain_name}/{fxswap_address}.json'
-with open(json_file_path, 'r') as f:
-    data = json.load(f)
+# Only the columns this plot uses are read from the Parquet store
+PLOT_COLUMNS = [
+    "last_prices",
+    "donation_shares",
+    "fee",
+    "totalSupply",
+    "user_supply",
+    "balances(0)",
+    "balances(1)",
+]
+# One block-indexed frame with a column per getter (see pool_history.py)
+frame = load_pool_frame(chain_name, fxswap_address, columns=PLOT_COLUMNS, last_hours=args.last_hours)
 
 # Token decimals (USDC=6, WETH=18)
 token0_decimals = 18
 token1_decimals = 18
 
-# Parse the data from JSON
-donation_shares_data = []
-user_supply_data = []
-total_supply_data = []
-balance_0_data = []
-balance_1_data = []
-last_prices_data = []
-fee_data = []
-
-# Process each block in the JSON
-for block_number, block_data in sorted(data.items(), key=lambda x: int(x[0])):
-    # Get timestamp from any field
-    timestamp = None
-    if 'donation_shares' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['donation_shares']['epoch'])
-    elif 'user_supply' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['user_supply']['epoch'])
-    elif 'totalSupply' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['totalSupply']['epoch'])
-    elif 'balances(0)' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['balances(0)']['epoch'])
-    elif 'last_prices' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['last_prices']['epoch'])
-    elif 'fee' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['fee']['epoch'])
-    else:
-        continue
-    
-    # Extract donation_shares
-    if 'donation_shares' in block_data:
-        donation_shares_data.append({
-            'timestamp': timestamp,
-            'donation_shares': block_data['donation_shares']['value']
-        })
-    
-    # Extract user_supply
-    if 'user_supply' in block_data:
-        user_supply_data.append({
-            'timestamp': timestamp,
-            'user_supply': block_data['user_supply']['value']
-        })
-    
-    # Extract totalSupply
-    if 'totalSupply' in block_data:
-        total_supply_data.append({
-            'timestamp': timestamp,
-            'totalSupply': block_data['totalSupply']['value']
-        })
-    
-    # Extract balances(0) - USDC
-    if 'balances(0)' in block_data:
-        balance_0_data.append({
-            'timestamp': timestamp,
-            'balance_0': block_data['balances(0)']['value']
-        })
-    
-    # Extract balances(1) - WETH
-    if 'balances(1)' in block_data:
-        balance_1_data.append({
-            'timestamp': timestamp,
-            'balance_1': block_data['balances(1)']['value']
-        })
-    
-    # Extract last_prices for USD calculations
-    if 'last_prices' in block_data:
-        last_prices_data.append({
-            'timestamp': timestamp,
-            'last_price': block_data['last_prices']['value']
-        })
-    
-    # Extract fee
-    if 'fee' in block_data:
-        fee_data.append({
-            'timestamp': timestamp,
-            'fee': block_data['fee']['value']
-        })
-
-print(f"Found {len(donation_shares_data)} donation_shares entries")
-print(f"Found {len(user_supply_data)} user_supply entries")
-print(f"Found {len(total_supply_data)} totalSupply entries")
-print(f"Found {len(balance_0_data)} balance_0 entries")
-print(f"Found {len(balance_1_data)} balance_1 entries")
-print(f"Found {len(last_prices_data)} last_prices entries")
-print(f"Found {len(fee_data)} fee entries")
-
-# Create DataFrames
-donation_shares_df = pd.DataFrame(donation_shares_data)
-user_supply_df = pd.DataFrame(user_supply_data)
-total_supply_df = pd.DataFrame(total_supply_data)
-balance_0_df = pd.DataFrame(balance_0_data)
-balance_1_df = pd.DataFrame(balance_1_data)
-last_prices_df = pd.DataFrame(last_prices_data)
-fee_df = pd.DataFrame(fee_data)
-
-# Remove duplicates and sort
-if not donation_shares_df.empty:
-    donation_shares_df = donation_shares_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not user_supply_df.empty:
-    user_supply_df = user_supply_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not total_supply_df.empty:
-    total_supply_df = total_supply_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not balance_0_df.empty:
-    balance_0_df = balance_0_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not balance_1_df.empty:
-    balance_1_df = balance_1_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not last_prices_df.empty:
-    last_prices_df = last_prices_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-if not fee_df.empty:
-    fee_df = fee_df.drop_duplicates(subset=['timestamp']).sort_values('timestamp')
+# Blocks are plotted if any of these getters was fetched (balances(1) alone carries no timestamp in the JSON-era parser)
+frame = frame[frame[['donation_shares', 'user_supply', 'totalSupply', 'balances(0)', 'last_prices', 'fee']].notna().any(axis=1)]
+
+# Per-metric frames: timestamp + value for the blocks where the getter was fetched
+donation_shares_df = metric_frame(frame, 'donation_shares')
+user_supply_df = metric_frame(frame, 'user_supply')
+total_supply_df = metric_frame(frame, 'totalSupply')
+balance_0_df = metric_frame(frame, 'balances(0)', 'balance_0')
+balance_1_df = metric_frame(frame, 'balances(1)', 'balance_1')
+last_prices_df = metric_frame(frame, 'last_prices', 'last_price')
+fee_df = metric_frame(frame, 'fee')
+
+print(f"Found {len(donation_shares_df)} donation_shares entries")
+print(f"Found {len(user_supply_df)} user_supply entries")
+print(f"Found {len(total_supply_df)} totalSupply entries")
+print(f"Found {len(balance_0_df)} balance_0 entries")
+print(f"Found {len(balance_1_df)} balance_1 entries")
+print(f"Found {len(last_prices_df)} last_prices entries")
+print(f"Found {len(fee_df)} fee entries")
 
 # Calculate USD values for balances
 # Merge balances with last_prices to calculate USD values
 if not balance_0_df.empty and not balance_1_df.empty and not last_prices_df.empty:
-    # Merge all balance and price data
-    balance_usd_df = pd.merge(balance_0_df, balance_1_df, on='timestamp', how='outer', suffixes=('', '_1'))
-    balance_usd_df = pd.merge(balance_usd_df, last_prices_df, on='timestamp', how='outer', suffixes=('', '_price'))
-    balance_usd_df = balance_usd_df.sort_values('timestamp')
+    # Balance and price data of every block that has at least one of them
+    balance_rows = frame[['balances(0)', 'balances(1)', 'last_prices']].notna().any(axis=1).to_numpy()
+    balance_usd_df = pd.DataFrame({
+        'timestamp': frame['timestamp'].to_numpy()[balance_rows],
+        'balance_0': frame['balances(0)'].to_numpy()[balance_rows],
+        'balance_1': frame['balances(1)'].to_numpy()[balance_rows],
+        'last_price': frame['last_prices'].to_numpy()[balance_rows],
+    })
     
     # Calculate USD values
     # balance_0 is USDC, so USD value = balance_0 (already in USD)
@@ -247,18 +173,12 @@ if not donation_shares_df.empty:
     donation_shares_df.loc[donation_shares_df['delta'] >= 0, 'delta_filtered'] = 0
     
     # Calculate USD value for deltas
-    # Merge with totalSupply, balances, and last_prices to calculate USD value
-    if not total_supply_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, total_supply_df, on='timestamp', how='left', suffixes=('', '_total'))
-    
-    if not balance_0_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, balance_0_df, on='timestamp', how='left', suffixes=('', '_b0'))
-    
-    if not balance_1_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, balance_1_df, on='timestamp', how='left', suffixes=('', '_b1'))
-    
-    if not last_prices_df.empty:
-        donation_shares_df = pd.merge(donation_shares_df, last_prices_df, on='timestamp', how='left', suffixes=('', '_price'))
+    # totalSupply, balances and last_prices of the same blocks (no timestamp merges needed with the frame)
+    donation_rows = frame['donation_shares'].notna().to_numpy()
+    donation_shares_df['totalSupply'] = frame['totalSupply'].to_numpy()[donation_rows]
+    donation_shares_df['balance_0'] = frame['balances(0)'].to_numpy()[donation_rows]
+    donation_shares_df['balance_1'] = frame['balances(1)'].to_numpy()[donation_rows]
+    donation_shares_df['last_price'] = frame['last_prices'].to_numpy()[donation_rows]
     
     # Calculate USD value of delta
     # USD value = (delta / totalSupply) * (balance_0 + balance_1 * last_price)
@@ -395,7 +315,8 @@ plot_dir = Path("plots") / chain_name
 plot_dir.mkdir(parents=True, exist_ok=True)
 
 
-output_path = plot_dir / f'{name.replace("/", "_").replace(" ", "")}_secondary_refuel_analysis.png' 
+window_suffix = f'_{args.last_hours}h' if args.last_hours is not None else ''
+output_path = plot_dir / f'{name.replace("/", "_").replace(" ", "")}_secondary_refuel_analysis{window_suffix}.png' 
 plt.savefig(output_path, dpi=_INTERNAL_DPI, bbox_inches=None)
 print(f"Chart saved to: {output_path} ({figure_width_pixels:.0f} x {int((FIGURE_HEIGHT_CM*3/2.54)*_INTERNAL_DPI)} px)")
 
@@ -1,11 +1,16 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from datetime import datetime, timedelta
+from datetime import timedelta
 import numpy as np
 import json
 import argparse
 from pathlib import Path
+from pool_store import store_exists
+from pool_history import load_pool_frame
+from derived_store import update_derived, load_derived
+from pool_metrics import VOLATILITY_PRICE_METRICS, VOLATILITY_DONATION_METRICS
+from pool_pyramid import update_pyramid, load_level, pick_level, range_points, sample_spacing
 import seaborn as sns
 from scipy import stats
 
@@ -47,6 +52,8 @@ else:
 # Parse command line arguments
 parser = argparse.ArgumentParser(description='Analyze volatility and rebalancing costs for fxswap pools')
 parser.add_argument('--index', type=int, default=0, help='Index of the pool to query (default: 0)')
+parser.add_argument('--rebuild-metrics', action='store_true',
+                    help='Recompute the stored derived metrics from the whole history instead of only the new blocks')
 args = parser.parse_args()
 
 index = args.index
@@ -94,22 +101,33 @@ except ValueError as e:
 
 # Security: Use Path objects and resolve to prevent path traversal
 base_data_dir = Path("data")
+# Parquet store (main file and write-ahead segments), or the legacy JSON cache if the pool has not been converted yet
+store_file_path = (base_data_dir / safe_chain_name / f"{safe_address}.parquet").resolve()
 json_file_path = (base_data_dir / safe_chain_name / f"{safe_address}.json").resolve()
 
-# Security: Ensure the resolved path is still within the base_data_dir
-try:
-    json_file_path.relative_to(base_data_dir.resolve())
-except ValueError:
-    print(f"Error: Path traversal detected! Refusing to access: {json_file_path}")
-    exit(1)
+# Security: Ensure the resolved paths are still within the base_data_dir
+for data_file_path in (store_file_path, json_file_path):
+    try:
+        data_file_path.relative_to(base_data_dir.resolve())
+    except ValueError:
+        print(f"Error: Path traversal detected! Refusing to access: {data_file_path}")
+        exit(1)
 
 # Security: Check file exists before opening
-if not json_file_path.exists():
-    print(f"Error: Data file not found: {json_file_path}")
+if not store_exists(store_file_path) and not json_file_path.exists():
+    print(f"Error: Data file not found: {store_file_path}")
     exit(1)
 
-with open(json_file_path, 'r') as f:
-    data = json.load(f)
+# Only the columns this script reads directly (TVL); the derived metrics load their own
+PLOT_COLUMNS = [
+    "last_prices",
+    "price_scale",
+    "totalSupply",
+    "balances(0)",
+    "balances(1)",
+]
+# One block-indexed frame with a column per getter (see pool_history.py)
+frame = load_pool_frame(safe_chain_name, safe_address, columns=PLOT_COLUMNS, data_dir=base_data_dir)
 
 def has_USDC(name):
     """Returns True if 'USDC' appears anywhere in the input pool name."""
@@ -127,78 +145,37 @@ else:
 print(f"Analyzing pool: {name}")
 print(f"token0_decimals: {token0_decimals}, token1_decimals: {token1_decimals}")
 
-# Parse the data from JSON
-price_data = []
-donation_data = []
-balance_data = []
-supply_data = []
-
-# Track previous values for rebalancing detection
-prev_release_ts = None
-
-for block_number, block_data in sorted(data.items(), key=lambda x: int(x[0])):
-    # Get timestamp
-    timestamp = None
-    if 'last_prices' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['last_prices']['epoch'])
-    elif 'price_scale' in block_data:
-        timestamp = datetime.fromtimestamp(block_data['price_scale']['epoch'])
-    else:
-        continue
-
-    # Extract price data
-    if 'last_prices' in block_data and 'price_scale' in block_data and 'price_oracle' in block_data:
-        price_data.append({
-            'timestamp': timestamp,
-            'last_price': block_data['last_prices']['value'],
-            'price_scale': block_data['price_scale']['value'],
-            'price_oracle': block_data['price_oracle']['value']
-        })
-
-    # Extract donation/rebalancing data
-    if 'donation_shares' in block_data and 'last_donation_release_ts' in block_data:
-        release_ts = block_data['last_donation_release_ts']['value']
-        is_rebalance = False
-
-        # Detect rebalancing event (when last_donation_release_ts changes)
-        if prev_release_ts is not None and release_ts != prev_release_ts and release_ts > 1000000000:
-            is_rebalance = True
-
-        donation_data.append({
-            'timestamp': timestamp,
-            'donation_shares': block_data['donation_shares']['value'],
-            'is_rebalance': is_rebalance
-        })
-
-        if release_ts > 1000000000:
-            prev_release_ts = release_ts
-
-    # Extract balance and supply data
-    if ('balances(0)' in block_data and 'balances(1)' in block_data and
-        'totalSupply' in block_data and 'last_prices' in block_data):
-
-        balance_0 = block_data['balances(0)']['value']
-        balance_1 = block_data['balances(1)']['value']
-        total_supply = block_data['totalSupply']['value']
-        last_price = block_data['last_prices']['value']
-
-        # Calculate TVL in USD
-        token0_usd = balance_0
-        token1_usd = balance_1 * last_price
-        tvl_usd = token0_usd + token1_usd
-
-        supply_data.append({
-            'timestamp': timestamp,
-            'balance_0': balance_0,
-            'balance_1': balance_1,
-            'totalSupply': total_supply,
-            'tvl_usd': tvl_usd
-        })
-
-# Create DataFrames
-price_df = pd.DataFrame(price_data).drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-donation_df = pd.DataFrame(donation_data).drop_duplicates(subset=['timestamp']).sort_values('timestamp')
-supply_df = pd.DataFrame(supply_data).drop_duplicates(subset=['timestamp']).sort_values('timestamp')
+# Blocks are analyzed if they have last_prices or price_scale (the JSON-era parser took the timestamp from these)
+frame = frame[frame['last_prices'].notna() | frame['price_scale'].notna()]
+timestamps = frame['timestamp'].to_numpy()
+
+# Balance and supply data: blocks with both balances, totalSupply and last_prices
+supply_rows = frame[['balances(0)', 'balances(1)', 'totalSupply', 'last_prices']].notna().all(axis=1).to_numpy()
+balance_0_values = frame['balances(0)'].to_numpy()
+balance_1_values = frame['balances(1)'].to_numpy()
+# Calculate TVL in USD
+tvl_values = balance_0_values + balance_1_values * frame['last_prices'].to_numpy()
+supply_df = pd.DataFrame({
+    'timestamp': timestamps[supply_rows],
+    'balance_0': balance_0_values[supply_rows],
+    'balance_1': balance_1_values[supply_rows],
+    'totalSupply': frame['totalSupply'].to_numpy()[supply_rows],
+    'tvl_usd': tvl_values[supply_rows],
+})
+
+# Returns, rolling volatility, rebalance events and costs are stored next to the pool history and
+# only computed for the blocks added since the last run (see derived_store.py and pool_metrics.py)
+for metrics in (VOLATILITY_PRICE_METRICS, VOLATILITY_DONATION_METRICS):
+    update_derived(metrics, safe_chain_name, safe_address, data_dir=base_data_dir, rebuild=args.rebuild_metrics)
+price_df = load_derived(VOLATILITY_PRICE_METRICS, safe_chain_name, safe_address, data_dir=base_data_dir)[[
+    'timestamp', 'last_price', 'price_scale', 'price_oracle', 'returns', 'log_returns', 'price_range',
+    'price_range_pct', 'volatility_std', 'volatility_realized', 'volatility_mad', 'high_7d', 'low_7d',
+    'volatility_range', 'cv', 'delta_price', 'delta_price_pct', 'delta_abs_ma',
+]].reset_index(drop=True)
+donation_df = load_derived(VOLATILITY_DONATION_METRICS, safe_chain_name, safe_address, data_dir=base_data_dir)[[
+    'timestamp', 'donation_shares', 'is_rebalance', 'donation_delta', 'shares_used', 'balance_0', 'balance_1',
+    'totalSupply', 'tvl_usd', 'cost_usd', 'cost_pct_tvl', 'cost_usd_7d', 'cost_pct_tvl_7d', 'rebalance_count_7d',
+]].reset_index(drop=True)
 
 print(f"Found {len(price_df)} price entries")
 print(f"Found {len(donation_df)} donation entries")
@@ -208,83 +185,6 @@ if price_df.empty:
     print("ERROR: No price data found. Cannot calculate volatility.")
     exit(1)
 
-# Calculate returns and volatility metrics
-price_df = price_df.set_index('timestamp')
-
-# 1. Calculate returns (using last_price)
-price_df['returns'] = price_df['last_price'].pct_change()
-price_df['log_returns'] = np.log(price_df['last_price'] / price_df['last_price'].shift(1))
-
-# 2. Calculate price range for each observation
-price_df['price_range'] = price_df['last_price'].rolling(window='1h').max() - price_df['last_price'].rolling(window='1h').min()
-price_df['price_range_pct'] = (price_df['price_range'] / price_df['last_price']) * 100
-
-# 3. Rolling volatility metrics (7-day window)
-# Standard deviation of returns (annualized)
-price_df['volatility_std'] = price_df['returns'].rolling(window=VOLATILITY_WINDOW).std() * np.sqrt(365)
-
-# Realized volatility (sum of squared returns)
-price_df['volatility_realized'] = np.sqrt(
-    price_df['returns'].pow(2).rolling(window=VOLATILITY_WINDOW).sum()
-) * np.sqrt(365)
-
-# Mean absolute deviation
-price_df['volatility_mad'] = price_df['returns'].abs().rolling(window=VOLATILITY_WINDOW).mean() * np.sqrt(365)
-
-# Price range volatility (high-low over window)
-price_df['high_7d'] = price_df['last_price'].rolling(window=VOLATILITY_WINDOW).max()
-price_df['low_7d'] = price_df['last_price'].rolling(window=VOLATILITY_WINDOW).min()
-price_df['volatility_range'] = (price_df['high_7d'] - price_df['low_7d']) / price_df['last_price']
-
-# Coefficient of variation (normalized volatility)
-price_df['cv'] = (price_df['last_price'].rolling(window=VOLATILITY_WINDOW).std() /
-                  price_df['last_price'].rolling(window=VOLATILITY_WINDOW).mean())
-
-# Delta between last_price and price_scale (measure of pool imbalance)
-price_df['delta_price'] = price_df['last_price'] - price_df['price_scale']
-price_df['delta_price_pct'] = (price_df['delta_price'] / price_df['price_scale']) * 100
-price_df['delta_abs_ma'] = price_df['delta_price_pct'].abs().rolling(window=VOLATILITY_WINDOW).mean()
-
-price_df = price_df.reset_index()
-
-# Calculate rebalancing costs
-donation_df = donation_df.set_index('timestamp')
-donation_df['donation_delta'] = donation_df['donation_shares'].diff()
-
-# Detect when donation shares are used (negative delta)
-donation_df['shares_used'] = -donation_df['donation_delta'].clip(upper=0)
-
-# Merge with supply data to calculate USD costs
-donation_df = donation_df.reset_index()
-donation_df = pd.merge(donation_df, supply_df, on='timestamp', how='left')
-
-# Calculate USD value of shares used
-donation_df['cost_usd'] = donation_df.apply(
-    lambda row: (row['shares_used'] / row['totalSupply']) * row['tvl_usd']
-    if pd.notna(row['totalSupply']) and row['totalSupply'] > 0 and pd.notna(row['tvl_usd']) and row['shares_used'] > 0
-    else 0,
-    axis=1
-)
-
-# Calculate cost as percentage of TVL
-donation_df['cost_pct_tvl'] = donation_df.apply(
-    lambda row: (row['cost_usd'] / row['tvl_usd']) * 100
-    if pd.notna(row['tvl_usd']) and row['tvl_usd'] > 0 and row['cost_usd'] > 0
-    else 0,
-    axis=1
-)
-
-donation_df = donation_df.set_index('timestamp')
-
-# Rolling sum of costs (7-day window)
-donation_df['cost_usd_7d'] = donation_df['cost_usd'].rolling(window=VOLATILITY_WINDOW).sum()
-donation_df['cost_pct_tvl_7d'] = donation_df['cost_pct_tvl'].rolling(window=VOLATILITY_WINDOW).sum()
-
-# Rebalancing frequency (count of events in 7-day window)
-donation_df['rebalance_count_7d'] = donation_df['is_rebalance'].rolling(window=VOLATILITY_WINDOW).sum()
-
-donation_df = donation_df.reset_index()
-
 # Merge price and donation data for correlation analysis
 merged_df = pd.merge(price_df, donation_df, on='timestamp', how='outer').sort_values('timestamp')
 merged_df = merged_df.set_index('timestamp')
@@ -362,6 +262,20 @@ if not merged_df.empty:
 else:
     figure_width_cm = 40.0
 
+# Spot and scale price of chart 1 from the coarsest pre-aggregated level that still has a bucket
+# per pixel column (see pool_pyramid.py), the raw samples if no level is fine enough
+price_points = price_df[['timestamp', 'last_price']]
+price_scale_points = price_df[['timestamp', 'price_scale']]
+price_span_seconds = (price_df['timestamp'].max() - price_df['timestamp'].min()).total_seconds()
+level = pick_level(price_span_seconds, (figure_width_cm / 2.54) * _INTERNAL_DPI * PLOT_AREA_RATIO,
+                   sample_spacing(frame['epoch']))
+if level is not None:
+    update_pyramid(safe_chain_name, safe_address, data_dir=base_data_dir, rebuild=args.rebuild_metrics, levels=[level])
+    buckets = load_level(level, safe_chain_name, safe_address, data_dir=base_data_dir)
+    price_points = range_points(buckets, 'price_high', 'price_low', 'last_price', level)
+    price_scale_points = range_points(buckets, 'price_scale_high', 'price_scale_low', 'price_scale', level)
+    print(f"Chart 1 prices from the {level} pre-aggregates: {len(buckets)} buckets")
+
 # Create output directory (using sanitized chain_name)
 plot_dir = Path("plots") / safe_chain_name / "volatility"
 plot_dir.mkdir(parents=True, exist_ok=True)
@@ -375,9 +289,9 @@ fig1, axes1 = plt.subplots(8, 1, figsize=(figure_width_cm/2.54, 50/2.54), sharex
 # Subplot 1: Price with high/low bands
 ax = axes1[0]
 if not price_df.empty:
-    ax.plot(price_df['timestamp'], price_df['last_price'], color=BLUE, label='Spot Price',
+    ax.plot(price_points['timestamp'], price_points['last_price'], color=BLUE, label='Spot Price',
             linestyle='None', marker=MAKER, markersize=MARKER_SIZE)
-    ax.plot(price_df['timestamp'], price_df['price_scale'], color=GREEN, label='Price Scale',
+    ax.plot(price_scale_points['timestamp'], price_scale_points['price_scale'], color=GREEN, label='Price Scale',
             linestyle='None', marker=MAKER, markersize=MARKER_SIZE, alpha=0.5)
     # Add 7-day high/low bands
     ax.fill_between(price_df['timestamp'], price_df['low_7d'], price_df['high_7d'],
@@ -0,0 +1,132 @@
+"""
+Pool history as one typed, block-indexed DataFrame, shared by the plot scripts and analyses.
+
+    frame = load_pool_frame(chain_name, address, columns=["last_prices", "totalSupply"], last_hours=48)
+
+    block     | epoch (int64) | timestamp (datetime64) | last_prices (float64) | totalSupply (float64)
+    ----------+---------------+------------------------+-----------------------+----------------------
+    38400100  | 1776800200    | 2026-04-21 19:36:40    | 0.9998                | 1234.5
+    ...
+
+One row per sampled block, sorted by block, one float64 column per getter (NaN where a block
+was not fetched). The columns are NumPy arrays filled straight from the Parquet store, so the
+history is parsed once instead of per-metric dict loops, DataFrames and timestamp merges in every
+script. timestamp is naive local time, like datetime.fromtimestamp() in the scripts.
+Blocks without a timestamp are left out.
+
+get_historical_data.py stores every getter but balances(0) in token1 decimals; normalize_history()
+brings the 1e18 getters (prices, LP amounts) of pools with another token1 back to 1e18 units:
+
+    frame = normalize_history(load_pool_frame(chain_name, address), pool_decimals(name))
+"""
+import numpy as np
+import pandas as pd
+from dateutil import tz
+from pool_store import (DATA_DIR, FUNCTION_NAMES, get_store_path, store_exists, read_table, latest_epoch,
+                        load_pool_data)
+
+LOCAL_TIMEZONE = tz.tzlocal()
+
+
+def epochs_to_timestamps(epochs):
+    """Naive local datetimes for unix timestamps, same values as datetime.fromtimestamp()"""
+    return pd.to_datetime(np.asarray(epochs, dtype=np.int64), unit="s", utc=True).tz_convert(LOCAL_TIMEZONE).tz_localize(None)
+
+def _frame(blocks, epochs, columns, values):
+    """Assemble the frame from the block/epoch arrays and one float64 array per column"""
+    data = {"epoch": epochs, "timestamp": epochs_to_timestamps(epochs)}
+    data.update(zip(columns, values))
+    return pd.DataFrame(data, index=pd.Index(blocks, name="block"))
+
+def _frame_from_table(table, columns):
+    """Arrow table (block, epoch, getters) to the frame, rows without an epoch dropped"""
+    epoch_column = table.column("epoch")
+    if epoch_column.null_count:
+        table = table.filter(epoch_column.is_valid())
+    rows = table.num_rows
+    values = []
+    for fn in columns:
+        column = np.full(rows, np.nan)
+        if fn in table.column_names:
+            # Nulls become NaN, int columns (last_donation_release_ts) are widened to float64
+            column[:] = table.column(fn).to_numpy(zero_copy_only=False)
+        values.append(column)
+    return _frame(table.column("block").to_numpy(), table.column("epoch").to_numpy(), columns, values)
+
+def _frame_from_cache(data, columns):
+    """Legacy nested JSON cache to the frame, in a single pass over the blocks"""
+    entries = []
+    for block_str, block_data in data.items():
+        epoch = next((entry.get("epoch") for entry in block_data.values()
+                      if isinstance(entry, dict) and entry.get("epoch") is not None), None)
+        if epoch is not None:
+            entries.append((int(block_str), epoch, block_data))
+    entries.sort(key=lambda entry: entry[0])
+
+    rows = len(entries)
+    blocks = np.empty(rows, dtype=np.int64)
+    epochs = np.empty(rows, dtype=np.int64)
+    values = [np.full(rows, np.nan) for _ in columns]
+    for row, (block_number, epoch, block_data) in enumerate(entries):
+        blocks[row] = block_number
+        epochs[row] = epoch
+        for column, fn in zip(values, columns):
+            entry = block_data.get(fn)
+            if isinstance(entry, dict) and entry.get("value") is not None:
+                column[row] = entry["value"]
+    return _frame(blocks, epochs, columns, values)
+
+def load_pool_frame(chain_name, pool_address, columns=None, data_dir=DATA_DIR,
+                    start_block=None, end_block=None, start_time=None, end_time=None, last_hours=None):
+    """
+    Load a pool's history into the block-indexed frame, reading only `columns` (getter names,
+    None for all) and only the [start, end) block / time window (see pool_store.read_table).
+    Falls back to the legacy JSON cache if the pool has not been converted to Parquet yet.
+    """
+    columns = list(FUNCTION_NAMES if columns is None else columns)
+    store_path = get_store_path(chain_name, pool_address, data_dir)
+    if store_exists(store_path):
+        if last_hours is not None:
+            newest = latest_epoch(store_path)
+            if newest is not None:
+                start_time = newest - int(last_hours * 3600)
+        table = read_table(store_path, columns, start_block=start_block, end_block=end_block,
+                           start_time=start_time, end_time=end_time)
+        return _frame_from_table(table, columns)
+
+    data = load_pool_data(chain_name, pool_address, columns=columns, data_dir=data_dir,
+                          start_block=start_block, end_block=end_block, start_time=start_time,
+                          end_time=end_time, last_hours=last_hours)
+    return _frame_from_cache(data, columns)
+
+def pool_decimals(pool_name):
+    """(token0_decimals, token1_decimals) from the pool name, same rule as get_historical_data.py's get_pool_decimals"""
+    decimals_0, decimals_1 = 18, 18
+    if "USDC" in pool_name:
+        decimals_0, decimals_1 = 6, 18
+    if "EURC" in pool_name:
+        decimals_1 = 6
+    return decimals_0, decimals_1
+
+def normalize_history(frame, decimals):
+    """
+    History columns as if token1 had 18 decimals. get_historical_data.py divides every getter but
+    balances(0) by token1 decimals, so with a 6 decimals token1 (EURC) price_scale, the LP amounts,
+    etc. are stored 1e12 too large
+    """
+    scale = 10.0 ** (decimals[1] - 18)
+    columns = [column for column in frame.columns if column in FUNCTION_NAMES
+               and column not in ("balances(0)", "balances(1)", "last_donation_release_ts")]
+    if scale == 1 or not columns:
+        return frame
+    frame = frame.copy()
+    frame[columns] = frame[columns] * scale
+    return frame
+
+def metric_frame(frame, column, name=None):
+    """timestamp + one metric for the blocks where it was fetched (the per-metric frames the charts plot)"""
+    rows = frame[column].notna().to_numpy()
+    return pd.DataFrame({
+        "timestamp": frame["timestamp"].to_numpy()[rows],
+        name or column: frame[column].to_numpy()[rows],
+    })
@@ -0,0 +1,217 @@
+"""
+Derived metric sets of the plot scripts, stored and updated incrementally by derived_store.py.
+
+    VOLATILITY_PRICE_METRICS     returns, 1h price range, 7-day rolling volatility (std, realized,
+                                 MAD, range, cv) and price_scale delta of plot_volatility.py
+    VOLATILITY_DONATION_METRICS  rebalance events, donation share usage, USD costs and their 7-day
+                                 rolling sums / counts of plot_volatility.py
+    REFUEL_DELTA_METRICS         donation share deltas, their USD value and 2h moving average of
+                                 plot_refule.py
+
+Blocks are used like the scripts always did: only those with last_prices or price_scale. The row
+stage of every set carries the previous row's values in its state, so a resumed update gives the
+same returns / deltas / rebalance flags as a full pass. Bump a set's version when its formulas change.
+"""
+import numpy as np
+import pandas as pd
+from derived_store import DerivedMetrics
+
+VOLATILITY_WINDOW = '7D'
+DELTA_USD_MA_WINDOW = '2h'
+ANNUALIZATION = np.sqrt(365)
+# last_donation_release_ts values at or below this are not a release time
+MIN_RELEASE_TS = 1000000000
+
+
+def _plotted(frame):
+    """Blocks the scripts analyze: those with last_prices or price_scale"""
+    return frame[frame['last_prices'].notna() | frame['price_scale'].notna()]
+
+def _previous(values, first):
+    """values moved one row down, `first` (the state of the previous update, or None) in the first row"""
+    previous = np.empty(len(values))
+    previous[:1] = np.nan if first is None else first
+    previous[1:] = values[:-1]
+    return previous
+
+def _state_value(state, key):
+    return None if state is None else state.get(key)
+
+def _rolling(data, column, window, min_periods=None):
+    """Time-based rolling window over one column of a window stage input (timestamp column + values)"""
+    return pd.Series(data[column].to_numpy(), index=pd.DatetimeIndex(data['timestamp'])).rolling(
+        window=window, min_periods=min_periods)
+
+
+def volatility_price_rows(frame, state):
+    """Price blocks (all three prices fetched): prices, returns and delta to price_scale"""
+    prices = frame[frame[['last_prices', 'price_scale', 'price_oracle']].notna().all(axis=1)]
+    last_price = prices['last_prices'].to_numpy()
+    price_scale = prices['price_scale'].to_numpy()
+    previous_price = _previous(last_price, _state_value(state, 'last_price'))
+    delta_price = last_price - price_scale
+    rows = pd.DataFrame({
+        'last_price': last_price,
+        'price_scale': price_scale,
+        'price_oracle': prices['price_oracle'].to_numpy(),
+        'returns': last_price / previous_price - 1,
+        'log_returns': np.log(last_price / previous_price),
+        'delta_price': delta_price,
+        'delta_price_pct': (delta_price / price_scale) * 100,
+    }, index=prices.index)
+    if len(prices):
+        state = {'last_price': float(last_price[-1])}
+    return rows, state
+
+def volatility_price_windows(data):
+    """1h price range and the 7-day rolling volatility metrics"""
+    last_price = data['last_price'].to_numpy()
+    price_range = (_rolling(data, 'last_price', '1h').max() - _rolling(data, 'last_price', '1h').min()).to_numpy()
+    high_7d = _rolling(data, 'last_price', VOLATILITY_WINDOW).max().to_numpy()
+    low_7d = _rolling(data, 'last_price', VOLATILITY_WINDOW).min().to_numpy()
+    returns = data[['timestamp']].assign(squared=data['returns'] ** 2, absolute=data['returns'].abs(),
+                                         delta_abs=data['delta_price_pct'].abs())
+    return pd.DataFrame({
+        'price_range': price_range,
+        'price_range_pct': (price_range / last_price) * 100,
+        # Standard deviation of returns (annualized)
+        'volatility_std': _rolling(data, 'returns', VOLATILITY_WINDOW).std().to_numpy() * ANNUALIZATION,
+        # Realized volatility (sum of squared returns)
+        'volatility_realized': np.sqrt(_rolling(returns, 'squared', VOLATILITY_WINDOW).sum().to_numpy()) * ANNUALIZATION,
+        # Mean absolute deviation
+        'volatility_mad': _rolling(returns, 'absolute', VOLATILITY_WINDOW).mean().to_numpy() * ANNUALIZATION,
+        'high_7d': high_7d,
+        'low_7d': low_7d,
+        'volatility_range': (high_7d - low_7d) / last_price,
+        # Coefficient of variation (normalized volatility)
+        'cv': (_rolling(data, 'last_price', VOLATILITY_WINDOW).std().to_numpy()
+               / _rolling(data, 'last_price', VOLATILITY_WINDOW).mean().to_numpy()),
+        'delta_abs_ma': _rolling(returns, 'delta_abs', VOLATILITY_WINDOW).mean().to_numpy(),
+    }, index=data.index)
+
+VOLATILITY_PRICE_METRICS = DerivedMetrics(
+    'volatility_price',
+    columns=['last_prices', 'price_scale', 'price_oracle'],
+    rows=volatility_price_rows,
+    windows=volatility_price_windows,
+    lookback=VOLATILITY_WINDOW,
+)
+
+
+def volatility_donation_rows(frame, state):
+    """
+    Donation blocks (donation_shares and last_donation_release_ts fetched): rebalance events,
+    shares used and their USD cost at the block's TVL
+    """
+    frame = _plotted(frame)
+    donations = frame[frame[['donation_shares', 'last_donation_release_ts']].notna().all(axis=1)]
+    release_ts = donations['last_donation_release_ts'].to_numpy()
+    donation_shares = donations['donation_shares'].to_numpy()
+
+    # Rebalance: last_donation_release_ts changes from the previous valid value
+    valid_release_ts = np.where(release_ts > MIN_RELEASE_TS, release_ts, np.nan)
+    previous_release_ts = _previous(pd.Series(valid_release_ts).ffill().to_numpy(), _state_value(state, 'release_ts'))
+    previous_release_ts = pd.Series(previous_release_ts).ffill().to_numpy()  # carry the saved value over leading invalid rows
+    is_rebalance = ~np.isnan(previous_release_ts) & (release_ts != previous_release_ts) & (release_ts > MIN_RELEASE_TS)
+
+    # Donation shares used (negative delta)
+    donation_delta = donation_shares - _previous(donation_shares, _state_value(state, 'donation_shares'))
+    shares_used = -np.minimum(donation_delta, 0)
+
+    # Balances and supply of the same blocks, NaN where the block has no complete supply data
+    supply = donations[['balances(0)', 'balances(1)', 'totalSupply', 'last_prices']]
+    complete_supply = supply.notna().all(axis=1).to_numpy()
+    balance_0 = np.where(complete_supply, supply['balances(0)'].to_numpy(), np.nan)
+    balance_1 = np.where(complete_supply, supply['balances(1)'].to_numpy(), np.nan)
+    total_supply = np.where(complete_supply, supply['totalSupply'].to_numpy(), np.nan)
+    tvl_usd = balance_0 + balance_1 * np.where(complete_supply, supply['last_prices'].to_numpy(), np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # USD value of the shares used, and as percentage of TVL
+        cost_usd = np.where((total_supply > 0) & ~np.isnan(tvl_usd) & (shares_used > 0),
+                            (shares_used / total_supply) * tvl_usd, 0.0)
+        cost_pct_tvl = np.where((tvl_usd > 0) & (cost_usd > 0), (cost_usd / tvl_usd) * 100, 0.0)
+
+    rows = pd.DataFrame({
+        'donation_shares': donation_shares,
+        'is_rebalance': is_rebalance,
+        'donation_delta': donation_delta,
+        'shares_used': shares_used,
+        'balance_0': balance_0,
+        'balance_1': balance_1,
+        'totalSupply': total_supply,
+        'tvl_usd': tvl_usd,
+        'cost_usd': cost_usd,
+        'cost_pct_tvl': cost_pct_tvl,
+    }, index=donations.index)
+    if len(donations):
+        last_release_ts = pd.Series(valid_release_ts).ffill().iloc[-1]
+        state = {
+            'release_ts': float(last_release_ts) if not np.isnan(last_release_ts) else _state_value(state, 'release_ts'),
+            'donation_shares': float(donation_shares[-1]),
+        }
+    return rows, state
+
+def volatility_donation_windows(data):
+    """7-day rolling cost sums and rebalance count"""
+    return pd.DataFrame({
+        'cost_usd_7d': _rolling(data, 'cost_usd', VOLATILITY_WINDOW).sum().to_numpy(),
+        'cost_pct_tvl_7d': _rolling(data, 'cost_pct_tvl', VOLATILITY_WINDOW).sum().to_numpy(),
+        # Rebalancing frequency (count of events in the window)
+        'rebalance_count_7d': _rolling(data.assign(is_rebalance=data['is_rebalance'].astype(float)),
+                                       'is_rebalance', VOLATILITY_WINDOW).sum().to_numpy(),
+    }, index=data.index)
+
+VOLATILITY_DONATION_METRICS = DerivedMetrics(
+    'volatility_donation',
+    columns=['last_prices', 'price_scale', 'donation_shares', 'last_donation_release_ts',
+             'totalSupply', 'balances(0)', 'balances(1)'],
+    rows=volatility_donation_rows,
+    windows=volatility_donation_windows,
+    lookback=VOLATILITY_WINDOW,
+)
+
+
+def refuel_delta_rows(frame, state):
+    """Donation share blocks: change from the previous value and the USD value of the decreases"""
+    frame = _plotted(frame)
+    donations = frame[frame['donation_shares'].notna()]
+    donation_shares = donations['donation_shares'].to_numpy()
+    delta = donation_shares - _previous(donation_shares, _state_value(state, 'donation_shares'))
+    delta = np.where(np.isnan(delta), 0, delta)  # First value has no previous, set to 0
+    # Only the negative changes (share usage)
+    delta_filtered = np.where(delta >= 0, 0, delta)
+
+    total_supply = donations['totalSupply'].to_numpy()
+    balance_0 = donations['balances(0)'].to_numpy()
+    balance_1 = donations['balances(1)'].to_numpy()
+    last_price = donations['last_prices'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # USD value = (delta / totalSupply) * (balance_0 + balance_1 * last_price)
+        delta_usd = np.where(
+            (delta_filtered != 0) & (total_supply > 0) & ~np.isnan(balance_0) & ~np.isnan(balance_1) & ~np.isnan(last_price),
+            (np.abs(delta_filtered) / total_supply * balance_0) + (np.abs(delta_filtered) / total_supply * balance_1 * last_price),
+            0.0)
+
+    rows = pd.DataFrame({
+        'delta': delta,
+        'delta_filtered': delta_filtered,
+        'delta_usd': delta_usd,
+    }, index=donations.index)
+    if len(donations):
+        state = {'donation_shares': float(donation_shares[-1])}
+    return rows, state
+
+def refuel_delta_windows(data):
+    """Moving average of the USD spend"""
+    return pd.DataFrame({
+        'delta_usd_ma': _rolling(data, 'delta_usd', DELTA_USD_MA_WINDOW, min_periods=1).mean().to_numpy(),
+    }, index=data.index)
+
+REFUEL_DELTA_METRICS = DerivedMetrics(
+    'refuel_delta',
+    columns=['last_prices', 'price_scale', 'donation_shares', 'totalSupply', 'balances(0)', 'balances(1)'],
+    rows=refuel_delta_rows,
+    windows=refuel_delta_windows,
+    lookback=DELTA_USD_MA_WINDOW,
+)
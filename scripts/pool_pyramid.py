@@ -0,0 +1,204 @@
+"""
+Multi-resolution pre-aggregates of a pool's history, for charts over long ranges.
+
+At every level of LEVELS the plotted blocks (last_prices or price_scale fetched) are grouped
+into fixed UTC time buckets, one row per bucket:
+
+    price_open | price_high | price_low | price_close          last_prices of the bucket
+    price_scale_high | price_scale_low | price_scale_close
+    balance_0_avg | balance_1_avg                               mean of the fetched balances
+    donation_shares                                             last value of the bucket
+    shares_used | shares_added                                  sum of the donation share decreases / increases
+    refuel_count                                                number of increases (refuels)
+    samples                                                     blocks in the bucket
+
+Each level is a bucketed derived metric set (derived_store.py): rows are keyed by the first block
+of the bucket, epoch is the bucket start, and the partial last bucket is kept in the update state,
+so ingesting new blocks only touches the buckets they fall into:
+
+    update_pyramid(chain_name, address)                         # after each ingest
+    level = pick_level(span_seconds, plot_width_pixels, sample_spacing(epochs))
+    if level is not None:
+        buckets = load_level(level, chain_name, address, start_time=start, end_time=end)
+        points = range_points(buckets, 'price_high', 'price_low', 'last_price', level)
+
+A level fills a chart when it has at least one bucket per pixel column, and it only helps when a
+bucket (drawn as its high and its low) holds at least MIN_BUCKET_SAMPLES raw samples. With a
+sample every 100 blocks (~200 s on Base) that rules out the 5m level, so the refuel charts
+(PIXELS_PER_DAY = 288, one pixel per 5 minutes) draw the raw blocks, and the hourly and daily
+levels serve charts with a fixed width over a long range.
+"""
+import numpy as np
+import pandas as pd
+from derived_store import DerivedMetrics, update_derived, load_derived
+from pool_store import DATA_DIR
+
+# Level name: bucket length in seconds, finest first
+LEVELS = {
+    '5m': 5 * 60,
+    '1h': 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+# Floating point slack when comparing a level with the seconds per pixel column
+FILL_TOLERANCE = 1.01
+# Raw samples a bucket must hold on average to be worth its two points (high and low)
+MIN_BUCKET_SAMPLES = 4
+
+# Columns of a bucket that add up when it is combined with the saved partial bucket
+_SUMS = ['balance_0_sum', 'balance_0_count', 'balance_1_sum', 'balance_1_count',
+         'shares_used', 'shares_added', 'refuel_count', 'samples']
+
+
+def _aggregate(frame, previous_shares):
+    """Per-block inputs of the aggregates, donation share changes split into decreases and increases"""
+    donation_shares = frame['donation_shares'].to_numpy()
+    # Donation share changes between consecutive blocks that have the getter
+    fetched = np.flatnonzero(~np.isnan(donation_shares))
+    delta = np.zeros(len(frame))
+    if len(fetched):
+        values = donation_shares[fetched]
+        previous = np.empty(len(values))
+        previous[:1] = np.nan if previous_shares is None else previous_shares
+        previous[1:] = values[:-1]
+        delta[fetched] = np.nan_to_num(values - previous)
+    data = pd.DataFrame({
+        'block': frame.index.to_numpy(),
+        'price': frame['last_prices'].to_numpy(),
+        'price_scale': frame['price_scale'].to_numpy(),
+        'balance_0': frame['balances(0)'].to_numpy(),
+        'balance_1': frame['balances(1)'].to_numpy(),
+        'donation_shares': donation_shares,
+        'shares_used': -np.minimum(delta, 0),
+        'shares_added': np.maximum(delta, 0),
+        'refuel': (delta > 0).astype(np.int64),
+    })
+    return data, fetched
+
+def _bucket_rows(frame, state, seconds):
+    """Row stage of a level: one row per bucket touched by the new blocks, the last one kept in the state"""
+    frame = frame[frame['last_prices'].notna() | frame['price_scale'].notna()]
+    tail = None if state is None else state.get('tail')
+    previous_shares = None if state is None else state.get('donation_shares')
+    data, fetched = _aggregate(frame, previous_shares)
+    data['bucket'] = frame['epoch'].to_numpy() // seconds * seconds
+    buckets = data.groupby('bucket', sort=True).agg(
+        block=('block', 'first'),
+        price_open=('price', 'first'),
+        price_high=('price', 'max'),
+        price_low=('price', 'min'),
+        price_close=('price', 'last'),
+        price_scale_high=('price_scale', 'max'),
+        price_scale_low=('price_scale', 'min'),
+        price_scale_close=('price_scale', 'last'),
+        balance_0_sum=('balance_0', 'sum'),
+        balance_0_count=('balance_0', 'count'),
+        balance_1_sum=('balance_1', 'sum'),
+        balance_1_count=('balance_1', 'count'),
+        donation_shares=('donation_shares', 'last'),
+        shares_used=('shares_used', 'sum'),
+        shares_added=('shares_added', 'sum'),
+        refuel_count=('refuel', 'sum'),
+        samples=('block', 'size'),
+    ).astype(float)
+    buckets['block'] = buckets['block'].astype(np.int64)
+
+    # The first bucket continues the partial last bucket of the previous update
+    if tail is not None and len(buckets) and buckets.index[0] == tail['bucket']:
+        first = buckets.iloc[0].to_dict()
+        merged = {'block': tail['block']}
+        merged['price_open'] = tail['price_open'] if not np.isnan(tail['price_open']) else first['price_open']
+        for column in ('price_close', 'price_scale_close', 'donation_shares'):
+            merged[column] = first[column] if not np.isnan(first[column]) else tail[column]
+        for column in ('price_high', 'price_scale_high'):
+            merged[column] = np.fmax(tail[column], first[column])
+        for column in ('price_low', 'price_scale_low'):
+            merged[column] = np.fmin(tail[column], first[column])
+        for column in _SUMS:
+            merged[column] = tail[column] + first[column]
+        buckets.iloc[0] = pd.Series(merged)[buckets.columns]
+
+    if len(buckets):
+        last = buckets.iloc[-1]
+        state = {
+            'tail': {'bucket': int(buckets.index[-1]), 'block': int(last['block']),
+                     **{column: float(last[column]) for column in buckets.columns if column != 'block'}},
+            'donation_shares': (float(data['donation_shares'].to_numpy()[fetched[-1]]) if len(fetched)
+                                else previous_shares),
+        }
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        balance_0_avg = buckets['balance_0_sum'] / buckets['balance_0_count']
+        balance_1_avg = buckets['balance_1_sum'] / buckets['balance_1_count']
+    rows = pd.DataFrame({
+        'epoch': buckets.index.to_numpy(dtype=np.int64),
+        'price_open': buckets['price_open'].to_numpy(),
+        'price_high': buckets['price_high'].to_numpy(),
+        'price_low': buckets['price_low'].to_numpy(),
+        'price_close': buckets['price_close'].to_numpy(),
+        'price_scale_high': buckets['price_scale_high'].to_numpy(),
+        'price_scale_low': buckets['price_scale_low'].to_numpy(),
+        'price_scale_close': buckets['price_scale_close'].to_numpy(),
+        'balance_0_avg': balance_0_avg.to_numpy(),
+        'balance_1_avg': balance_1_avg.to_numpy(),
+        'donation_shares': buckets['donation_shares'].to_numpy(),
+        'shares_used': buckets['shares_used'].to_numpy(),
+        'shares_added': buckets['shares_added'].to_numpy(),
+        'refuel_count': buckets['refuel_count'].to_numpy().astype(np.int64),
+        'samples': buckets['samples'].to_numpy().astype(np.int64),
+    }, index=pd.Index(buckets['block'].to_numpy(), name='block'))
+    return rows, state
+
+def _level_metrics(level, seconds):
+    return DerivedMetrics(
+        f'pyramid_{level}',
+        columns=['last_prices', 'price_scale', 'donation_shares', 'balances(0)', 'balances(1)'],
+        rows=lambda frame, state: _bucket_rows(frame, state, seconds),
+        windows=None,
+        lookback=0,
+    )
+
+LEVEL_METRICS = {level: _level_metrics(level, seconds) for level, seconds in LEVELS.items()}
+
+
+def update_pyramid(chain_name, pool_address, data_dir=DATA_DIR, rebuild=False, levels=None):
+    """Bring the levels (default: all) of a pool up to date with its history. Returns {level: rows written}"""
+    return {level: update_derived(LEVEL_METRICS[level], chain_name, pool_address, data_dir=data_dir, rebuild=rebuild)
+            for level in (LEVELS if levels is None else levels)}
+
+def load_level(level, chain_name, pool_address, data_dir=DATA_DIR, start_time=None, end_time=None):
+    """Buckets of one level as a frame (block index = first block, epoch / timestamp = bucket start)"""
+    return load_derived(LEVEL_METRICS[level], chain_name, pool_address, data_dir=data_dir,
+                        start_time=start_time, end_time=end_time)
+
+def sample_spacing(epochs):
+    """Typical seconds between the raw samples of a pool (median gap of the block timestamps)"""
+    epochs = np.asarray(epochs, dtype=np.float64)
+    epochs = epochs[~np.isnan(epochs)]
+    return float(np.median(np.diff(epochs))) if len(epochs) > 1 else 0.0
+
+def pick_level(span_seconds, width_pixels, sample_seconds=0.0):
+    """
+    Coarsest level with at least one bucket per pixel column of a chart, None if even 5m is too coarse
+    or the level would not hold MIN_BUCKET_SAMPLES raw samples per bucket (no fewer points than the blocks)
+    """
+    if width_pixels <= 0:
+        return None
+    seconds_per_pixel = span_seconds / width_pixels
+    fitting = [level for level, seconds in LEVELS.items() if seconds <= seconds_per_pixel * FILL_TOLERANCE]
+    if not fitting or LEVELS[fitting[-1]] < MIN_BUCKET_SAMPLES * sample_seconds:
+        return None
+    return fitting[-1]
+
+def range_points(buckets, high, low, name, level=None):
+    """
+    timestamp + value frame with the high and the low of every bucket (the envelope a scatter chart shows),
+    at the middle of the bucket if its level is given
+    """
+    timestamps = buckets['timestamp'].to_numpy()
+    if level is not None:
+        timestamps = timestamps + np.timedelta64(LEVELS[level] // 2, 's')
+    points = pd.DataFrame({
+        'timestamp': np.concatenate([timestamps, timestamps]),
+        name: np.concatenate([buckets[high].to_numpy(), buckets[low].to_numpy()]),
+    })
+    return points[points[name].notna()].sort_values('timestamp', kind='stable').reset_index(drop=True)
@@ -0,0 +1,466 @@
+"""
+Columnar store for the pool history collected by get_historical_data.py.
+
+One Parquet file per pool at data/<chain_name>/<address>.parquet, one row per sampled block:
+
+    block (int64) | epoch (int64) | last_prices (float64) | ... | balances(1) (float64)
+
+The timestamp is stored once per row, missing values are nulls.
+
+New rows are never written by rewriting that file. Each save appends a small segment with
+only the new or changed blocks to data/<chain_name>/<address>.wal/, and compact_store()
+merges the segments into the main file (temp file + rename, so a crash never leaves a
+half-written file behind). Readers merge the main file and the segments, the newest
+segment wins for a block.
+
+Every segment is a generation of the store (its name starts with the write time in ns).
+Compacting a pool store logs the first block of each merged segment in <address>.changes.json,
+so store_changes() can tell a reader which blocks were written after the generation it last saw
+(derived_store.py), from the segment footers and that log only.
+
+The plot scripts read only the columns they need with load_pool_data(), which returns the
+same nested dict the old JSON cache had ({block: {function: {'value', 'epoch'}}}), so their
+parsing code is unchanged.
+
+Files are written in row groups of ROW_GROUP_ROWS blocks, sorted by block, and Parquet keeps
+the min/max block and epoch of every row group in the footer. A window read
+(start_block/end_block, start_time/end_time or last_hours) only decodes the row groups that
+overlap the window, so a 2-day chart costs the same however long the history gets:
+
+    data = load_pool_data(chain_name, address, columns=["last_prices"], last_hours=48)
+
+Convert the existing JSON caches with:
+
+    python scripts/pool_store.py
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DATA_DIR = Path("data")
+
+# Every pool getter collected by get_historical_data.py, in column order
+FUNCTION_NAMES = [
+    "last_prices",
+    "price_scale",
+    "price_oracle",
+    "donation_shares",
+    "fee",
+    "last_donation_release_ts",
+    "totalSupply",
+    "user_supply",
+    "xcp_profit",
+    "xcp_profit_a",
+    "virtual_price",
+    "balances(0)",
+    "balances(1)",
+]
+# Raw integers (timestamps), everything else is a decimal-adjusted float
+INT_FUNCTIONS = {"last_donation_release_ts"}
+
+SCHEMA = pa.schema(
+    [pa.field("block", pa.int64(), nullable=False), pa.field("epoch", pa.int64())]
+    + [pa.field(fn, pa.int64() if fn in INT_FUNCTIONS else pa.float64()) for fn in FUNCTION_NAMES]
+)
+
+PARQUET_COMPRESSION = "zstd"
+# ~4.7 days of Base samples (one every 100 blocks), so a 2-day window touches at most 2 row groups
+ROW_GROUP_ROWS = 2048
+
+# Merge the write-ahead segments into the main file once a pool has this many
+COMPACT_AFTER_SEGMENTS = 16
+# Compacted segments remembered in <address>.changes.json
+CHANGES_KEPT = 1024
+
+# Running background compactions, keyed by store path
+_compactions = {}
+_compactions_lock = threading.Lock()
+
+
+def get_store_path(chain_name, pool_address, data_dir=DATA_DIR):
+    """Parquet file of a pool: data/<chain_name>/<address>.parquet"""
+    return Path(data_dir) / chain_name / f"{pool_address}.parquet"
+
+def get_json_path(chain_name, pool_address, data_dir=DATA_DIR):
+    """Legacy nested JSON cache of a pool: data/<chain_name>/<address>.json"""
+    return Path(data_dir) / chain_name / f"{pool_address}.json"
+
+def get_wal_dir(store_path):
+    """Directory holding the append-only segments of a store: <address>.wal/"""
+    store_path = Path(store_path)
+    return store_path.with_name(store_path.stem + ".wal")
+
+def get_changes_path(store_path):
+    """Log of the compacted segments of a pool store: <address>.changes.json"""
+    store_path = Path(store_path)
+    return store_path.with_name(store_path.stem + ".changes.json")
+
+def list_segments(store_path):
+    """Segment files of a store, oldest first (names sort by write time)"""
+    wal_dir = get_wal_dir(store_path)
+    if not wal_dir.is_dir():
+        return []
+    return sorted(wal_dir.glob("*.parquet"))
+
+def store_exists(store_path):
+    """True if the store has a main file or at least one segment"""
+    return Path(store_path).exists() or bool(list_segments(store_path))
+
+def format_block_time(timestamp):
+    """Human-readable UTC string, same format get_historical_data.py used in the JSON cache"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+def cache_to_table(cache):
+    """
+    Convert the nested cache dict ({block_str: {function: {'value', 'epoch', ...}}})
+    to an Arrow table with one row per block, sorted by block.
+    """
+    blocks = sorted(int(block_str) for block_str, block_data in cache.items() if isinstance(block_data, dict))
+    columns = {"block": blocks, "epoch": []}
+    for fn in FUNCTION_NAMES:
+        columns[fn] = []
+    for block_number in blocks:
+        block_data = cache[str(block_number)]
+        epoch = None
+        for fn in FUNCTION_NAMES:
+            entry = block_data.get(fn)
+            value = entry.get("value") if isinstance(entry, dict) else None
+            if value is not None:
+                value = int(value) if fn in INT_FUNCTIONS else float(value)
+            if epoch is None and isinstance(entry, dict):
+                epoch = entry.get("epoch")
+            columns[fn].append(value)
+        columns["epoch"].append(epoch)
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+def table_to_cache(table, human_readable=False):
+    """
+    Convert an Arrow table (any subset of the function columns) back to the nested cache dict.
+    Null cells are left out, like a function that was never fetched for that block.
+    """
+    columns = table.to_pydict()
+    blocks = columns.pop("block")
+    epochs = columns.pop("epoch")
+    cache = {}
+    for row, (block_number, epoch) in enumerate(zip(blocks, epochs)):
+        readable = format_block_time(epoch) if human_readable and epoch is not None else None
+        block_data = {}
+        for fn, values in columns.items():
+            value = values[row]
+            if value is None:
+                continue
+            entry = {"value": value, "epoch": epoch}
+            if human_readable:
+                entry["human_readable"] = readable
+            block_data[fn] = entry
+        if block_data:
+            cache[str(block_number)] = block_data
+    return cache
+
+def write_table(path, table):
+    """Write a pool table to Parquet atomically: temp file in the same directory, then rename"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp_path, path)
+
+def append_segment(store_path, table):
+    """
+    Append new rows to a store as one segment file, cost is O(rows in table).
+    Returns the number of segments waiting for compaction.
+    """
+    if table.num_rows == 0:
+        return len(list_segments(store_path))
+    wal_dir = get_wal_dir(store_path)
+    wal_dir.mkdir(parents=True, exist_ok=True)
+    write_table(wal_dir / f"{time.time_ns():020d}-{os.getpid()}.parquet", table)
+    return len(list_segments(store_path))
+
+def window_filters(start_block=None, end_block=None, start_time=None, end_time=None):
+    """Parquet filters for a [start, end) block and/or epoch window, None for everything"""
+    filters = []
+    if start_block is not None:
+        filters.append(("block", ">=", int(start_block)))
+    if end_block is not None:
+        filters.append(("block", "<", int(end_block)))
+    if start_time is not None:
+        filters.append(("epoch", ">=", int(start_time)))
+    if end_time is not None:
+        filters.append(("epoch", "<", int(end_time)))
+    return filters or None
+
+def _read_file(path, columns, filters=None):
+    """Read one Parquet file, keeping only the requested columns it has and the row groups the filters can match"""
+    if columns is None:
+        return pq.read_table(path, filters=filters).cast(SCHEMA)
+    available = set(pq.read_schema(path).names)
+    return pq.read_table(path, columns=[column for column in columns if column in available], filters=filters)
+
+def latest_epoch(store_path):
+    """
+    Newest block timestamp of a store. The main file answers from its row group statistics
+    (footer only, no data read), segments are small and read directly.
+    """
+    store_path = Path(store_path)
+    epochs = []
+    if store_path.exists():
+        metadata = pq.ParquetFile(store_path).metadata
+        epoch_column = metadata.schema.to_arrow_schema().get_field_index("epoch")
+        statistics = [metadata.row_group(row_group).column(epoch_column).statistics
+                      for row_group in range(metadata.num_row_groups)]
+        if all(stats is not None and stats.has_min_max for stats in statistics):
+            epochs.extend(stats.max for stats in statistics)
+        else:
+            epochs.append(pc.max(pq.read_table(store_path, columns=["epoch"]).column("epoch")).as_py())
+    for segment in list_segments(store_path):
+        epochs.append(pc.max(pq.read_table(segment, columns=["epoch"]).column("epoch")).as_py())
+    epochs = [epoch for epoch in epochs if epoch is not None]
+    return max(epochs) if epochs else None
+
+def store_range(store_path):
+    """
+    [file name, rows, first block, last block] of the main file and every segment, from the
+    Parquet footers only (no data read). Changes whenever blocks are appended or compacted.
+    """
+    store_path = Path(store_path)
+    ranges = []
+    for file_path in ([store_path] if store_path.exists() else []) + list_segments(store_path):
+        metadata = pq.ParquetFile(file_path).metadata
+        block_column = metadata.schema.to_arrow_schema().get_field_index("block")
+        statistics = [metadata.row_group(row_group).column(block_column).statistics
+                      for row_group in range(metadata.num_row_groups)]
+        if statistics and all(stats is not None and stats.has_min_max for stats in statistics):
+            first_block, last_block = min(stats.min for stats in statistics), max(stats.max for stats in statistics)
+        else:
+            first_block = last_block = None
+        ranges.append([file_path.name, metadata.num_rows, first_block, last_block])
+    return ranges
+
+def _first_block(file_path):
+    """Smallest block of a Parquet file, from the footer statistics if they have it"""
+    metadata = pq.ParquetFile(file_path).metadata
+    block_column = metadata.schema.to_arrow_schema().get_field_index("block")
+    statistics = [metadata.row_group(row_group).column(block_column).statistics
+                  for row_group in range(metadata.num_row_groups)]
+    if statistics and all(stats is not None and stats.has_min_max for stats in statistics):
+        return min(stats.min for stats in statistics)
+    return pc.min(pq.read_table(file_path, columns=["block"]).column("block")).as_py()
+
+def _segment_generation(segment):
+    return int(segment.stem.split("-")[0])
+
+def _read_changes(store_path):
+    changes_path = get_changes_path(store_path)
+    if not changes_path.exists():
+        return {"horizon": 0, "segments": []}
+    with open(changes_path, "r") as f:
+        return json.load(f)
+
+def _log_changes(store_path, segments):
+    """Add [generation, first block] of compacted segments to the change log, keeping the newest CHANGES_KEPT"""
+    changes = _read_changes(store_path)
+    entries = changes["segments"] + [list(segment) for segment in segments]
+    dropped = entries[:-CHANGES_KEPT]
+    if dropped:
+        changes["horizon"] = max([changes["horizon"]] + [generation for generation, _ in dropped])
+    changes["segments"] = entries[-CHANGES_KEPT:]
+    changes_path = get_changes_path(store_path)
+    tmp_path = changes_path.with_name(changes_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(changes, f)
+    os.replace(tmp_path, changes_path)
+
+def store_changes(store_path, since=None):
+    """
+    (generation, first_block) of a pool store. The generation grows with every appended segment;
+    first_block is the smallest block written after generation `since`: None if nothing was, 0 if
+    the change log no longer reaches back that far (or `since` is None).
+    """
+    store_path = Path(store_path)
+    segments = []
+    for segment in list_segments(store_path):
+        try:
+            segments.append((_segment_generation(segment), _first_block(segment)))
+        except FileNotFoundError:
+            pass  # compacted in the meantime, the log read below has it
+    changes = _read_changes(store_path)
+    segments += [tuple(entry) for entry in changes["segments"]]
+    generation = max([changes["horizon"]] + [segment_generation for segment_generation, _ in segments])
+    if since is None or since < changes["horizon"]:
+        return generation, 0
+    first_blocks = [first_block for segment_generation, first_block in segments if segment_generation > since]
+    return generation, min(first_blocks) if first_blocks else None
+
+def _latest_rows(table):
+    """Keep the last row of every block (later rows come from newer segments), sorted by block"""
+    blocks = table.column("block").to_numpy()
+    # Stable sort by block keeps the write order within a block, the last one wins
+    order = np.argsort(blocks, kind="stable")
+    sorted_blocks = blocks[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = sorted_blocks[:-1] != sorted_blocks[1:]
+    return table.take(pa.array(order[keep]))
+
+def read_table(path, columns=None, segments=None, start_block=None, end_block=None, start_time=None, end_time=None):
+    """
+    Read a pool table: the main Parquet file plus its write-ahead segments, newest row per block.
+    columns is a list of function names; block and epoch are always included.
+    Function columns the files do not have are skipped.
+    start_block/end_block and start_time/end_time (epoch seconds) restrict the read to a
+    [start, end) window; row groups outside of it are not decoded.
+    """
+    path = Path(path)
+    if columns is not None:
+        columns = ["block", "epoch"] + [fn for fn in columns if fn not in ("block", "epoch")]
+    if segments is None:
+        segments = list_segments(path)
+    filters = window_filters(start_block, end_block, start_time, end_time)
+    tables = [_read_file(file_path, columns, filters) for file_path in ([path] if path.exists() else []) + list(segments)]
+    if not tables:
+        raise FileNotFoundError(f"No store at {path}")
+    if len(tables) == 1:
+        return tables[0]
+    return _latest_rows(pa.concat_tables(tables, promote_options="default"))
+
+def compact_store(store_path, remove_wal_dir=True, columns=None):
+    """
+    Merge the current segments into the main file (atomic rename), then delete those segments.
+    Segments appended while compacting are left for the next compaction. Background
+    compactions keep the empty .wal directory so a concurrent append_segment never loses it.
+    columns is needed for stores that do not have the pool schema (derived_store.py); pool
+    stores (columns None) log the merged segments for store_changes() before deleting them.
+    """
+    store_path = Path(store_path)
+    segments = list_segments(store_path)
+    if not segments:
+        return 0
+    write_table(store_path, read_table(store_path, columns, segments=segments))
+    if columns is None:
+        _log_changes(store_path, [(_segment_generation(segment), _first_block(segment)) for segment in segments])
+    for segment in segments:
+        segment.unlink()
+    if remove_wal_dir:
+        try:
+            get_wal_dir(store_path).rmdir()
+        except OSError:
+            pass  # new segments arrived in the meantime
+    return len(segments)
+
+def compact_in_background(store_path):
+    """Start compact_store in a thread, unless one is already running for this store"""
+    key = str(Path(store_path).resolve())
+    with _compactions_lock:
+        running = _compactions.get(key)
+        if running is not None and running.is_alive():
+            return running
+        thread = threading.Thread(target=compact_store, args=(store_path, False), name=f"compact {Path(store_path).name}")
+        _compactions[key] = thread
+        thread.start()
+        return thread
+
+def wait_for_compactions():
+    """Block until every background compaction has finished"""
+    with _compactions_lock:
+        threads = list(_compactions.values())
+    for thread in threads:
+        thread.join()
+
+def _block_epoch(block_data):
+    """Timestamp of a legacy JSON cache entry (every function entry carries the same epoch)"""
+    for entry in block_data.values():
+        if isinstance(entry, dict) and entry.get("epoch") is not None:
+            return entry["epoch"]
+    return None
+
+def _in_window(block_number, epoch, start_block, end_block, start_time, end_time):
+    if start_block is not None and block_number < start_block:
+        return False
+    if end_block is not None and block_number >= end_block:
+        return False
+    if start_time is not None and (epoch is None or epoch < start_time):
+        return False
+    if end_time is not None and (epoch is None or epoch >= end_time):
+        return False
+    return True
+
+def load_pool_data(chain_name, pool_address, columns=None, data_dir=DATA_DIR,
+                   start_block=None, end_block=None, start_time=None, end_time=None, last_hours=None):
+    """
+    Load the history of a pool as the nested dict the plot scripts parse, reading only
+    `columns` (function names, None for all) and only the blocks in the [start, end) window.
+    last_hours selects the window ending at the newest cached block (start_time is derived
+    from it). Falls back to the legacy JSON cache if the pool has not been converted to
+    Parquet yet; the JSON is loaded whole and filtered afterwards.
+    """
+    store_path = get_store_path(chain_name, pool_address, data_dir)
+    if store_exists(store_path):
+        if last_hours is not None:
+            newest = latest_epoch(store_path)
+            if newest is not None:
+                start_time = newest - int(last_hours * 3600)
+        return table_to_cache(read_table(store_path, columns, start_block=start_block, end_block=end_block,
+                                         start_time=start_time, end_time=end_time))
+
+    json_path = get_json_path(chain_name, pool_address, data_dir)
+    if not json_path.exists():
+        raise FileNotFoundError(f"No data for {pool_address} on {chain_name}: neither {store_path} nor {json_path} exists")
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    if last_hours is not None:
+        epochs = [epoch for epoch in map(_block_epoch, data.values()) if epoch is not None]
+        if epochs:
+            start_time = max(epochs) - int(last_hours * 3600)
+    if any(bound is not None for bound in (start_block, end_block, start_time, end_time)):
+        data = {
+            block_str: block_data for block_str, block_data in data.items()
+            if _in_window(int(block_str), _block_epoch(block_data), start_block, end_block, start_time, end_time)
+        }
+    if columns is None:
+        return data
+    wanted = set(columns)
+    return {
+        block_str: {fn: entry for fn, entry in block_data.items() if fn in wanted}
+        for block_str, block_data in data.items()
+    }
+
+def convert_json_cache(json_path):
+    """Write the Parquet file next to a legacy JSON cache, returns the Parquet path"""
+    json_path = Path(json_path)
+    with open(json_path, "r") as f:
+        cache = json.load(f)
+    store_path = json_path.with_suffix(".parquet")
+    table = cache_to_table(cache)
+    write_table(store_path, table)
+    if table.num_rows:
+        # A rewrite of the whole history: one change from its first block
+        _log_changes(store_path, [(time.time_ns(), table.column("block")[0].as_py())])
+    return store_path
+
+
+if __name__ == "__main__":
+    # Convert every legacy JSON cache under data/<chain_name>/ and compare size and load time
+    for json_path in sorted(DATA_DIR.glob("*/0x*.json")):
+        if "." in json_path.stem:
+            continue  # <address>.changes.json
+        store_path = convert_json_cache(json_path)
+
+        started = time.perf_counter()
+        with open(json_path, "r") as f:
+            json.load(f)
+        json_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        table = read_table(store_path)
+        parquet_seconds = time.perf_counter() - started
+
+        json_size = json_path.stat().st_size
+        parquet_size = store_path.stat().st_size
+        print(f"{json_path} -> {store_path.name}: {table.num_rows} blocks, "
+              f"{json_size / 1e6:.2f} MB -> {parquet_size / 1e6:.2f} MB ({json_size / parquet_size:.0f}x), "
+              f"load {json_seconds * 1000:.0f} ms -> {parquet_seconds * 1000:.0f} ms")
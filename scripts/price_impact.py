@@ -0,0 +1,400 @@
+"""
+Price-impact surfaces of fxswap pools: get_dy / get_dx over a grid of trade sizes in both
+directions, at many blocks.
+
+Sizes are coin0 amounts (USDC for the USDC pools). At every block the pool is asked for
+
+    sell coin0   get_dy(0, 1, size)   coin1 received for `size` coin0
+    sell coin1   get_dx(1, 0, size)   coin1 needed to receive `size` coin0
+
+and for the same two quotes of a reference trade (REFERENCE_FRACTION of the smallest size).
+The two reference prices bracket the pool's mid price (their geometric mean), so per block,
+direction and size:
+
+    price        effective price, coin0 per coin1
+    cost_bps     loss against the mid price: fee plus impact
+    impact_bps   loss against the reference trade of the same direction: what the size adds
+
+Quote sources:
+
+    --source rpc   the deployed pool at each block: one Multicall3 aggregate3 eth_call per block
+                   carries the whole size grid (multicall.py), --batch-blocks blocks per
+                   JSON-RPC batch, --workers batches in flight (RPC_URLS / RPC, see rpc_pool.py)
+    --source sim   the recorded pool state at each block (balances, price_scale of
+                   get_historical_data.py) in fxswap_sim.py, all blocks x sizes of a chunk in one
+                   vectorized call, chunks on --workers processes. The parameters are the pool's
+                   own, read once at the last quoted block (RPC_URLS / RPC), --param overrides
+                   them; without an RPC at least REQUIRED_PARAMS must be given with --param
+
+Blocks are --blocks, or --max-blocks spread evenly over --from-block..--to-block, or over the
+blocks of the pool history (optionally only the --last-hours). The sim source quotes the history
+row at or before each block, blocks before the first recorded row are skipped.
+
+The surface (one row per block, direction and size) is written to
+data/<chain_name>/<address>.impact/<name>.parquet, the slippage table (median and p90 cost,
+median impact per size and direction over the blocks) and the heatmaps (cost over block time x
+size per direction, cost and impact per size) to plots/<chain_name>/price_impact/:
+
+    python scripts/price_impact.py --index 2
+    python scripts/price_impact.py --index 2 --source sim --param A=40e4 --name a40 --last-hours 168
+    python scripts/price_impact.py --index 3 --blocks 37817520 37900000 --sizes 10 100 1000 10000 100000
+"""
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from eth_utils import function_signature_to_4byte_selector
+from pool_store import DATA_DIR, write_table
+from multicall import MULTICALL3_ADDRESS, encode_aggregate3, decode_aggregate3
+from pool_history import load_pool_frame, pool_decimals, normalize_history
+from sweep_params import parse_params
+
+DEFAULT_SIZES = list(np.geomspace(10, 1_000_000, 16))
+MAX_BLOCKS = 100
+# Reference trade: this fraction of the smallest size
+REFERENCE_FRACTION = 0.01
+BATCH_BLOCKS = 10
+CHUNK_BLOCKS = 50
+HISTORY_COLUMNS = ["price_scale", "balances(0)", "balances(1)"]
+PLOTS_DIR = Path("plots")
+
+GET_DY = function_signature_to_4byte_selector("get_dy(uint256,uint256,uint256)").hex()
+GET_DX = function_signature_to_4byte_selector("get_dx(uint256,uint256,uint256)").hex()
+# Pool getters of the fxswap_sim parameters. packed_rebalancing_params holds allowed_extra_profit,
+# adjustment_step and ma_time as stored (the ma_time() getter returns it scaled by ln 2)
+PARAM_GETTERS = ["A", "gamma", "mid_fee", "out_fee", "fee_gamma", "packed_rebalancing_params", "donation_duration",
+                 "donation_protection_period", "donation_protection_lp_threshold", "donation_shares_max_ratio"]
+# Parameters the quotes depend on, never taken from fxswap_sim.DEFAULT_PARAMS
+REQUIRED_PARAMS = ["A", "mid_fee", "out_fee", "fee_gamma"]
+
+
+def get_impact_path(chain_name, pool_address, name, data_dir=DATA_DIR):
+    """Surface of a run: data/<chain_name>/<address>.impact/<name>.parquet"""
+    return Path(data_dir) / chain_name / f"{pool_address}.impact" / f"{name}.parquet"
+
+def quote_grid(sizes):
+    """Reference size first, then the sizes"""
+    return np.r_[min(sizes) * REFERENCE_FRACTION, np.asarray(sizes, dtype=np.float64)]
+
+def impact_frame(blocks, epochs, grid, coin1_out, coin1_in):
+    """
+    Long surface frame from (blocks x grid) quotes: coin1_out of selling grid coin0,
+    coin1_in for buying grid coin0. Column 0 of the grid is the reference trade.
+    """
+    ask = grid / coin1_out   # coin0 paid per coin1
+    bid = grid / coin1_in    # coin0 received per coin1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mid = np.sqrt(ask[:, :1] * bid[:, :1])
+        directions = {
+            0: (coin1_out, ask, (ask / mid - 1) * 10**4, (ask / ask[:, :1] - 1) * 10**4),
+            1: (coin1_in, bid, (1 - bid / mid) * 10**4, (1 - bid / bid[:, :1]) * 10**4),
+        }
+    frames = []
+    n, m = coin1_out.shape
+    for sold, (coin1, price, cost, impact) in directions.items():
+        frames.append(pd.DataFrame({
+            "block": np.repeat(blocks, m - 1),
+            "epoch": np.repeat(epochs, m - 1),
+            "sold": sold,
+            "size": np.tile(grid[1:], n),
+            "coin1": coin1[:, 1:].ravel(),
+            "price": price[:, 1:].ravel(),
+            "mid": np.repeat(mid[:, 0], m - 1),
+            "cost_bps": cost[:, 1:].ravel(),
+            "impact_bps": impact[:, 1:].ravel(),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _rpc_calls(pool_address, grid, decimals):
+    """aggregate3 call list of one block: get_dy(0, 1, size) and get_dx(1, 0, size) per grid size"""
+    calls = []
+    for size in grid:
+        raw = f"{int(round(size * 10**decimals[0])):064x}"
+        calls.append((pool_address, "0x" + GET_DY + f"{0:064x}{1:064x}" + raw))
+        calls.append((pool_address, "0x" + GET_DX + f"{1:064x}{0:064x}" + raw))
+    return tuple(calls)
+
+def quote_rpc(rpc_pool, pool_address, blocks, grid, decimals):
+    """
+    Quotes of the deployed pool at `blocks`, one JSON-RPC batch of aggregate3 eth_calls and block
+    headers. A rejected batch is split in half. Returns (epochs, coin1_out, coin1_in), NaN for
+    calls that reverted and blocks that failed
+    """
+    from rpc_pool import RpcError
+    calldata = encode_aggregate3(_rpc_calls(pool_address, grid, decimals))
+    payload = []
+    for n, block in enumerate(blocks):
+        payload.append({"jsonrpc": "2.0", "id": 2 * n, "method": "eth_getBlockByNumber", "params": [hex(block), False]})
+        payload.append({"jsonrpc": "2.0", "id": 2 * n + 1, "method": "eth_call",
+                        "params": [{"to": MULTICALL3_ADDRESS, "data": calldata}, hex(block)]})
+    try:
+        body = rpc_pool.post(payload)
+        if not isinstance(body, list):
+            raise RpcError(f"batch rejected: {body.get('error') if isinstance(body, dict) else body}")
+    except RpcError as e:
+        if len(blocks) == 1:
+            print(f"  block {blocks[0]} failed: {e}")
+            return np.array([np.nan]), np.full((1, len(grid)), np.nan), np.full((1, len(grid)), np.nan)
+        half = len(blocks) // 2
+        first, second = quote_rpc(rpc_pool, pool_address, blocks[:half], grid, decimals), \
+            quote_rpc(rpc_pool, pool_address, blocks[half:], grid, decimals)
+        return tuple(np.concatenate([a, b]) for a, b in zip(first, second))
+
+    responses = {item.get("id"): item for item in body}
+    epochs = np.full(len(blocks), np.nan)
+    quotes = np.full((len(blocks), 2 * len(grid)), np.nan)
+    for n, block in enumerate(blocks):
+        header, call = responses.get(2 * n, {}), responses.get(2 * n + 1, {})
+        if header.get("result"):
+            epochs[n] = int(header["result"]["timestamp"], 16)
+        if "result" not in call:
+            print(f"  block {block} failed: {call.get('error')}")
+            continue
+        for k, (success, data) in enumerate(decode_aggregate3(bytes.fromhex(call["result"][2:]))):
+            if success and len(data) == 32:
+                quotes[n, k] = int.from_bytes(data, "big") / 10**decimals[1]
+    return epochs, quotes[:, 0::2], quotes[:, 1::2]
+
+def read_pool_params(rpc_pool, pool_address, block):
+    """fxswap_sim parameters of the deployed pool at `block` (contract units), one aggregate3 eth_call"""
+    from rpc_pool import RpcError
+    calls = tuple((pool_address, "0x" + function_signature_to_4byte_selector(f"{getter}()").hex())
+                  for getter in PARAM_GETTERS)
+    body = rpc_pool.post({"jsonrpc": "2.0", "id": rpc_pool.next_id(), "method": "eth_call",
+                          "params": [{"to": MULTICALL3_ADDRESS, "data": encode_aggregate3(calls)}, hex(block)]})
+    if not isinstance(body, dict) or "result" not in body:
+        raise RpcError(f"reading the parameters failed: {body.get('error') if isinstance(body, dict) else body}")
+    params = {}
+    for getter, (success, data) in zip(PARAM_GETTERS, decode_aggregate3(bytes.fromhex(body["result"][2:]))):
+        if success and len(data) == 32:
+            params[getter] = int.from_bytes(data, "big")
+    packed = params.pop("packed_rebalancing_params", None)
+    if packed is not None:
+        mask = 2**64 - 1
+        params.update(allowed_extra_profit=(packed >> 128) & mask, adjustment_step=(packed >> 64) & mask,
+                      ma_time=packed & mask)
+    return params
+
+def quote_sim(states, params, grid):
+    """Quotes of fxswap_sim pools built from history rows (balances, price_scale): (coin1_out, coin1_in)"""
+    from fxswap_sim import FxswapSim
+    n, m = len(states), len(grid)
+    sim = FxswapSim(params, amounts=(np.repeat(states["balances(0)"].to_numpy(), m),
+                                     np.repeat(states["balances(1)"].to_numpy(), m)),
+                    initial_price=np.repeat(states["price_scale"].to_numpy(), m))
+    sizes = np.tile(grid, n)
+    coin1_out = sim.get_dy(0, 1, sizes).reshape(n, m)
+    coin1_in = sim.get_dx(1, 0, sizes).reshape(n, m)
+    return coin1_out, coin1_in
+
+
+def select_blocks(history, blocks=None, from_block=None, to_block=None, max_blocks=MAX_BLOCKS):
+    """Blocks to quote: the given ones, max_blocks evenly in from_block..to_block, or history blocks thinned to max_blocks"""
+    if blocks:
+        return np.array(sorted(set(blocks)), dtype=np.int64)
+    if from_block is not None and to_block is not None:
+        return np.unique(np.linspace(from_block, to_block, max_blocks).round().astype(np.int64))
+    if history is None or history.empty:
+        return np.array([], dtype=np.int64)
+    history_blocks = history.index.to_numpy(np.int64)
+    if from_block is not None:
+        history_blocks = history_blocks[history_blocks >= from_block]
+    if to_block is not None:
+        history_blocks = history_blocks[history_blocks <= to_block]
+    if len(history_blocks) > max_blocks:
+        history_blocks = history_blocks[np.linspace(0, len(history_blocks) - 1, max_blocks).round().astype(np.int64)]
+    return history_blocks
+
+def slippage_table(surface, symbols):
+    """Median / p90 cost and median impact (bps) per size, one column group per direction"""
+    names = {0: f"{symbols[0]}->{symbols[1]}", 1: f"{symbols[1]}->{symbols[0]}"}
+    grouped = surface.groupby(["sold", "size"])
+    table = pd.DataFrame({
+        "cost_bps_median": grouped["cost_bps"].median(),
+        "cost_bps_p90": grouped["cost_bps"].quantile(0.9),
+        "impact_bps_median": grouped["impact_bps"].median(),
+        "quoted_blocks": grouped["cost_bps"].count(),
+    }).unstack("sold")
+    table.columns = [f"{names[sold]} {column}" for column, sold in table.columns]
+    return table
+
+def plot_surface(surface, symbols, title, output_path):
+    """Cost heatmap over block time x size per direction, and median cost / impact per size"""
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    import matplotlib.colors as mcolors
+
+    by_time = surface["epoch"].notna().all()
+    fig, axes = plt.subplots(3, 1, figsize=(14, 14))
+    # Costs span decades (a fee at small sizes, most of the trade near the pool's depth): log colors
+    positive = surface["cost_bps"][np.isfinite(surface["cost_bps"]) & (surface["cost_bps"] > 0)]
+    vmin = max(np.percentile(positive, 1), 0.1) if len(positive) else 0.1
+    norm = mcolors.LogNorm(vmin=vmin, vmax=max(np.percentile(positive, 99), vmin * 10) if len(positive) else 1.0)
+    for ax, sold in zip(axes[:2], (0, 1)):
+        grid = surface[surface["sold"] == sold].pivot_table(index="size", columns="block", values="cost_bps")
+        x = grid.columns.to_numpy()
+        if by_time:
+            epochs = surface.drop_duplicates("block").set_index("block")["epoch"]
+            x = mdates.date2num(pd.to_datetime(epochs.loc[grid.columns].to_numpy(), unit="s"))
+        values = np.clip(grid.to_numpy(), norm.vmin, None)
+        mesh = ax.pcolormesh(x, grid.index.to_numpy(), values, shading="nearest", cmap="viridis", norm=norm)
+        ax.set_yscale("log")
+        ax.set_ylabel(f"Size ({symbols[0]})", fontsize=10)
+        ax.set_title(f"Cost vs mid (bps), sell {symbols[sold]}", fontsize=12, fontweight="bold")
+        if by_time:
+            ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d %H:%M"))
+            ax.tick_params(axis="x", rotation=45)
+        else:
+            ax.set_xlabel("Block", fontsize=10)
+        fig.colorbar(mesh, ax=ax, label="bps")
+
+    ax = axes[2]
+    for sold, color in ((0, "tab:blue"), (1, "tab:orange")):
+        grouped = surface[surface["sold"] == sold].groupby("size")
+        sizes = grouped["cost_bps"].median().index.to_numpy()
+        ax.plot(sizes, grouped["cost_bps"].median(), color=color, label=f"sell {symbols[sold]}: cost (median)")
+        ax.fill_between(sizes, grouped["cost_bps"].quantile(0.1), grouped["cost_bps"].quantile(0.9), color=color, alpha=0.2)
+        ax.plot(sizes, grouped["impact_bps"].median(), color=color, linestyle="--", label=f"sell {symbols[sold]}: impact (median)")
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel(f"Size ({symbols[0]})", fontsize=10)
+    ax.set_ylabel("bps", fontsize=10)
+    ax.set_title("Cost and impact by size (band: p10-p90 over blocks)", fontsize=12, fontweight="bold")
+    ax.legend(fontsize=8, loc="upper left")
+    ax.grid(True, alpha=0.3)
+
+    fig.suptitle(title, fontsize=14, fontweight="bold")
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=150, bbox_inches="tight")
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    from plot_all import load_pools
+
+    parser = argparse.ArgumentParser(description='get_dy / get_dx price-impact surfaces of a pool over sizes and blocks')
+    parser.add_argument('--index', type=int, required=True, help='Pool of config/fxswaps.json')
+    parser.add_argument('--source', choices=['rpc', 'sim'], default='rpc',
+                        help='Quote the deployed pool (rpc) or its recorded state in fxswap_sim (sim)')
+    parser.add_argument('--name', type=str, default=None, help='Name of the run in the output paths (default: the source)')
+    parser.add_argument('--param', nargs='+', default=[],
+                        help="sim: name=value in contract units, overrides the pool's own (fxswap_sim.DEFAULT_PARAMS names)")
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEFAULT_SIZES,
+                        help='Trade sizes in coin0 (default: 16 sizes from 10 to 1e6)')
+    parser.add_argument('--blocks', type=int, nargs='+', default=None, help='Quote at these blocks')
+    parser.add_argument('--from-block', type=int, default=None)
+    parser.add_argument('--to-block', type=int, default=None)
+    parser.add_argument('--last-hours', type=float, default=None, help='Only history blocks of the last hours')
+    parser.add_argument('--max-blocks', type=int, default=MAX_BLOCKS, help=f'Blocks to quote at most (default: {MAX_BLOCKS})')
+    parser.add_argument('--batch-blocks', type=int, default=BATCH_BLOCKS,
+                        help=f'rpc: blocks per JSON-RPC batch (default: {BATCH_BLOCKS})')
+    parser.add_argument('--decimals', type=int, nargs=2, default=None, help='Coin decimals (default: from the pool name)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='rpc: batches in flight, sim: worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    pools = load_pools()
+    if args.index not in pools:
+        print(f"Error: No pool with index {args.index}, available indices: {list(pools.keys())}")
+        exit(1)
+    pool = pools[args.index]
+    params = parse_params(args.param, False)
+    if any(len(values) > 1 for values in params.values()):
+        print("Error: one value per --param, a grid of parameters is sweep_params.py's job")
+        exit(1)
+    params = {name: values[0] for name, values in params.items()}
+    decimals = tuple(args.decimals or pool_decimals(pool["name"]))
+    symbols = tuple(pool["name"].split()[0].split("/")[:2]) if "/" in pool["name"] else ("coin0", "coin1")
+    name = args.name or args.source
+    grid = quote_grid(args.sizes)
+
+    history = None
+    try:
+        history = load_pool_frame(pool["chain_name"], pool["address"], columns=HISTORY_COLUMNS,
+                                  last_hours=args.last_hours).dropna(subset=HISTORY_COLUMNS)
+        history = normalize_history(history, decimals)
+    except FileNotFoundError:
+        pass
+    blocks = select_blocks(history, args.blocks, args.from_block, args.to_block, args.max_blocks)
+    if len(blocks) == 0:
+        print("Error: no blocks to quote, give --blocks / --from-block --to-block or fetch the pool history first")
+        exit(1)
+    print(f"{pool['name']}: {len(blocks)} blocks x {len(args.sizes)} sizes x 2 directions ({args.source}, "
+          f"{args.workers} workers)")
+
+    started = time.time()
+    parts = []
+    if args.source == "rpc":
+        from rpc_pool import RpcPool
+        rpc_pool = RpcPool.from_env()
+        batches = [blocks[start:start + args.batch_blocks] for start in range(0, len(blocks), args.batch_blocks)]
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(quote_rpc, rpc_pool, pool["address"], list(batch), grid, decimals): batch
+                       for batch in batches}
+            for future in as_completed(futures):
+                epochs, coin1_out, coin1_in = future.result()
+                parts.append(impact_frame(futures[future], epochs, grid, coin1_out, coin1_in))
+        for line in rpc_pool.summary():
+            print(f"  {line}")
+    else:
+        if history is None or history.empty:
+            print(f"Error: no recorded history of {pool['name']}, run get_historical_data.py --index {args.index} first")
+            exit(1)
+        # History row at or before every block
+        rows = np.searchsorted(history.index.to_numpy(np.int64), blocks, side="right") - 1
+        if (rows < 0).any():
+            print(f"  Skipping {(rows < 0).sum()} blocks before the first recorded row {history.index[0]}")
+            rows = rows[rows >= 0]
+        if len(rows) == 0:
+            print("Error: every block is before the recorded history")
+            exit(1)
+        states = history.iloc[rows]
+
+        # The pool's own parameters, --param on top
+        pool_params = {}
+        if os.getenv("RPC_URLS") or os.getenv("RPC"):
+            from rpc_pool import RpcPool, RpcError
+            try:
+                pool_params = read_pool_params(RpcPool.from_env(), pool["address"], int(blocks[-1]))
+                print(f"  Pool parameters at block {blocks[-1]}: "
+                      + ", ".join(f"{key}={value}" for key, value in pool_params.items()))
+            except RpcError as e:
+                print(f"  {e}")
+        params = {**pool_params, **params}
+        missing = [key for key in REQUIRED_PARAMS if key not in params]
+        if missing:
+            print("Error: the sim source needs the pool's parameters, set RPC / RPC_URLS or give --param "
+                  + " ".join(f"{key}=..." for key in missing))
+            exit(1)
+        chunks = [states.iloc[start:start + CHUNK_BLOCKS] for start in range(0, len(states), CHUNK_BLOCKS)]
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(quote_sim, chunk, params, grid): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                coin1_out, coin1_in = future.result()
+                parts.append(impact_frame(chunk.index.to_numpy(np.int64), chunk["epoch"].to_numpy(np.float64),
+                                          grid, coin1_out, coin1_in))
+    surface = pd.concat(parts, ignore_index=True).sort_values(["block", "sold", "size"], ignore_index=True)
+    print(f"Quoted {len(surface)} trades in {time.time() - started:.1f}s, "
+          f"{surface['cost_bps'].isna().sum()} failed or out of reach")
+
+    impact_path = get_impact_path(pool["chain_name"], pool["address"], name)
+    impact_path.parent.mkdir(parents=True, exist_ok=True)
+    write_table(impact_path, pa.Table.from_pandas(surface, preserve_index=False))
+
+    plot_dir = PLOTS_DIR / pool["chain_name"] / "price_impact"
+    plot_dir.mkdir(parents=True, exist_ok=True)
+    safe_name = "".join(c for c in pool["name"].replace("/", "_").replace(" ", "_") if c.isalnum() or c in "-_.")
+    table = slippage_table(surface, symbols)
+    table_path = plot_dir / f"{safe_name}_{name}_slippage.csv"
+    table.to_csv(table_path, float_format="%.4f")
+    chart_path = plot_dir / f"{safe_name}_{name}_price_impact.png"
+    plot_surface(surface, symbols, f"{pool['name']} price impact ({name}, {len(blocks)} blocks)", chart_path)
+
+    print(table.filter(like="median").to_string(float_format=lambda value: f"{value:.2f}"))
+    print(f"Surface: {impact_path}\nTable: {table_path}\nChart: {chart_path}")
@@ -0,0 +1,135 @@
+"""
+Render cache for plot_all.py: a chart is only drawn again when its inputs changed.
+
+The key of a render job hashes
+
+    - the input data range of the pool: rows and first/last block of the Parquet store's main
+      file and segments (pool_store.store_range, footers only), or size and mtime of a legacy
+      JSON cache
+    - the chart parameters: the job's command line (window, --full-resolution, ...) and the
+      pool's entry in fxswaps.json
+    - the code version: the source of the plot script and of the modules it renders with
+      (constants like TIME_WINDOW_HOURS or PIXELS_PER_DAY live there), plus CACHE_VERSION
+
+A job is skipped when plots/render_cache.json has the same key for it and every PNG it wrote
+last time still exists. After one pool was updated, a full refresh only renders that pool:
+
+    cache = RenderCache()
+    key = cache.key(pool, script_path, argv)
+    if cache.lookup(job_id, key):
+        ...  # up to date
+    cache.record(job_id, key, outputs)
+    cache.save()
+    print(cache.summary())
+"""
+import json
+import hashlib
+from pathlib import Path
+from pool_store import DATA_DIR, get_store_path, get_json_path, store_exists, store_range
+
+CACHE_PATH = Path("plots") / "render_cache.json"
+# Bump to invalidate every cached chart
+CACHE_VERSION = 1
+
+# Local modules the plot scripts render with, part of the code version
+RENDER_MODULES = [
+    "pool_store.py",
+    "pool_history.py",
+    "derived_store.py",
+    "pool_metrics.py",
+    "pool_pyramid.py",
+    "donation_usage.py",
+    "downsample.py",
+]
+SCRIPTS_DIR = Path(__file__).parent
+
+
+def data_range(chain_name, pool_address, data_dir=DATA_DIR):
+    """Signature of the history a pool's charts are drawn from"""
+    store_path = get_store_path(chain_name, pool_address, data_dir)
+    if store_exists(store_path):
+        return {"store": store_range(store_path)}
+    json_path = get_json_path(chain_name, pool_address, data_dir)
+    if json_path.exists():
+        stat = json_path.stat()
+        return {"json": [stat.st_size, stat.st_mtime_ns]}
+    return None
+
+def _source_hash(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Render job keys and their outputs, kept in one JSON file, with hit/miss counts of this run"""
+
+    def __init__(self, path=CACHE_PATH, data_dir=DATA_DIR):
+        self.path = Path(path)
+        self.data_dir = data_dir
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._code_versions = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                self.entries = {}
+
+    def code_version(self, script_path):
+        """Hash of a plot script and the modules it renders with"""
+        script_path = Path(script_path)
+        if script_path not in self._code_versions:
+            self._code_versions[script_path] = _source_hash(
+                [script_path] + [SCRIPTS_DIR / module for module in RENDER_MODULES])
+        return self._code_versions[script_path]
+
+    def key(self, pool, script_path, argv):
+        """Key of a render job, None if the pool has no data (never cached)"""
+        inputs = data_range(pool["chain_name"], pool["address"], self.data_dir)
+        if inputs is None:
+            return None
+        payload = {
+            "version": CACHE_VERSION,
+            "data": inputs,
+            "pool": pool,
+            "argv": list(argv),
+            "code": self.code_version(script_path),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def lookup(self, job_id, key):
+        """True (a hit) if the job's outputs are up to date for this key"""
+        entry = self.entries.get(job_id)
+        hit = (key is not None and entry is not None and entry["key"] == key and bool(entry["outputs"])
+               and all(Path(output).exists() for output in entry["outputs"]))
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return hit
+
+    def record(self, job_id, key, outputs):
+        """Remember the outputs a successful render wrote for this key"""
+        if key is None:
+            return
+        self.entries[job_id] = {"key": key, "outputs": sorted(str(output) for output in outputs)}
+
+    def forget(self, job_id):
+        self.entries.pop(job_id, None)
+
+    def save(self):
+        """Write the cache file atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        tmp_path.replace(self.path)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"Render cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% up to date)"
@@ -0,0 +1,349 @@
+"""
+Replay a pool's historical order flow against a local fxswap.vy with other parameters.
+
+The pool's events (index_events.py: data/<chain_name>/<address>.events/, or a --fixture of raw
+logs written by index_events.py --record) are re-executed in order on a LocalPool
+(fxswap_local.py), at the block and time they happened:
+
+    TokenExchange                   the same amount of the same coin is sold
+    AddLiquidity                    the same amounts are deposited
+    Donation (+ its AddLiquidity)   the same amounts are donated
+    RemoveLiquidity*                LP shares worth the same value at the local price_scale are
+                                    burned, RemoveLiquidityOne in the same coin, the others balanced
+    NewParameters, ClaimAdminFee    not replayed, the parameters of a variant stay fixed
+
+The local pool starts from the recorded history (get_historical_data.py) at the first replayed
+block: its balances at its price_scale, the donation_shares part of them as one fresh donation.
+Without history it starts with --tvl at the first event's price_scale, or empty when the replay
+begins with the pool's creation. Calls that revert under the other parameters are skipped and
+counted as failed.
+
+Every --param combination (lists form a grid, like sweep_params.py) is one variant, replayed by a
+worker of a process pool inside one EVM snapshot. The events run in steps of at least
+--step-events (whole blocks); the pool is read once per step, not once per swap, and the step is
+appended to the variant's table (pool_store.py segments, one row per step keyed by its last block):
+
+    data/<chain_name>/<address>.replay/<name>/variant-NNN.parquet
+
+    block, epoch, events, trades, failed, hist_price_scale (the real pool's price_scale at the
+    step's last TokenExchange / AddLiquidity), price_scale, price_oracle, last_prices,
+    virtual_price, xcp_profit, totalSupply, donation_shares, balance_0, balance_1
+
+spec.json records the command line and points.parquet the parameters of every variant,
+load_replay() reads all variants back into one frame.
+
+    python scripts/replay_trades.py --index 1 --name a40 --param A=5e4,40e4
+    python scripts/replay_trades.py --index 1 --name fees --param A=40e4 out_fee=1e7,2e7 --from-block 38000000
+    python scripts/replay_trades.py --index 1 --name fixture --fixture logs.json --param A=40e4 --tvl 100000
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pool_store import DATA_DIR, COMPACT_AFTER_SEGMENTS, get_wal_dir, write_table, append_segment, compact_store, read_table
+from index_events import decode_logs, load_events
+from pool_history import load_pool_frame, pool_decimals, normalize_history
+from sweep_params import parse_params, sweep_points
+
+REPLAY_EVENTS = ["TokenExchange", "AddLiquidity", "Donation", "RemoveLiquidity", "RemoveLiquidityOne",
+                 "RemoveLiquidityImbalance"]
+STEP_EVENTS = 100
+# Exact amount columns (index_events.py) each kind of event is replayed with
+EXACT_AMOUNTS = {
+    "exchange": ["tokens_sold_exact"],
+    "deposit": ["token_amounts_0_exact", "token_amounts_1_exact"],
+    "donation": ["token_amounts_0_exact", "token_amounts_1_exact"],
+    "remove": ["token_amounts_0_exact", "token_amounts_1_exact"],
+    "remove_one": ["coin_amount_exact"],
+}
+# Steps kept in memory before they are appended as one segment
+FLUSH_STEPS = 200
+# Seconds per block, for logs without a timestamp
+BLOCK_TIMES = {8453: 2, 1: 12}
+HISTORY_COLUMNS = ["price_scale", "donation_shares", "totalSupply", "balances(0)", "balances(1)"]
+STATE_COLUMNS = ["price_scale", "price_oracle", "last_prices", "virtual_price", "xcp_profit", "totalSupply",
+                 "donation_shares", "balance_0", "balance_1"]
+STEP_COLUMNS = ["events", "trades", "failed", "hist_price_scale"] + STATE_COLUMNS
+
+_events = None
+
+
+def get_replay_dir(chain_name, pool_address, name, data_dir=DATA_DIR):
+    """Directory of a replay: data/<chain_name>/<address>.replay/<name>/"""
+    return Path(data_dir) / chain_name / f"{pool_address}.replay" / name
+
+def _fill_epochs(blocks, epochs, block_time):
+    """Timestamps for logs without one: from the nearest earlier (else the first) known log, block_time per block"""
+    known = np.flatnonzero(~np.isnan(epochs))
+    if len(known) == 0:
+        return int(time.time()) + (blocks - blocks[0]) * block_time
+    nearest = known[np.clip(np.searchsorted(known, np.arange(len(blocks)), side="right") - 1, 0, None)]
+    return np.where(np.isnan(epochs), epochs[nearest] + (blocks - blocks[nearest]) * block_time, epochs).astype(np.int64)
+
+def load_replay_events(pool, fixture=None, from_block=None, to_block=None):
+    """
+    Events of a pool to replay, sorted by (block, log_index), with a `kind` per row:
+    exchange, deposit, donation, remove, remove_one, or None (a Donation log, replayed with its AddLiquidity)
+    """
+    if fixture is not None:
+        with open(fixture, "r") as f:
+            logs = [log for log in json.load(f) if log["address"].lower() == pool["address"].lower()]
+        table = decode_logs(logs).sort_by([("block", "ascending"), ("log_index", "ascending")])
+    else:
+        table = load_events(pool["chain_name"], pool["address"], events=REPLAY_EVENTS)
+    frame = table.to_pandas()
+    frame = frame[frame["event"].isin(REPLAY_EVENTS)]
+    if from_block is not None:
+        frame = frame[frame["block"] >= from_block]
+    if to_block is not None:
+        frame = frame[frame["block"] <= to_block]
+    frame = frame.reset_index(drop=True)
+    if frame.empty:
+        return frame
+
+    frame["epoch"] = _fill_epochs(frame["block"].to_numpy(), frame["epoch"].to_numpy(np.float64),
+                                  BLOCK_TIMES.get(pool["chain_id"], 2))
+    # A donation logs Donation and right after it the AddLiquidity of the same call
+    after_donation = ((frame["event"].shift() == "Donation") & (frame["block"].shift() == frame["block"])
+                      & (frame["log_index"].shift() == frame["log_index"] - 1))
+    kinds = frame["event"].map({"TokenExchange": "exchange", "AddLiquidity": "deposit", "RemoveLiquidity": "remove",
+                                "RemoveLiquidityOne": "remove_one", "RemoveLiquidityImbalance": "remove"})
+    kinds[(frame["event"] == "AddLiquidity") & after_donation] = "donation"
+    frame["kind"] = kinds.astype(object).where(kinds.notna(), None)
+
+    # The amounts are replayed exactly, segments indexed before the _exact columns existed have none
+    missing = np.zeros(len(frame), dtype=bool)
+    for kind, columns in EXACT_AMOUNTS.items():
+        missing |= (frame["kind"] == kind).to_numpy() & frame[columns].isna().any(axis=1).to_numpy()
+    if missing.any():
+        raise ValueError(f"{missing.sum()} events from block {frame.loc[missing, 'block'].iloc[0]} have no exact amounts, "
+                         f"re-index them: python scripts/index_events.py --index <index> "
+                         f"--from-block {frame.loc[missing, 'block'].iloc[0]}")
+    return frame
+
+def initial_state(pool, events, tvl=None):
+    """
+    Starting point of the local pool: {'price', 'deposit', 'donation'} (amounts in token units,
+    None for an empty pool). From --tvl, else from the recorded history at the first replayed block.
+    """
+    first_block = int(events["block"].iloc[0])
+    priced = events["price_scale"].notna() & events["event"].isin(["TokenExchange", "AddLiquidity"])
+    price = events.loc[priced, "price_scale"].iloc[0] / 10**18 if priced.any() else 1.0
+    if tvl is not None:
+        return {"price": price, "deposit": [tvl / 2, tvl / 2 / price], "donation": None}
+    try:
+        history = load_pool_frame(pool["chain_name"], pool["address"], columns=HISTORY_COLUMNS, end_block=first_block)
+        history = normalize_history(history.dropna(subset=HISTORY_COLUMNS), pool_decimals(pool["name"]))
+    except FileNotFoundError:
+        history = pd.DataFrame()
+    if history.empty:
+        return {"price": price, "deposit": None, "donation": None}
+    row = history.iloc[-1]
+    balances = np.array([row["balances(0)"], row["balances(1)"]])
+    donated = row["donation_shares"] / row["totalSupply"] if row["totalSupply"] > 0 else 0.0
+    return {"price": float(row["price_scale"]), "deposit": list(balances * (1 - donated)),
+            "donation": list(balances * donated) if donated > 0 else None}
+
+
+def _matching_lp(local, amounts):
+    """LP shares of the trader worth the same as `amounts` (raw) at the local price_scale"""
+    price = local.pool.price_scale() / 10**18
+    balance_0, balance_1 = local.balances()
+    value = local.units(0, amounts[0]) + local.units(1, amounts[1]) * price
+    share = min(value / (balance_0 + balance_1 * price), 1.0) if balance_0 + balance_1 > 0 else 0.0
+    return min(int(local.pool.totalSupply() * share), local.pool.balanceOf(local.trader))
+
+def _apply(local, row):
+    """Re-execute one event on the local pool, with the logged integer amounts"""
+    if row.kind == "exchange":
+        local.exchange_raw(int(row.sold_id), int(row.tokens_sold_exact))
+    elif row.kind in ("deposit", "donation"):
+        local.add_liquidity_raw([int(row.token_amounts_0_exact), int(row.token_amounts_1_exact)],
+                                donation=row.kind == "donation")
+    elif row.kind == "remove_one":
+        amounts = [0, 0]
+        amounts[int(row.coin_index)] = int(row.coin_amount_exact)
+        lp = _matching_lp(local, amounts)
+        if lp > 0:
+            local.remove_liquidity_raw(lp, int(row.coin_index))
+    elif row.kind == "remove":
+        lp = _matching_lp(local, [int(row.token_amounts_0_exact), int(row.token_amounts_1_exact)])
+        if lp > 0:
+            local.remove_liquidity_raw(lp)
+
+def _init_worker(events):
+    """Process pool initializer: the events are sent once per worker, not once per variant"""
+    global _events
+    _events = events
+
+def replay_variant(variant, params, store_path, options):
+    """
+    Replay the events on a fresh local pool with `params` and write the steps to store_path.
+    Returns (variant, summary dict)
+    """
+    import boa
+    from boa.contracts.base_evm_contract import BoaError
+    from fxswap_local import LocalPool
+
+    events = _events
+    started = time.time()
+    shutil.rmtree(get_wal_dir(store_path), ignore_errors=True)
+    store_path.unlink(missing_ok=True)
+    boa.env.enable_fast_mode()
+    seed = options["seed"]
+    totals = {"events": 0, "trades": 0, "failed": 0}
+    steps = []
+
+    def record(block, epoch, counts, hist_price_scale):
+        state = local.state()
+        steps.append({"block": block, "epoch": epoch, **counts, "hist_price_scale": hist_price_scale,
+                      **{column: state[column] for column in STATE_COLUMNS}})
+        if len(steps) >= FLUSH_STEPS:
+            flush()
+
+    def flush():
+        if append_segment(store_path, pa.Table.from_pylist(steps)) >= COMPACT_AFTER_SEGMENTS:
+            compact_store(store_path, columns=STEP_COLUMNS)
+        steps.clear()
+
+    with boa.env.anchor():
+        boa.env.evm.patch.timestamp = int(events["epoch"].iloc[0])
+        boa.env.evm.patch.block_number = int(events["block"].iloc[0])
+        local = LocalPool(params, initial_price=seed["price"], decimals=options["decimals"],
+                          symbols=options["symbols"])
+        if seed["deposit"] is not None:
+            local.add_liquidity(seed["deposit"])
+        if seed["donation"] is not None:
+            # One donation of the recorded donation_shares, within the donation cap of the variant
+            cap = local.params["donation_shares_max_ratio"] / 10**18 * 0.99
+            deposited = sum(seed["deposit"][i] * (seed["price"] if i else 1) for i in range(2))
+            donated = sum(seed["donation"][i] * (seed["price"] if i else 1) for i in range(2))
+            scale = min(1.0, cap / (1 - cap) * deposited / donated)
+            local.add_liquidity([amount * scale for amount in seed["donation"]], donation=True)
+        record(int(events["block"].iloc[0]), int(events["epoch"].iloc[0]), {"events": 0, "trades": 0, "failed": 0},
+               seed["price"])
+
+        counts = {"events": 0, "trades": 0, "failed": 0}
+        hist_price_scale = np.nan
+        last_block = last_epoch = None
+        for row in events.itertuples(index=False):
+            if row.kind is None:
+                continue
+            if row.block != last_block and counts["events"] >= options["step_events"]:
+                record(last_block, last_epoch, counts, hist_price_scale)
+                for key in totals:
+                    totals[key] += counts[key]
+                counts = {"events": 0, "trades": 0, "failed": 0}
+            local.advance_to(row.epoch, row.block)
+            counts["events"] += 1
+            counts["trades"] += row.kind == "exchange"
+            try:
+                _apply(local, row)
+            except BoaError:
+                counts["failed"] += 1
+            if row.kind in ("exchange", "deposit", "donation") and not np.isnan(row.price_scale):
+                hist_price_scale = row.price_scale / 10**18
+            last_block, last_epoch = row.block, row.epoch
+        if counts["events"]:
+            record(last_block, last_epoch, counts, hist_price_scale)
+            for key in totals:
+                totals[key] += counts[key]
+        flush()
+        final = local.state()
+
+    compact_store(store_path, columns=STEP_COLUMNS)
+    return variant, {**totals, **{column: final[column] for column in STATE_COLUMNS},
+                     "hist_price_scale": hist_price_scale, "seconds": time.time() - started}
+
+def load_replay(chain_name, pool_address, name, data_dir=DATA_DIR):
+    """All steps of a replay, one frame with a variant column and the variant's parameters"""
+    replay_dir = get_replay_dir(chain_name, pool_address, name, data_dir)
+    points = pq.read_table(replay_dir / "points.parquet").to_pandas()
+    frames = []
+    for variant in points.index:
+        store_path = replay_dir / f"variant-{variant:03d}.parquet"
+        if store_path.exists():
+            frame = read_table(store_path, STEP_COLUMNS).to_pandas()
+            frame.insert(0, "variant", variant)
+            frames.append(frame.join(points, on="variant"))
+    if not frames:
+        raise FileNotFoundError(f"No replay '{name}' for {pool_address} on {chain_name}")
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    from plot_all import load_pools
+
+    parser = argparse.ArgumentParser(description='Replay the historical events of a pool on local fxswap pools with other parameters')
+    parser.add_argument('--index', type=int, required=True, help='Pool of config/fxswaps.json')
+    parser.add_argument('--name', type=str, required=True, help='Replay name, results in data/<chain>/<address>.replay/<name>/')
+    parser.add_argument('--param', nargs='+', default=[],
+                        help='name=v1,v2,... in contract units (grid), others keep fxswap_sim.DEFAULT_PARAMS')
+    parser.add_argument('--fixture', type=str, default=None, help='Raw logs from this JSON file (index_events.py --record)')
+    parser.add_argument('--from-block', type=int, default=None, help='First block to replay')
+    parser.add_argument('--to-block', type=int, default=None, help='Last block to replay')
+    parser.add_argument('--tvl', type=float, default=None,
+                        help='Start with this pool value in coin0 (balanced) instead of the recorded history')
+    parser.add_argument('--decimals', type=int, nargs=2, default=None, help='Coin decimals (default: from the pool name)')
+    parser.add_argument('--step-events', type=int, default=STEP_EVENTS,
+                        help=f'Events per recorded step, rounded up to whole blocks (default: {STEP_EVENTS})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    pools = load_pools()
+    if args.index not in pools:
+        print(f"Error: No pool with index {args.index}, available indices: {list(pools.keys())}")
+        exit(1)
+    pool = pools[args.index]
+    events = load_replay_events(pool, args.fixture, args.from_block, args.to_block)
+    if events.empty:
+        print(f"Error: No events of {pool['name']} to replay, run index_events.py --index {args.index} first")
+        exit(1)
+    seed = initial_state(pool, events, args.tvl)
+    points = sweep_points(parse_params(args.param, False))
+    symbols = tuple(pool["name"].split()[0].split("/")[:2]) if "/" in pool["name"] else ("COIN0", "COIN1")
+    options = {"seed": seed, "decimals": tuple(args.decimals or pool_decimals(pool["name"])), "symbols": symbols,
+               "step_events": args.step_events}
+
+    replay_dir = get_replay_dir(pool["chain_name"], pool["address"], args.name)
+    replay_dir.mkdir(parents=True, exist_ok=True)
+    for path in replay_dir.glob("variant-*.parquet"):
+        path.unlink()
+    write_table(replay_dir / "points.parquet", pa.Table.from_pandas(points, preserve_index=False))
+    with open(replay_dir / "spec.json", "w") as f:
+        json.dump({"index": args.index, "param": args.param, "fixture": args.fixture, "from_block": args.from_block,
+                   "to_block": args.to_block, "tvl": args.tvl, "step_events": args.step_events, "seed": seed,
+                   "decimals": options["decimals"]}, f, indent=1)
+
+    counts = events["event"].value_counts().to_dict()
+    print(f"{pool['name']}: {len(events)} events in blocks {events['block'].iloc[0]}..{events['block'].iloc[-1]} {counts}")
+    if seed["deposit"] is None:
+        print(f"Starting from an empty pool at price {seed['price']:.6g}")
+    else:
+        print(f"Starting with {seed['deposit'][0]:.6g} + {seed['deposit'][1]:.6g} at price {seed['price']:.6g}"
+              + (f", donation {seed['donation'][0]:.6g} + {seed['donation'][1]:.6g}" if seed["donation"] else ""))
+    print(f"{len(points)} variants with {args.workers} workers")
+
+    started = time.time()
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(events,)) as executor:
+        futures = [executor.submit(replay_variant, variant, points.loc[variant].to_dict(),
+                                   replay_dir / f"variant-{variant:03d}.parquet", options)
+                   for variant in points.index]
+        for future in as_completed(futures):
+            variant, summary = future.result()
+            summaries[variant] = summary
+            print(f"  variant {variant}: {summary['events']} events ({summary['failed']} failed) "
+                  f"in {summary['seconds']:.1f}s, {summary['events'] / max(summary['seconds'], 1e-9):.0f} events/s")
+    print(f"Replayed {len(points)} variants in {time.time() - started:.1f}s: {replay_dir}")
+
+    summary = pd.concat([points, pd.DataFrame.from_dict(summaries, orient="index")], axis=1)
+    print(summary[list(points.columns) + ["failed", "hist_price_scale", "price_scale", "virtual_price", "xcp_profit",
+                                          "donation_shares"]].to_string())
@@ -0,0 +1,272 @@
+"""
+Record / replay JSON-RPC traffic, so the fetchers can run and be benchmarked without a live RPC.
+
+record: a local proxy that forwards every request (single or batch) to the real endpoints
+(RPC_URLS / RPC, through rpc_pool.py) and stores each call with its response in a cassette.
+replay: a local server that answers only from the cassette, with a configurable latency per
+HTTP request and optional provider limits (maximum batch size), so the sequential / async /
+batch modes of get_historical_data.py can be compared deterministically on an offline machine.
+
+The cassette is one SQLite file. A call is keyed by the SHA-256 of its canonical (method, params)
+JSON, the JSON-RPC id is not part of the key. Request and response are stored zlib compressed.
+Batches are split into their calls, so a replayed batch may be composed differently from the
+recorded ones. Recording the same call again keeps the newest response ("latest" tags).
+
+    # record a backfill (the scripts only see a different RPC url)
+    python scripts/rpc_cassette.py record --cassette data/cassettes/base.sqlite --port 8546 &
+    RPC=http://localhost:8546 python scripts/get_historical_data.py --chain=base --mode=batch
+
+    # replay it offline, 80 ms per HTTP request, batches above 50 calls are rejected
+    python scripts/rpc_cassette.py replay --cassette data/cassettes/base.sqlite --port 8546 --latency 0.08 --max-batch 50 &
+    RPC=http://localhost:8546 python scripts/get_historical_data.py --chain=base --mode=batch
+
+    python scripts/rpc_cassette.py stats --cassette data/cassettes/base.sqlite
+"""
+import json
+import time
+import zlib
+import random
+import signal
+import hashlib
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rpc_pool import RpcPool, RpcError
+
+DEFAULT_CASSETTE = Path("data") / "cassettes" / "rpc.sqlite"
+DEFAULT_PORT = 8546
+
+# Same code providers use for an unknown / unsupported call
+NOT_RECORDED_ERROR_CODE = -32601
+
+
+def call_key(method, params):
+    """Cassette key of a call: SHA-256 of its canonical JSON, independent of the JSON-RPC id"""
+    canonical = json.dumps([method, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).digest()
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class Cassette:
+    """SQLite file of recorded JSON-RPC calls; safe to share between the server threads"""
+
+    def __init__(self, path, readonly=False):
+        self.path = Path(path)
+        if readonly:
+            if not self.path.exists():
+                raise FileNotFoundError(f"No cassette at {self.path}")
+            self.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS calls ("
+                "key BLOB PRIMARY KEY, method TEXT NOT NULL, request BLOB NOT NULL, response BLOB NOT NULL, "
+                "recorded_at REAL NOT NULL)"
+            )
+            self.connection.commit()
+        self.lock = threading.Lock()
+
+    def get(self, method, params):
+        """Recorded response of a call ({'result': ...} or {'error': ...}), None if it was never recorded"""
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM calls WHERE key = ?", (call_key(method, params),)).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def put_many(self, calls):
+        """Store (method, params, response) tuples; the response without id / jsonrpc"""
+        rows = [(call_key(method, params), method, _pack(params), _pack(response), time.time())
+                for method, params, response in calls]
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def stats(self):
+        """(method, calls, compressed bytes) per method, most calls first"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT method, COUNT(*), SUM(LENGTH(request) + LENGTH(response)) FROM calls "
+                "GROUP BY method ORDER BY COUNT(*) DESC"
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def _response_fields(item):
+    """Keep only the part of a JSON-RPC response that belongs in the cassette"""
+    return {key: item[key] for key in ("result", "error") if key in item}
+
+def _as_batch(payload):
+    return payload if isinstance(payload, list) else [payload]
+
+
+class CassetteHandler(BaseHTTPRequestHandler):
+    """JSON-RPC over HTTP POST; the server object carries the cassette and the mode settings"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self._send_json({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "parse error"}}, 400)
+            return
+        self.server.http_requests += 1
+        status, body = self.server.answer(payload)
+        self._send_json(body, status)
+
+
+class RecordServer(ThreadingHTTPServer):
+    """Forwards to the real endpoints and records every answered call"""
+
+    daemon_threads = True
+
+    def __init__(self, address, cassette, rpc_pool, verbose=False):
+        super().__init__(address, CassetteHandler)
+        self.cassette = cassette
+        self.rpc_pool = rpc_pool
+        self.verbose = verbose
+        self.http_requests = 0
+        self.recorded = 0
+
+    def answer(self, payload):
+        try:
+            body = self.rpc_pool.post(payload)
+        except RpcError as e:
+            return 502, {"jsonrpc": "2.0", "id": None, "error": {"code": -32603, "message": str(e)}}
+        if isinstance(payload, list) and not isinstance(body, list):
+            return 200, body  # the batch was refused as a whole, nothing to record
+
+        requests_by_id = {item.get("id"): item for item in _as_batch(payload)}
+        calls = []
+        for item in _as_batch(body):
+            request = requests_by_id.get(item.get("id")) if isinstance(item, dict) else None
+            if request is not None:
+                calls.append((request["method"], request.get("params", []), _response_fields(item)))
+        self.cassette.put_many(calls)
+        self.recorded += len(calls)
+        return 200, body
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Answers from the cassette only, with simulated latency and batch limit"""
+
+    daemon_threads = True
+
+    def __init__(self, address, cassette, latency=0.0, jitter=0.0, max_batch=None, verbose=False):
+        super().__init__(address, CassetteHandler)
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self.max_batch = max_batch
+        self.verbose = verbose
+        self.http_requests = 0
+        self.calls = 0
+        self.misses = 0
+
+    def _replay_call(self, request):
+        response = self.cassette.get(request.get("method"), request.get("params", []))
+        if response is None:
+            self.misses += 1
+            if self.verbose:
+                print(f"not in cassette: {request.get('method')} {json.dumps(request.get('params', []))[:200]}")
+            response = {"error": {"code": NOT_RECORDED_ERROR_CODE, "message": f"{request.get('method')} not recorded in cassette"}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), **response}
+
+    def answer(self, payload):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if isinstance(payload, list):
+            if self.max_batch is not None and len(payload) > self.max_batch:
+                return 200, {"jsonrpc": "2.0", "id": None,
+                             "error": {"code": -32600, "message": f"batch too large: {len(payload)} > {self.max_batch}"}}
+            self.calls += len(payload)
+            return 200, [self._replay_call(request) for request in payload]
+        self.calls += 1
+        return 200, self._replay_call(payload)
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record JSON-RPC traffic to a cassette or replay it offline')
+    parser.add_argument('mode', choices=['record', 'replay', 'stats'])
+    parser.add_argument('--cassette', type=str, default=str(DEFAULT_CASSETTE),
+                        help=f'Cassette file (default: {DEFAULT_CASSETTE})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Local port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--upstream', type=str, default=None,
+                        help='record: endpoints to forward to, comma separated (default: RPC_URLS / RPC)')
+    parser.add_argument('--latency', type=float, default=0.0, help='replay: seconds added to every HTTP request (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='replay: up to this many extra random seconds (default: 0)')
+    parser.add_argument('--max-batch', type=int, default=None,
+                        help='replay: reject JSON-RPC batches with more calls, like a provider (default: no limit)')
+    parser.add_argument('--verbose', action='store_true', help='Log every HTTP request')
+    args = parser.parse_args()
+
+    if args.mode == 'stats':
+        cassette = Cassette(args.cassette, readonly=True)
+        total_calls = 0
+        total_bytes = 0
+        for method, calls, size in cassette.stats():
+            print(f"{method:28s} {calls:9d} calls {size / 1e6:9.2f} MB")
+            total_calls += calls
+            total_bytes += size
+        print(f"{'total':28s} {total_calls:9d} calls {total_bytes / 1e6:9.2f} MB, file {Path(args.cassette).stat().st_size / 1e6:.2f} MB")
+        return
+
+    address = ("127.0.0.1", args.port)
+    if args.mode == 'record':
+        cassette = Cassette(args.cassette)
+        rpc_pool = RpcPool.from_env(args.upstream)
+        server = RecordServer(address, cassette, rpc_pool, verbose=args.verbose)
+        print(f"Recording to {args.cassette}, forwarding to {', '.join(endpoint.name() for endpoint in rpc_pool.endpoints)}")
+    else:
+        cassette = Cassette(args.cassette, readonly=True)
+        server = ReplayServer(address, cassette, latency=args.latency, jitter=args.jitter,
+                              max_batch=args.max_batch, verbose=args.verbose)
+        print(f"Replaying {args.cassette}, latency {args.latency * 1000:.0f} ms (+ up to {args.jitter * 1000:.0f} ms), "
+              f"max batch {args.max_batch or 'unlimited'}")
+    print(f"Listening on http://localhost:{args.port} (Ctrl+C to stop)")
+
+    # `kill` stops a backgrounded server as cleanly as Ctrl+C
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cassette.close()
+        if args.mode == 'record':
+            print(f"\n{server.http_requests} HTTP requests, {server.recorded} calls recorded")
+        else:
+            print(f"\n{server.http_requests} HTTP requests, {server.calls} calls, {server.misses} not in cassette")
+
+
+if __name__ == "__main__":
+    main()
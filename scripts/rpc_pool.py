@@ -0,0 +1,285 @@
+"""
+Shared JSON-RPC client over several endpoints per chain.
+
+Endpoints come from RPC_URLS (comma separated), falling back to RPC. A rate in requests per
+second can be given per endpoint after a '#' (the fragment is never sent to the server),
+otherwise RPC_RATE (default DEFAULT_RATE) applies:
+
+    export RPC_URLS="https://base-mainnet.g.alchemy.com/v2/KEY#25,https://mainnet.base.org#10"
+
+Every endpoint has a token bucket (a JSON-RPC batch costs one token per item) and a keep-alive
+requests.Session. A request goes to the healthiest endpoint that can take it soonest; rate
+limits (HTTP 429, -32005), HTTP 5xx, timeouts and connection errors put the endpoint in a
+jittered exponential cooldown and the request is retried on the next one. Throughput therefore
+follows the combined quota of all endpoints instead of a fixed sleep between calls.
+
+    rpc_pool = RpcPool.from_env()
+    w3 = Web3(PooledHTTPProvider(rpc_pool))
+    aw3 = AsyncWeb3(AsyncPooledHTTPProvider(rpc_pool))
+    responses = rpc_pool.post([{...}, {...}])   # raw JSON-RPC (single or batch)
+"""
+import os
+import time
+import random
+import asyncio
+import itertools
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+
+DEFAULT_RATE = 20  # requests per second per endpoint
+MAX_RETRIES = 6
+BACKOFF_BASE = 0.25  # seconds, doubled per consecutive failure of an endpoint
+BACKOFF_MAX = 30.0
+REQUEST_TIMEOUT = 60
+# Weight of the newest latency sample in the moving average used for routing
+LATENCY_EWMA = 0.2
+
+# JSON-RPC errors that mean "slow down", not "bad request"
+RATE_LIMIT_ERROR_CODES = {429, -32005, -32029}
+RATE_LIMIT_ERROR_HINTS = ("rate limit", "too many requests", "compute units", "throughput", "capacity")
+RETRY_HTTP_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RpcError(Exception):
+    """Every endpoint failed (or the request was not retryable)"""
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`; thread safe
+
+    A cost above the capacity is admitted once the bucket is full and charged in full: the bucket
+    goes into debt and the next request waits until it has refilled, so batches keep to the rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        """Seconds until a request of `cost` tokens is admitted (a cost above capacity waits for a full bucket)"""
+        with self.lock:
+            self._refill()
+            needed = min(cost, self.capacity) - self.tokens
+            return max(0.0, needed / self.rate)
+
+    def acquire(self, cost):
+        """Block until a request of `cost` tokens is admitted and charge all of them"""
+        admit = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= admit:
+                    self.tokens -= cost
+                    return
+                wait = (admit - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Endpoint:
+    """One RPC url with its bucket, keep-alive session and health"""
+
+    def __init__(self, url, rate=DEFAULT_RATE):
+        self.url = url
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=64))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=64))
+        self.latency = None
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def name(self):
+        """Url without path/query (keeps API keys out of the logs)"""
+        scheme, _, rest = self.url.partition("://")
+        return f"{scheme}://{rest.split('/')[0]}"
+
+    def record_success(self, seconds):
+        with self.lock:
+            self.requests += 1
+            self.consecutive_failures = 0
+            self.latency = seconds if self.latency is None else (1 - LATENCY_EWMA) * self.latency + LATENCY_EWMA * seconds
+
+    def record_failure(self, retry_after=None):
+        with self.lock:
+            self.requests += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.consecutive_failures - 1))
+            backoff = backoff * random.uniform(0.5, 1.5)  # jitter, so clients do not retry in lockstep
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+            self.cooldown_until = time.monotonic() + backoff
+
+    def expected_delay(self, cost):
+        """Routing score: seconds until this endpoint could answer (cooldown or bucket wait, plus latency)"""
+        cooldown = max(0.0, self.cooldown_until - time.monotonic())
+        return max(cooldown, self.bucket.wait_time(cost)) + (self.latency or 0.0)
+
+
+def _is_rate_limited(body):
+    """True if a JSON-RPC body (single or batch) is a rate limit answer"""
+    items = body if isinstance(body, list) else [body]
+    for item in items:
+        error = item.get("error") if isinstance(item, dict) else None
+        if not isinstance(error, dict):
+            continue
+        message = str(error.get("message", "")).lower()
+        if error.get("code") in RATE_LIMIT_ERROR_CODES or any(hint in message for hint in RATE_LIMIT_ERROR_HINTS):
+            return True
+    return False
+
+
+class RpcPool:
+    """Rate-limit-aware JSON-RPC client over several endpoints with failover"""
+
+    def __init__(self, endpoints, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT):
+        if not endpoints:
+            raise ValueError("RpcPool needs at least one endpoint (set RPC or RPC_URLS)")
+        self.endpoints = endpoints
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def from_env(cls, urls=None):
+        """Endpoints from `urls` (list or comma separated string), RPC_URLS or RPC"""
+        if urls is None:
+            urls = os.getenv("RPC_URLS") or os.getenv("RPC") or ""
+        if isinstance(urls, str):
+            urls = [url.strip() for url in urls.split(",") if url.strip()]
+        default_rate = float(os.getenv("RPC_RATE", DEFAULT_RATE))
+        endpoints = []
+        for url in urls:
+            url, _, rate = url.partition("#")
+            endpoints.append(Endpoint(url, float(rate) if rate else default_rate))
+        return cls(endpoints)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def _pick(self, cost, tried):
+        """Endpoint that can serve `cost` soonest, preferring ones not tried for this request"""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in tried] or self.endpoints
+        return min(candidates, key=lambda endpoint: endpoint.expected_delay(cost))
+
+    def post(self, payload):
+        """
+        POST one JSON-RPC request or batch, retrying on another endpoint when one is rate
+        limited or down. Returns the decoded body; JSON-RPC errors of the calls themselves
+        (reverts, bad params, oversized batch) are returned, not retried.
+        """
+        cost = len(payload) if isinstance(payload, list) else 1
+        tried = set()
+        last_error = None
+        for attempt in range(self.max_retries):
+            endpoint = self._pick(cost, tried)
+            tried.add(endpoint)
+            cooldown = endpoint.cooldown_until - time.monotonic()
+            if cooldown > 0:
+                time.sleep(cooldown)
+            endpoint.bucket.acquire(cost)
+            started = time.monotonic()
+            try:
+                response = endpoint.session.post(endpoint.url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                endpoint.record_failure()
+                last_error = f"{endpoint.name()}: {e}"
+                continue
+            if response.status_code in RETRY_HTTP_STATUS:
+                retry_after = response.headers.get("Retry-After")
+                endpoint.record_failure(float(retry_after) if retry_after and retry_after.isdigit() else None)
+                last_error = f"{endpoint.name()}: HTTP {response.status_code}"
+                continue
+            if response.status_code >= 400:
+                # Not a transient failure (e.g. 413 for an oversized batch): the caller has to change the request
+                endpoint.record_success(time.monotonic() - started)
+                raise RpcError(f"{endpoint.name()}: HTTP {response.status_code}: {response.text[:200]}")
+            try:
+                body = response.json()
+            except ValueError:
+                endpoint.record_failure()
+                last_error = f"{endpoint.name()}: HTTP {response.status_code}, invalid JSON {response.text[:200]}"
+                continue
+            if _is_rate_limited(body):
+                endpoint.record_failure()
+                last_error = f"{endpoint.name()}: rate limited"
+                continue
+            endpoint.record_success(time.monotonic() - started)
+            return body
+        raise RpcError(f"JSON-RPC request failed after {self.max_retries} attempts, last error: {last_error}")
+
+    def request(self, method, params):
+        """One JSON-RPC call, returns its result or raises RpcError"""
+        body = self.post({"jsonrpc": "2.0", "id": self.next_id(), "method": method, "params": params})
+        if "error" in body:
+            raise RpcError(f"{method} failed: {body['error']}")
+        return body["result"]
+
+    def summary(self):
+        """One line per endpoint: requests, failures, average latency"""
+        lines = []
+        for endpoint in self.endpoints:
+            latency = f"{endpoint.latency * 1000:.0f} ms" if endpoint.latency is not None else "n/a"
+            lines.append(f"{endpoint.name()}: {endpoint.requests} requests, {endpoint.failures} failed, "
+                         f"{endpoint.bucket.rate:g}/s, latency {latency}")
+        return lines
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """web3 provider that sends every request through an RpcPool"""
+
+    def __init__(self, rpc_pool, **kwargs):
+        super().__init__(**kwargs)
+        self.rpc_pool = rpc_pool
+
+    def make_request(self, method, params):
+        return self.rpc_pool.post({"jsonrpc": "2.0", "id": self.rpc_pool.next_id(), "method": method, "params": params})
+
+    def is_connected(self, show_traceback=False):
+        try:
+            self.rpc_pool.request("web3_clientVersion", [])
+            return True
+        except RpcError:
+            if show_traceback:
+                raise
+            return False
+
+
+class AsyncPooledHTTPProvider(AsyncJSONBaseProvider):
+    """AsyncWeb3 provider over an RpcPool; the blocking post runs in a worker thread"""
+
+    def __init__(self, rpc_pool, **kwargs):
+        super().__init__(**kwargs)
+        self.rpc_pool = rpc_pool
+
+    async def make_request(self, method, params):
+        return await asyncio.to_thread(
+            self.rpc_pool.post, {"jsonrpc": "2.0", "id": self.rpc_pool.next_id(), "method": method, "params": params}
+        )
+
+    async def is_connected(self, show_traceback=False):
+        try:
+            await asyncio.to_thread(self.rpc_pool.request, "web3_clientVersion", [])
+            return True
+        except RpcError:
+            if show_traceback:
+                raise
+            return False
+
+    async def disconnect(self):
+        """Sessions belong to the pool and stay open for the other clients"""
+        return None
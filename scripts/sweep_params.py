@@ -0,0 +1,259 @@
+"""
+Parallel parameter sweep of fxswap pools over a recorded price series (see fxswap_sim.py).
+
+Every point of a grid or of a random sample of pool parameters is replayed against the same
+price path: an arbitrageur trades the pool to each price, the pool is refueled periodically
+and the outcome is written per point. The points are split into chunks of --chunk-size
+configurations, each chunk is one vectorized simulation on a process pool, so a sweep scales
+with the cores:
+
+    python scripts/sweep_params.py --name a_fee --index 1 --param A=20e4,40e4,80e4 mid_fee=3e6,5e6 out_fee=1e7,2e7
+    python scripts/sweep_params.py --name random --index 1 --samples 5000 --param A=2e4:8e5 ma_time=600:86400
+    python scripts/sweep_params.py --name a_fee              # resume: runs only the chunks without results
+
+--param takes contract units (like create_pool.py): name=v1,v2,... for a list of values and, with
+--samples, name=low:high for a log-uniform range. Without --samples the lists form a full grid.
+Parameters not given keep their fxswap_sim.DEFAULT_PARAMS value.
+
+A sweep lives in data/sweeps/<name>/: spec.json (the command line that defines it),
+prices.parquet (the price path, frozen at the first run), points.parquet, one
+parts/chunk-NNNNN.parquet per finished chunk and results.parquet (all chunks, one row per point):
+
+    refuel_cost                 value donated by the refuels, in coin0
+    refuel_cost_pct             refuel_cost in % of the initial pool value
+    price_scale_lag_mean        time-weighted mean of |price_scale / price - 1|
+    price_scale_lag_max         largest |price_scale / price - 1|
+    vp_growth                   virtual_price - 1 at the end
+    xcp_profit_growth           xcp_profit - 1 at the end
+    donation_depletion_seconds  time until donation_shares first fell to DEPLETED_FRACTION of the
+                                initial donation (NaN: never)
+    donation_shares_end, rebalances, burned_shares, volume, fees
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pool_store import DATA_DIR, write_table
+from fxswap_sim import FxswapSim, DEFAULT_PARAMS
+
+SWEEP_DIR = Path(DATA_DIR) / "sweeps"
+CHUNK_SIZE = 256
+# donation_shares at or below this fraction of the initial donation count as depleted
+DEPLETED_FRACTION = 0.01
+
+_prices = None
+
+
+def parse_params(specs, sampled):
+    """{name: [values]} or {name: (low, high)} from name=v1,v2 / name=low:high"""
+    params = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in DEFAULT_PARAMS or not values:
+            raise ValueError(f"Bad --param {spec!r}, parameters: {', '.join(DEFAULT_PARAMS)}")
+        if ':' in values:
+            if not sampled:
+                raise ValueError(f"Range {spec!r} needs --samples")
+            low, high = (float(value) for value in values.split(':'))
+            params[name] = (low, high)
+        else:
+            params[name] = [float(value) for value in values.split(',')]
+    return params
+
+def sweep_points(params, samples=None, seed=0):
+    """Parameter frame, one row per point: the full grid of the lists, or `samples` random points"""
+    if samples is None:
+        names = list(params)
+        grid = list(itertools.product(*(params[name] for name in names)))
+        return pd.DataFrame(grid, columns=names)
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, values in params.items():
+        if isinstance(values, tuple):
+            low, high = values
+            columns[name] = np.exp(rng.uniform(np.log(low), np.log(high), samples))
+        else:
+            columns[name] = rng.choice(values, samples)
+    return pd.DataFrame(columns, index=range(samples))
+
+def load_prices(index=None, csv_path=None, column='last_prices', last_hours=None, resample=None):
+    """(timestamps, prices) of a pool's history column or of a CSV with timestamp (unix) and price columns"""
+    if csv_path is not None:
+        frame = pd.read_csv(csv_path)
+        timestamps, prices = frame['timestamp'].to_numpy(np.int64), frame['price'].to_numpy(np.float64)
+    else:
+        from plot_all import load_pools
+        from pool_history import load_pool_frame, pool_decimals, normalize_history
+        pool = load_pools()[index]
+        frame = load_pool_frame(pool['chain_name'], pool['address'], columns=[column], last_hours=last_hours)
+        frame = normalize_history(frame, pool_decimals(pool['name']))
+        frame = frame[frame[column].notna()]
+        timestamps, prices = frame['epoch'].to_numpy(np.int64), frame[column].to_numpy(np.float64)
+    if resample:
+        # Last price of every resample bucket
+        buckets = timestamps // resample
+        last = np.r_[buckets[1:] != buckets[:-1], True]
+        timestamps, prices = timestamps[last], prices[last]
+    return timestamps, prices
+
+def simulate(points, timestamps, prices, tvl, donation_fraction, refuel_interval, refuel_fraction):
+    """Replay the price path for a frame of points, returns the metrics frame (same index)"""
+    sim = FxswapSim({name: points[name].to_numpy() for name in points.columns},
+                    amounts=(tvl / 2, tvl / 2 / prices[0]), initial_price=prices[0], timestamp=timestamps[0])
+    initial_value = sim.value(prices[0])
+    sim.refuel(donation_fraction, prices[0], timestamps[0])
+    seed_shares = sim.donation_shares.copy()
+
+    weights = np.diff(timestamps, append=timestamps[-1]).astype(np.float64)
+    lag_sum = np.zeros(sim.size)
+    lag_max = np.zeros(sim.size)
+    volume = np.zeros(sim.size)
+    fees = np.zeros(sim.size)
+    refuel_cost = np.zeros(sim.size)
+    depletion = np.full(sim.size, np.nan)
+    next_refuel = timestamps[0] + refuel_interval if refuel_interval else np.inf
+
+    for step in range(1, len(timestamps)):
+        timestamp, price = timestamps[step], prices[step]
+        step_volume, step_fees = sim.arbitrage(price, timestamp)
+        volume += step_volume
+        fees += step_fees
+        if timestamp >= next_refuel:
+            refuel_cost += sim.refuel(refuel_fraction, price, timestamp)
+            while next_refuel <= timestamp:
+                next_refuel += refuel_interval
+        lag = np.abs(sim.price_scale / price - 1)
+        lag_sum += lag * weights[step]
+        lag_max = np.maximum(lag_max, lag)
+        depleted = np.isnan(depletion) & (sim.donation_shares <= seed_shares * DEPLETED_FRACTION)
+        depletion[depleted] = timestamp - timestamps[0]
+
+    duration = max(float(weights[1:].sum()), 1.0)
+    return pd.DataFrame({
+        'refuel_cost': refuel_cost,
+        'refuel_cost_pct': refuel_cost / initial_value * 100,
+        'price_scale_lag_mean': lag_sum / duration,
+        'price_scale_lag_max': lag_max,
+        'vp_growth': sim.virtual_price - 1,
+        'xcp_profit_growth': sim.xcp_profit - 1,
+        'donation_depletion_seconds': depletion,
+        'donation_shares_end': sim.donation_shares,
+        'rebalances': sim.rebalances,
+        'burned_shares': sim.burned_shares,
+        'volume': volume,
+        'fees': fees,
+    }, index=points.index)
+
+
+def _init_worker(timestamps, prices):
+    """Process pool initializer: the price path is sent once per worker, not once per chunk"""
+    global _prices
+    _prices = (timestamps, prices)
+
+def run_chunk(chunk, points, part_path, options):
+    """Simulate one chunk of points and write its part file. Returns (chunk, seconds)"""
+    started = time.time()
+    metrics = simulate(points, *_prices, **options)
+    results = pd.concat([points, metrics], axis=1)
+    results.insert(0, 'point', points.index.to_numpy(np.int64))
+    write_table(part_path, pa.Table.from_pandas(results, preserve_index=False))
+    return chunk, time.time() - started
+
+
+def _spec(args):
+    return {
+        'param': args.param, 'samples': args.samples, 'seed': args.seed, 'index': args.index, 'csv': args.csv,
+        'column': args.column, 'last_hours': args.last_hours, 'resample': args.resample, 'tvl': args.tvl,
+        'donation_fraction': args.donation_fraction, 'refuel_interval': args.refuel_interval,
+        'refuel_fraction': args.refuel_fraction, 'chunk_size': args.chunk_size,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a price series through a sweep of fxswap pool parameters')
+    parser.add_argument('--name', type=str, required=True, help='Sweep name, results in data/sweeps/<name>/')
+    parser.add_argument('--param', nargs='+', default=None,
+                        help='name=v1,v2,... (list) or name=low:high (log-uniform range, with --samples)')
+    parser.add_argument('--samples', type=int, default=None, help='Random points instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random points (default: 0)')
+    parser.add_argument('--index', type=int, default=None, help='Price series from this pool of config/fxswaps.json')
+    parser.add_argument('--csv', type=str, default=None, help='Price series from a CSV with timestamp and price')
+    parser.add_argument('--column', type=str, default='last_prices', help='History column of --index (default: last_prices)')
+    parser.add_argument('--last-hours', type=float, default=None, help='Only the last hours of the history')
+    parser.add_argument('--resample', type=int, default=None, help='Keep the last price per this many seconds')
+    parser.add_argument('--tvl', type=float, default=1_000_000, help='Initial pool value in coin0, balanced (default: 1e6)')
+    parser.add_argument('--donation-fraction', type=float, default=0.05,
+                        help='Initial donation as a fraction of the pool (default: 0.05)')
+    parser.add_argument('--refuel-interval', type=int, default=86400, help='Seconds between refuels, 0 for none')
+    parser.add_argument('--refuel-fraction', type=float, default=0.01,
+                        help='Fraction of the pool donated per refuel (default: 0.01)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help=f'Points per job (default: {CHUNK_SIZE})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes (default: CPU count)')
+    parser.add_argument('--restart', action='store_true', help='Drop the results of an existing sweep of this name')
+    args = parser.parse_args()
+
+    sweep_dir = SWEEP_DIR / args.name
+    spec_path = sweep_dir / "spec.json"
+    prices_path = sweep_dir / "prices.parquet"
+    points_path = sweep_dir / "points.parquet"
+    parts_dir = sweep_dir / "parts"
+
+    if spec_path.exists() and not args.restart:
+        with open(spec_path, 'r') as f:
+            spec = json.load(f)
+        if args.param is not None and _spec(args) != spec:
+            print(f"Error: sweep {args.name} exists with other settings, resume it with --name only or use --restart")
+            print(json.dumps(spec, indent=1))
+            exit(1)
+        print(f"Resuming sweep {args.name}")
+    else:
+        if args.param is None or (args.index is None) == (args.csv is None):
+            print("Error: a new sweep needs --param and one of --index / --csv")
+            exit(1)
+        spec = _spec(args)
+        for path in parts_dir.glob("*.parquet") if parts_dir.exists() else []:
+            path.unlink()
+        timestamps, prices = load_prices(args.index, args.csv, args.column, args.last_hours, args.resample)
+        if len(timestamps) < 2:
+            print("Error: the price series has less than 2 samples")
+            exit(1)
+        points = sweep_points(parse_params(args.param, args.samples is not None), args.samples, args.seed)
+        sweep_dir.mkdir(parents=True, exist_ok=True)
+        write_table(prices_path, pa.table({'timestamp': timestamps, 'price': prices}))
+        write_table(points_path, pa.Table.from_pandas(points, preserve_index=False))
+        with open(spec_path, 'w') as f:
+            json.dump(spec, f, indent=1)
+
+    prices_table = pq.read_table(prices_path)
+    timestamps = prices_table['timestamp'].to_numpy()
+    prices = prices_table['price'].to_numpy()
+    points = pq.read_table(points_path).to_pandas()
+    chunk_size = spec['chunk_size']
+    chunks = [points.iloc[start:start + chunk_size] for start in range(0, len(points), chunk_size)]
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    part_paths = [parts_dir / f"chunk-{chunk:05d}.parquet" for chunk in range(len(chunks))]
+    pending = [chunk for chunk, path in enumerate(part_paths) if not path.exists()]
+    options = {name: spec[name] for name in ('tvl', 'donation_fraction', 'refuel_interval', 'refuel_fraction')}
+
+    print(f"{len(points)} points x {len(timestamps)} prices, {len(chunks)} chunks, {len(pending)} to run "
+          f"with {args.workers} workers")
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(timestamps, prices)) as executor:
+        futures = [executor.submit(run_chunk, chunk, chunks[chunk], part_paths[chunk], options) for chunk in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            chunk, seconds = future.result()
+            print(f"  chunk {chunk} done in {seconds:.1f}s ({done}/{len(pending)})")
+    print(f"Ran {len(pending)} chunks in {time.time() - started:.1f}s")
+
+    results = pd.concat([pq.read_table(path).to_pandas() for path in part_paths], ignore_index=True)
+    write_table(sweep_dir / "results.parquet", pa.Table.from_pandas(results, preserve_index=False))
+    print(f"Results: {sweep_dir / 'results.parquet'}")
+    print(results.describe().T[['mean', 'min', 'max']].to_string())